@@ -56,10 +56,16 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
+    # The engine is shared with the rest of the application (see db.engine)
     connectable = get_engine()
     with connectable.connect() as connection:
         context.configure(connection=connection, target_metadata=target_metadata)
         with context.begin_transaction():
+            # Data migrations may run longer than the statement timeout
+            # configured for the application. The setting is local to the
+            # migration transaction, so it does not leak into the connection
+            # pool shared with the application
+            context.execute("SET LOCAL statement_timeout = 0")
             context.run_migrations()
 
 
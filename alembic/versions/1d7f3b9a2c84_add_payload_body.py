@@ -0,0 +1,54 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+"""Add payload body
+
+Revision ID: 1d7f3b9a2c84
+Revises: e3a8b54c6f21
+Create Date: 2026-10-17 13:41:52.093318
+
+"""
+from typing import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "1d7f3b9a2c84"
+down_revision: Union[str, None] = "e3a8b54c6f21"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "payload_body",
+        sa.Column("hash", sa.String(64), primary_key=True),
+        sa.Column("response", sa.TEXT()),
+        sa.Column("response_compressed", sa.LargeBinary),
+    )
+    # The existing payloads keep their (inline) responses
+    op.add_column("payload", sa.Column("response_hash", sa.String(64)))
+    op.create_foreign_key(
+        "payload_response_hash_fkey",
+        "payload",
+        "payload_body",
+        ["response_hash"],
+        ["hash"],
+    )
+    op.create_index("ix_payload_response_hash", "payload", ["response_hash"])
+
+
+def downgrade() -> None:
+    op.execute(
+        "UPDATE payload "
+        "SET response = payload_body.response, "
+        "response_compressed = payload_body.response_compressed "
+        "FROM payload_body WHERE payload.response_hash = payload_body.hash"
+    )
+    op.drop_index("ix_payload_response_hash", table_name="payload")
+    op.drop_constraint("payload_response_hash_fkey", "payload", type_="foreignkey")
+    op.drop_column("payload", "response_hash")
+    op.drop_table("payload_body")
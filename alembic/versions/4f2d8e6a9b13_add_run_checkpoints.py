@@ -0,0 +1,46 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+"""Add run checkpoints
+
+Revision ID: 4f2d8e6a9b13
+Revises: 1d7f3b9a2c84
+Create Date: 2026-10-17 15:21:47.310592
+
+"""
+from typing import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "4f2d8e6a9b13"
+down_revision: Union[str, None] = "1d7f3b9a2c84"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "run_checkpoints",
+        sa.Column("run_id", sa.Integer, primary_key=True),
+        sa.Column("institution_identifier", sa.String(20), primary_key=True),
+        sa.Column("cpr", sa.String(10), primary_key=True),
+        sa.Column("employment_identifier", sa.String(20), primary_key=True),
+        sa.Column("from_date", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("to_date", sa.DateTime(timezone=True), nullable=False),
+        sa.Column(
+            "timestamp", sa.DateTime(timezone=True), server_default=sa.func.now()
+        ),
+    )
+    op.create_index(
+        "ix_run_checkpoints_interval",
+        "run_checkpoints",
+        ["from_date", "to_date", "institution_identifier"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("run_checkpoints")
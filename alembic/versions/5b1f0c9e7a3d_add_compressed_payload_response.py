@@ -0,0 +1,62 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+"""Add compressed payload response
+
+Revision ID: 5b1f0c9e7a3d
+Revises: 07807c92dcd2
+Create Date: 2026-10-17 10:12:41.207315
+
+"""
+from typing import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from db.compression import decompress_response
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5b1f0c9e7a3d"
+down_revision: Union[str, None] = "07807c92dcd2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+payload = sa.table(
+    "payload",
+    sa.column("id"),
+    sa.column("response", sa.Text),
+    sa.column("response_compressed", sa.LargeBinary),
+)
+
+
+def upgrade() -> None:
+    # Adding a nullable column without a default does not rewrite the table.
+    # The existing responses are compressed (in batches) by
+    # sdlon/scripts/compress_payloads.py
+    op.add_column(
+        "payload", sa.Column("response_compressed", sa.LargeBinary, nullable=True)
+    )
+
+
+def downgrade() -> None:
+    # Decompress the compressed responses before dropping the column
+    connection = op.get_bind()
+    while True:
+        rows = connection.execute(
+            sa.select(payload.c.id, payload.c.response_compressed)
+            .where(payload.c.response_compressed.is_not(None))
+            .limit(1000)
+        ).all()
+        if not rows:
+            break
+        for payload_id, response_compressed in rows:
+            connection.execute(
+                payload.update()
+                .where(payload.c.id == payload_id)
+                .values(
+                    response=decompress_response(response_compressed),
+                    response_compressed=None,
+                )
+            )
+    op.drop_column("payload", "response_compressed")
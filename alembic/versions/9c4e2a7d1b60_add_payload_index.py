@@ -0,0 +1,54 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+"""Add payload index
+
+Revision ID: 9c4e2a7d1b60
+Revises: 5b1f0c9e7a3d
+Create Date: 2026-10-17 11:03:15.882041
+
+"""
+from typing import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9c4e2a7d1b60"
+down_revision: Union[str, None] = "5b1f0c9e7a3d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The existing payloads are indexed by sdlon/scripts/index_payloads.py
+    op.create_table(
+        "payload_index",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column(
+            "payload_id",
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("payload.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("cpr", sa.String(10), nullable=False),
+        sa.Column("employment_identifier", sa.String(20)),
+        sa.Column("department_uuid", postgresql.UUID(as_uuid=True)),
+        sa.Column("timestamp", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_payload_index_payload_id", "payload_index", ["payload_id"])
+    op.create_index(
+        "ix_payload_index_cpr_timestamp", "payload_index", ["cpr", "timestamp"]
+    )
+    op.create_index(
+        "ix_payload_index_employment_identifier_timestamp",
+        "payload_index",
+        ["employment_identifier", "timestamp"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("payload_index")
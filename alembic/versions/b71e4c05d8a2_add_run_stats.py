@@ -0,0 +1,52 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+"""Add run stats
+
+Revision ID: b71e4c05d8a2
+Revises: 4f2d8e6a9b13
+Create Date: 2026-10-17 16:48:09.127735
+
+"""
+from typing import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b71e4c05d8a2"
+down_revision: Union[str, None] = "4f2d8e6a9b13"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "run_stats",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("run_id", sa.Integer, nullable=False),
+        sa.Column("institution_identifier", sa.String(20), nullable=False),
+        sa.Column("from_date", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("to_date", sa.DateTime(timezone=True)),
+        sa.Column("persons_seconds", sa.Float, nullable=False),
+        sa.Column("employments_seconds", sa.Float, nullable=False),
+        sa.Column("sd_calls", sa.JSON, nullable=False),
+        sa.Column("mo_reads", sa.Integer, nullable=False),
+        sa.Column("mo_writes", sa.Integer, nullable=False),
+        sa.Column("persons_processed", sa.Integer, nullable=False),
+        sa.Column("employments_processed", sa.Integer, nullable=False),
+        sa.Column("engagements_created", sa.Integer, nullable=False),
+        sa.Column("engagements_edited", sa.Integer, nullable=False),
+        sa.Column("engagements_terminated", sa.Integer, nullable=False),
+        sa.Column("noop_edits", sa.Integer, nullable=False),
+        sa.Column(
+            "timestamp", sa.DateTime(timezone=True), server_default=sa.func.now()
+        ),
+    )
+    op.create_index("ix_run_stats_run_id", "run_stats", ["run_id"])
+
+
+def downgrade() -> None:
+    op.drop_table("run_stats")
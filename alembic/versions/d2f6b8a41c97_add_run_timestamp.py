@@ -0,0 +1,35 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+"""Add run timestamp
+
+Revision ID: d2f6b8a41c97
+Revises: b71e4c05d8a2
+Create Date: 2026-10-17 21:12:36.481903
+
+"""
+from typing import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d2f6b8a41c97"
+down_revision: Union[str, None] = "b71e4c05d8a2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "runs",
+        sa.Column(
+            "timestamp", sa.DateTime(timezone=True), server_default=sa.func.now()
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("runs", "timestamp")
@@ -0,0 +1,152 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+"""Partition payload tables by month
+
+Revision ID: e3a8b54c6f21
+Revises: 9c4e2a7d1b60
+Create Date: 2026-10-17 12:20:04.517730
+
+"""
+from datetime import datetime
+from datetime import timezone
+from typing import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+from db.partitions import add_months
+from db.partitions import create_partitions
+from db.partitions import month_start
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e3a8b54c6f21"
+down_revision: Union[str, None] = "9c4e2a7d1b60"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PAYLOAD_INDEX_INDEXES = {
+    "ix_payload_index_payload_id": ["payload_id"],
+    "ix_payload_index_cpr_timestamp": ["cpr", "timestamp"],
+    "ix_payload_index_employment_identifier_timestamp": [
+        "employment_identifier",
+        "timestamp",
+    ],
+}
+
+PAYLOAD_COLUMNS = (
+    "id, timestamp, full_url, params, response, response_compressed, status_code"
+)
+PAYLOAD_INDEX_COLUMNS = (
+    "payload_id, cpr, employment_identifier, department_uuid, timestamp"
+)
+
+
+def _rename_tables(suffix: str) -> None:
+    # Constraint, index and sequence names must be unique, so they are
+    # renamed or dropped along with the tables
+    op.rename_table("payload", f"payload_{suffix}")
+    op.execute(
+        f"ALTER TABLE payload_{suffix} "
+        f"RENAME CONSTRAINT payload_pkey TO payload_{suffix}_pkey"
+    )
+    op.rename_table("payload_index", f"payload_index_{suffix}")
+    op.execute(
+        f"ALTER TABLE payload_index_{suffix} "
+        f"RENAME CONSTRAINT payload_index_pkey TO payload_index_{suffix}_pkey"
+    )
+    op.execute(
+        f"ALTER SEQUENCE payload_index_id_seq RENAME TO payload_index_{suffix}_id_seq"
+    )
+    for name in PAYLOAD_INDEX_INDEXES:
+        op.drop_index(name, table_name=f"payload_index_{suffix}")
+
+
+def _create_tables(partitioned: bool) -> None:
+    partition_by = (
+        {"postgresql_partition_by": "RANGE (timestamp)"} if partitioned else {}
+    )
+    op.create_table(
+        "payload",
+        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column(
+            "timestamp",
+            sa.DateTime(timezone=True),
+            nullable=not partitioned,
+            server_default=sa.text("now()"),
+        ),
+        sa.Column("full_url", sa.TEXT()),
+        sa.Column("params", sa.TEXT()),
+        sa.Column("response", sa.TEXT()),
+        sa.Column("response_compressed", sa.LargeBinary),
+        sa.Column("status_code", sa.Integer()),
+        sa.PrimaryKeyConstraint(*(["id", "timestamp"] if partitioned else ["id"])),
+        **partition_by,
+    )
+    op.create_table(
+        "payload_index",
+        sa.Column("id", sa.Integer, autoincrement=True, nullable=False),
+        sa.Column(
+            "payload_id",
+            postgresql.UUID(as_uuid=True),
+            # The partitions of both tables are dropped together instead
+            *([] if partitioned else [sa.ForeignKey("payload.id", ondelete="CASCADE")]),
+            nullable=False,
+        ),
+        sa.Column("cpr", sa.String(10), nullable=False),
+        sa.Column("employment_identifier", sa.String(20)),
+        sa.Column("department_uuid", postgresql.UUID(as_uuid=True)),
+        sa.Column("timestamp", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint(*(["id", "timestamp"] if partitioned else ["id"])),
+        **partition_by,
+    )
+    for name, columns in PAYLOAD_INDEX_INDEXES.items():
+        op.create_index(name, "payload_index", columns)
+
+
+def upgrade() -> None:
+    _rename_tables("old")
+    _create_tables(partitioned=True)
+
+    # Create the partitions of all months with payloads (and the next month)
+    connection = op.get_bind()
+    now = datetime.now(timezone.utc)
+    first, last = connection.execute(
+        sa.text("SELECT min(timestamp), max(timestamp) FROM payload_old")
+    ).one()
+    month = month_start(first or now)
+    end = add_months(month_start(max(last or now, now)), 1)
+    while month <= end:
+        create_partitions(connection, month)
+        month = add_months(month, 1)
+
+    op.execute(
+        f"INSERT INTO payload ({PAYLOAD_COLUMNS}) "
+        "SELECT id, COALESCE(timestamp, now()), full_url, params, response, "
+        "response_compressed, status_code FROM payload_old"
+    )
+    op.execute(
+        f"INSERT INTO payload_index ({PAYLOAD_INDEX_COLUMNS}) "
+        f"SELECT {PAYLOAD_INDEX_COLUMNS} FROM payload_index_old"
+    )
+    op.drop_table("payload_index_old")
+    op.drop_table("payload_old")
+
+
+def downgrade() -> None:
+    _rename_tables("partitioned")
+    _create_tables(partitioned=False)
+
+    op.execute(
+        f"INSERT INTO payload ({PAYLOAD_COLUMNS}) "
+        f"SELECT {PAYLOAD_COLUMNS} FROM payload_partitioned"
+    )
+    op.execute(
+        f"INSERT INTO payload_index ({PAYLOAD_INDEX_COLUMNS}) "
+        f"SELECT {PAYLOAD_INDEX_COLUMNS} FROM payload_index_partitioned"
+    )
+    # Dropping a partitioned table drops its partitions
+    op.drop_table("payload_index_partitioned")
+    op.drop_table("payload_partitioned")
@@ -0,0 +1,45 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+import gzip
+from io import BytesIO
+from typing import Iterable
+
+# Compression level of the SD responses. The XML responses compress well
+# already at the lowest level, which is considerably faster than the default
+COMPRESSION_LEVEL = 1
+
+
+def compress_response(response: str) -> bytes:
+    """Compress an SD response for storage in `Payload.response_compressed`."""
+    return gzip.compress(response.encode("utf-8"), compresslevel=COMPRESSION_LEVEL)
+
+
+def compress_chunks(chunks: Iterable[bytes]) -> bytes:
+    """
+    Compress an SD response given as a sequence of (UTF-8 encoded) chunks like
+    `compress_response`, without holding the uncompressed response in memory.
+    """
+    compressed = BytesIO()
+    with gzip.GzipFile(
+        fileobj=compressed, mode="wb", compresslevel=COMPRESSION_LEVEL
+    ) as gzip_file:
+        for chunk in chunks:
+            gzip_file.write(chunk)
+    return compressed.getvalue()
+
+
+def decompress_response(data: bytes) -> str:
+    """Decompress an SD response compressed by `compress_response`."""
+    return gzip.decompress(data).decode("utf-8")
+
+
+def payload_response(
+    response: str | None, response_compressed: bytes | None
+) -> str | None:
+    """
+    Get the response of a payload, which is stored either uncompressed (in
+    `Payload.response`) or compressed (in `Payload.response_compressed`).
+    """
+    if response_compressed is not None:
+        return decompress_response(response_compressed)
+    return response
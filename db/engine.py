@@ -1,5 +1,7 @@
 # SPDX-FileCopyrightText: Magenta ApS
 # SPDX-License-Identifier: MPL-2.0
+from functools import lru_cache
+
 from sqlalchemy import create_engine
 from sqlalchemy.engine import Engine
 
@@ -11,6 +13,36 @@ def get_db_url(settings: Settings) -> str:
     return f"postgresql+psycopg2://{settings.app_dbuser}:{settings.app_dbpassword.get_secret_value()}@{settings.pghost}/{settings.app_database}"  # noqa
 
 
+@lru_cache(maxsize=None)
+def _create_engine(
+    db_url: str,
+    pool_size: int,
+    max_overflow: int,
+    pool_pre_ping: bool,
+    statement_timeout: int,
+) -> Engine:
+    connect_args = {}
+    if statement_timeout > 0:
+        connect_args["options"] = f"-c statement_timeout={statement_timeout}s"
+    return create_engine(
+        db_url,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_pre_ping=pool_pre_ping,
+        connect_args=connect_args,
+    )
+
+
 def get_engine() -> Engine:
+    """
+    Get the process wide engine for the SD payload DB. It is created on first
+    use and its connection pool is shared by all users of the DB.
+    """
     settings = get_settings()
-    return create_engine(get_db_url(settings))
+    return _create_engine(
+        get_db_url(settings),
+        settings.app_db_pool_size,
+        settings.app_db_max_overflow,
+        settings.app_db_pool_pre_ping,
+        settings.app_db_statement_timeout,
+    )
@@ -1,27 +1,105 @@
 # SPDX-FileCopyrightText: Magenta ApS
 # SPDX-License-Identifier: MPL-2.0
+from sqlalchemy import JSON
 from sqlalchemy import Column
 from sqlalchemy import DateTime
+from sqlalchemy import Float
+from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
+from sqlalchemy import LargeBinary
 from sqlalchemy import String
 from sqlalchemy.dialects.postgresql import TEXT
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
+from db.compression import payload_response
+
 Base = declarative_base()
 
 
 class Payload(Base):  # type: ignore
+    # Partitioned by month (see db.partitions), which requires the timestamp
+    # to be part of the primary key
     __tablename__ = "payload"
+    __table_args__ = {"postgresql_partition_by": "RANGE (timestamp)"}
 
     id = Column(UUID(as_uuid=True), primary_key=True)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(
+        DateTime(timezone=True),
+        primary_key=True,
+        nullable=False,
+        server_default=func.now(),
+    )
     full_url = Column(TEXT)
     params = Column(TEXT)
+    # The response is stored (deduplicated) in the payload body referenced by
+    # response_hash (see db.payload_body). The response and
+    # response_compressed columns are only set for the payloads persisted
+    # before the deduplication
     response = Column(TEXT)
+    # The gzip compressed response (see db.compression). Only one of response
+    # and response_compressed is set
+    response_compressed = Column(LargeBinary)
+    response_hash = Column(String(64), ForeignKey("payload_body.hash"), index=True)
     status_code = Column(Integer)
 
+    body = relationship("PayloadBody", lazy="joined")
+
+    @property
+    def response_text(self) -> str | None:
+        """The response, decompressed if it is stored compressed."""
+        if self.body is not None:
+            return self.body.response_text
+        return payload_response(self.response, self.response_compressed)
+
+
+class PayloadBody(Base):  # type: ignore
+    __tablename__ = "payload_body"
+
+    # The SHA-256 hash (hex digest) of the response
+    hash = Column(String(64), primary_key=True)
+    response = Column(TEXT)
+    # Only one of response and response_compressed is set (see Payload)
+    response_compressed = Column(LargeBinary)
+
+    @property
+    def response_text(self) -> str | None:
+        """The response, decompressed if it is stored compressed."""
+        return payload_response(self.response, self.response_compressed)
+
+
+class PayloadIndex(Base):  # type: ignore
+    """
+    The persons and employments contained in each payload (see
+    db.payload_index), for looking up the payload history of a person or an
+    employment without searching through the responses.
+
+    Partitioned by month like the payloads, so the timestamp is the timestamp
+    of the payload. There is no foreign key to the payloads, as the partitions
+    of both tables are dropped together when pruning (see db.partitions).
+    """
+
+    __tablename__ = "payload_index"
+    __table_args__ = (
+        Index("ix_payload_index_cpr_timestamp", "cpr", "timestamp"),
+        Index(
+            "ix_payload_index_employment_identifier_timestamp",
+            "employment_identifier",
+            "timestamp",
+        ),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    payload_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    cpr = Column(String(10), nullable=False)
+    employment_identifier = Column(String(20))
+    department_uuid = Column(UUID(as_uuid=True))
+    timestamp = Column(DateTime(timezone=True), primary_key=True, nullable=False)
+
 
 class Runs(Base):  # type: ignore
     __tablename__ = "runs"
@@ -30,3 +108,68 @@ class Runs(Base):  # type: ignore
     from_date = Column("from_date", DateTime(timezone=True))
     to_date = Column("to_date", DateTime(timezone=True))
     status = Column("status", String(60))
+    # When the status was persisted, i.e. when the run of the interval started
+    # (RUNNING) or ended (COMPLETED)
+    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class RunCheckpoint(Base):  # type: ignore
+    """
+    The SD employments updated in MO in a day interval of a changed-at run, so
+    a restarted run of the interval (e.g. after /rundb/delete-last-run) can
+    skip the persons already updated. The restarted run resumes the interval
+    with the to_date of its checkpoints (see db.queries.get_resume_to_date).
+    The checkpoints of an interval (and of the earlier ones) are deleted when
+    it is completed.
+
+    There is no foreign key to the runs, as the checkpoints must outlive the
+    deletion of the run which recorded them.
+    """
+
+    __tablename__ = "run_checkpoints"
+    __table_args__ = (
+        Index(
+            "ix_run_checkpoints_interval",
+            "from_date",
+            "to_date",
+            "institution_identifier",
+        ),
+    )
+
+    run_id = Column(Integer, primary_key=True)
+    institution_identifier = Column(String(20), primary_key=True)
+    cpr = Column(String(10), primary_key=True)
+    employment_identifier = Column(String(20), primary_key=True)
+    from_date = Column(DateTime(timezone=True), nullable=False)
+    to_date = Column(DateTime(timezone=True), nullable=False)
+    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class RunStatistics(Base):  # type: ignore
+    """
+    The statistics of the updates made for an institution in the run of a day
+    interval (see sdlon.run_stats.RunStats).
+    """
+
+    __tablename__ = "run_stats"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(Integer, nullable=False, index=True)
+    institution_identifier = Column(String(20), nullable=False)
+    from_date = Column(DateTime(timezone=True), nullable=False)
+    to_date = Column(DateTime(timezone=True))
+    # Wall time (in seconds) of the updates of the persons and employments
+    persons_seconds = Column(Float, nullable=False)
+    employments_seconds = Column(Float, nullable=False)
+    # The number of SD calls per endpoint
+    sd_calls = Column(JSON, nullable=False)
+    mo_reads = Column(Integer, nullable=False)
+    mo_writes = Column(Integer, nullable=False)
+    persons_processed = Column(Integer, nullable=False)
+    employments_processed = Column(Integer, nullable=False)
+    engagements_created = Column(Integer, nullable=False)
+    engagements_edited = Column(Integer, nullable=False)
+    engagements_terminated = Column(Integer, nullable=False)
+    # Engagement edits not resulting in any writes to MO
+    noop_edits = Column(Integer, nullable=False)
+    timestamp = Column(DateTime(timezone=True), server_default=func.now())
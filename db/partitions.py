@@ -0,0 +1,133 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+"""
+Monthly partitions of the payload tables.
+
+The payload and payload_index tables are partitioned by month on their
+timestamp (native Postgres range partitioning). A partition is created when
+the first payload of the month is written (see `ensure_partitions`), and old
+payloads are pruned by dropping whole partitions (see `prune_partitions`).
+"""
+
+import re
+import threading
+from datetime import date
+from datetime import datetime
+from datetime import timezone
+from typing import List
+from typing import Set
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.engine import Engine
+from structlog import get_logger
+
+logger = get_logger()
+
+PARTITIONED_TABLES = ("payload", "payload_index")
+
+_ensured_months: Set[date] = set()
+_ensured_months_lock = threading.Lock()
+
+
+def month_start(timestamp: datetime) -> date:
+    """The first day of the (UTC) month of the timestamp."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return date(timestamp.year, timestamp.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def create_partitions(connection: Connection, month: date) -> None:
+    """Create the partitions of the month, unless they already exist."""
+    for table in PARTITIONED_TABLES:
+        connection.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} "
+                f"PARTITION OF {table} FOR VALUES "
+                f"FROM ('{month.isoformat()} 00:00:00+00') "
+                f"TO ('{add_months(month, 1).isoformat()} 00:00:00+00')"
+            )
+        )
+
+
+def ensure_partitions(engine: Engine, timestamp: datetime) -> None:
+    """
+    Make sure the partitions for payloads with the timestamp exist. The
+    partitions are only created once per month and process.
+
+    The partitions are created in a transaction of their own, which is
+    committed before the month is remembered, so a rollback of the
+    transaction writing the payloads cannot undo the creation.
+    """
+    month = month_start(timestamp)
+    with _ensured_months_lock:
+        if month in _ensured_months:
+            return
+        with engine.begin() as connection:
+            create_partitions(connection, month)
+        _ensured_months.add(month)
+
+
+def get_partition_months(connection: Connection, table: str) -> List[date]:
+    """The months of the (monthly) partitions of the table, in order."""
+    result = connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :table"
+        ),
+        {"table": table},
+    )
+    pattern = re.compile(rf"^{table}_(\d{{4}})_(\d{{2}})$")
+    months = []
+    for (name,) in result:
+        match = pattern.match(name)
+        if match is not None:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def prune_partitions(
+    connection: Connection, retention_months: int, today: date | None = None
+) -> List[str]:
+    """
+    Drop the partitions of the months which are entirely older than the
+    retention period, and create the partitions of the current and the next
+    month ahead of time. The payload bodies only referenced by the dropped
+    payloads are deleted afterwards (see db.queries.prune_payloads).
+
+    Args:
+        connection: connection to the payload DB
+        retention_months: the number of months to keep (besides the current)
+        today: the current date (defaults to today)
+
+    Returns:
+        The names of the dropped partitions
+    """
+    today = today or datetime.now(timezone.utc).date()
+    current_month = date(today.year, today.month, 1)
+    cutoff = add_months(current_month, -retention_months)
+
+    dropped = []
+    for table in PARTITIONED_TABLES:
+        for month in get_partition_months(connection, table):
+            if month >= cutoff:
+                continue
+            name = partition_name(table, month)
+            connection.execute(text(f"DROP TABLE {name}"))
+            logger.info("Dropped payload partition", partition=name)
+            dropped.append(name)
+
+    for month in (current_month, add_months(current_month, 1)):
+        create_partitions(connection, month)
+    return dropped
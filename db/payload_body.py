@@ -0,0 +1,175 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+"""
+Deduplicated storage of the payload responses.
+
+Many SD responses are identical (e.g. the responses of the department and
+institution lookups), so the responses are stored once in the payload_body
+table, keyed by their SHA-256 hash, which the payloads reference.
+
+The root element of an SD response has a creationDateTime attribute, which
+would make otherwise identical responses differ, so it is removed before the
+response is hashed and stored. The time a response was received is the
+timestamp of its payload.
+"""
+
+import hashlib
+import re
+from typing import IO
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import Union
+
+from sqlalchemy import func
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import Insert
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import Select
+from structlog import get_logger
+
+from db.compression import compress_chunks
+from db.compression import compress_response
+from db.models import Payload
+from db.models import PayloadBody
+
+logger = get_logger()
+
+# Size of the chunks read from a response file
+CHUNK_SIZE = 64 * 1024
+
+# Key of the advisory lock taken by `lock_payload_bodies`
+PAYLOAD_BODY_LOCK_KEY = 4_242_016
+
+# The creationDateTime attribute of the root element, i.e. of the first start
+# tag after the (optional) XML declaration
+_CREATION_DATE_TIME = (
+    r'^(\s*(?:<\?.*?\?>\s*)?<[^\s>]+[^>]*?)\s+creationDateTime="[^"]*"'
+)
+_CREATION_DATE_TIME_TEXT = re.compile(_CREATION_DATE_TIME, re.DOTALL)
+_CREATION_DATE_TIME_BYTES = re.compile(_CREATION_DATE_TIME.encode(), re.DOTALL)
+
+
+def normalise_response(response: str) -> str:
+    """The response without the creationDateTime of its root element."""
+    return _CREATION_DATE_TIME_TEXT.sub(r"\1", response, count=1)
+
+
+def response_hash(response: str) -> str:
+    """The SHA-256 hash (hex digest) of the normalised response."""
+    return hashlib.sha256(normalise_response(response).encode("utf-8")).hexdigest()
+
+
+def _normalised_chunks(response_file: IO[bytes]) -> Iterator[bytes]:
+    response_file.seek(0)
+    # The root element is at the start of the first chunk
+    first_chunk = response_file.read(CHUNK_SIZE)
+    yield _CREATION_DATE_TIME_BYTES.sub(rb"\1", first_chunk, count=1)
+    yield from iter(lambda: response_file.read(CHUNK_SIZE), b"")
+
+
+def payload_body_row(
+    response: Union[str, IO[bytes]], compress: bool = False
+) -> Dict[str, Any]:
+    """
+    The `PayloadBody` row of a response, compressed if `compress` is set.
+
+    A response stored in a (binary) file is hashed and compressed without
+    reading it into memory, so it is always compressed, as storing it
+    uncompressed would require the whole response in memory.
+    """
+    if not isinstance(response, str):
+        sha256 = hashlib.sha256()
+
+        def hashed(chunks: Iterator[bytes]) -> Iterator[bytes]:
+            for chunk in chunks:
+                sha256.update(chunk)
+                yield chunk
+
+        compressed = compress_chunks(hashed(_normalised_chunks(response)))
+        return {
+            "hash": sha256.hexdigest(),
+            "response": None,
+            "response_compressed": compressed,
+        }
+    response = normalise_response(response)
+    return {
+        "hash": hashlib.sha256(response.encode("utf-8")).hexdigest(),
+        "response": None if compress else response,
+        "response_compressed": compress_response(response) if compress else None,
+    }
+
+
+def lock_payload_bodies(connection: Connection, exclusive: bool = False) -> None:
+    """
+    Take the (transaction level) advisory lock which keeps the unreferenced
+    payload bodies from being deleted (see `delete_unreferenced_payload_bodies`)
+    while a payload referencing an existing body is written. Writers take the
+    lock shared, so they do not block each other.
+    """
+    function = "pg_advisory_xact_lock" if exclusive else "pg_advisory_xact_lock_shared"
+    connection.execute(text(f"SELECT {function}(:key)"), {"key": PAYLOAD_BODY_LOCK_KEY})
+
+
+def delete_unreferenced_payload_bodies(engine: Engine, batch_size: int = 1000) -> int:
+    """
+    Delete the payload bodies which are no longer referenced by any payload,
+    e.g. after the payload partitions have been dropped.
+
+    The bodies are checked in batches of `batch_size` (in hash order), each in
+    its own short transaction holding the payload body lock exclusively, so
+    the payload writers are only held back for a batch at a time.
+
+    Returns:
+        The number of deleted payload bodies
+    """
+    deleted = 0
+    last_hash = ""
+    while True:
+        with engine.begin() as connection:
+            lock_payload_bodies(connection, exclusive=True)
+            batch_last_hash, batch_deleted = connection.execute(
+                text(
+                    "WITH batch AS ("
+                    "SELECT hash FROM payload_body WHERE hash > :last_hash "
+                    "ORDER BY hash LIMIT :batch_size"
+                    "), deleted AS ("
+                    "DELETE FROM payload_body USING batch "
+                    "WHERE payload_body.hash = batch.hash AND NOT EXISTS ("
+                    "SELECT 1 FROM payload "
+                    "WHERE payload.response_hash = payload_body.hash"
+                    ") RETURNING payload_body.hash"
+                    ") "
+                    "SELECT (SELECT max(hash) FROM batch), "
+                    "(SELECT count(*) FROM deleted)"
+                ),
+                {"last_hash": last_hash, "batch_size": batch_size},
+            ).one()
+        if batch_last_hash is None:
+            break
+        deleted += batch_deleted
+        last_hash = batch_last_hash
+    logger.info("Deleted unreferenced payload bodies", count=deleted)
+    return deleted
+
+
+def insert_payload_bodies() -> Insert:
+    """Insert statement for payload bodies, skipping the existing bodies."""
+    return insert(PayloadBody).on_conflict_do_nothing(index_elements=[PayloadBody.hash])
+
+
+# The (possibly compressed) response of a payload, whether it is stored in the
+# payload itself (the payloads persisted before the deduplication) or in the
+# payload body. Select from `join_payload_body`
+payload_response_column = func.coalesce(Payload.response, PayloadBody.response).label(
+    "response"
+)
+payload_response_compressed_column = func.coalesce(
+    Payload.response_compressed, PayloadBody.response_compressed
+).label("response_compressed")
+
+
+def join_payload_body(stmt: Select) -> Select:
+    return stmt.outerjoin(PayloadBody, PayloadBody.hash == Payload.response_hash)
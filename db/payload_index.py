@@ -0,0 +1,96 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+from datetime import datetime
+from io import BytesIO
+from typing import IO
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Union
+from uuid import UUID
+
+from lxml import etree
+
+
+class IndexEntry(NamedTuple):
+    cpr: str
+    employment_identifier: Optional[str]
+    department_uuid: Optional[UUID]
+
+
+def _text(elem: Any, path: str) -> Optional[str]:
+    text = elem.findtext(path)
+    if text is None or not text.strip():
+        return None
+    return text.strip()
+
+
+def _uuid(text: Optional[str]) -> Optional[UUID]:
+    try:
+        return UUID(text) if text is not None else None
+    except ValueError:
+        return None
+
+
+def extract_index_entries(response: Union[str, IO[bytes]]) -> List[IndexEntry]:
+    """
+    Extract the persons, employments and departments contained in an SD
+    response, i.e. one entry per (CPR, EmploymentIdentifier, department UUID)
+    in the response. Persons without employments get a single entry without
+    employment and department.
+
+    Args:
+        response: the raw XML response from SD, or a (binary) file with it
+
+    Returns:
+        The distinct entries in the order of the response. Responses without
+        persons (and responses which are not valid XML) have no entries.
+    """
+    entries: Dict[IndexEntry, None] = {}
+    if isinstance(response, str):
+        response_file: IO[bytes] = BytesIO(response.encode("utf-8"))
+    else:
+        response_file = response
+        response_file.seek(0)
+    try:
+        # Parse incrementally and discard each person after use to keep the
+        # memory usage low for the (large) changed-at responses
+        for _, person in etree.iterparse(response_file, events=("end",), tag="Person"):
+            cpr = _text(person, "PersonCivilRegistrationIdentifier")
+            if cpr is None:
+                continue
+            employments = person.findall("Employment")
+            if not employments:
+                entries[IndexEntry(cpr, None, None)] = None
+            for employment in employments:
+                employment_identifier = _text(employment, "EmploymentIdentifier")
+                department_uuids = [
+                    _uuid(_text(department, "DepartmentUUIDIdentifier"))
+                    for department in employment.findall("EmploymentDepartment")
+                ] or [None]
+                for department_uuid in department_uuids:
+                    entries[IndexEntry(cpr, employment_identifier, department_uuid)] = (
+                        None
+                    )
+            person.clear()
+    except etree.XMLSyntaxError:
+        return []
+    return list(entries)
+
+
+def payload_index_rows(
+    payload_id: UUID, response: Union[str, IO[bytes]], timestamp: datetime
+) -> List[Dict[str, Any]]:
+    """The `PayloadIndex` rows of a payload (see `extract_index_entries`)."""
+    return [
+        {
+            "payload_id": payload_id,
+            "cpr": entry.cpr,
+            "employment_identifier": entry.employment_identifier,
+            "department_uuid": entry.department_uuid,
+            "timestamp": timestamp,
+        }
+        for entry in extract_index_entries(response)
+    ]
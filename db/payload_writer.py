@@ -0,0 +1,245 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+import atexit
+import queue
+import threading
+from datetime import datetime
+from datetime import timezone
+from functools import lru_cache
+from typing import IO
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+from uuid import UUID
+
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+from structlog import get_logger
+
+from db.engine import get_engine
+from db.models import Payload
+from db.models import PayloadIndex
+from db.partitions import ensure_partitions
+from db.payload_body import insert_payload_bodies
+from db.payload_body import lock_payload_bodies
+from db.payload_body import payload_body_row
+from db.payload_index import payload_index_rows
+from sdlon.config import Settings
+from sdlon.metrics import sd_payload_queue_depth
+from sdlon.metrics import sd_payload_rows_dropped
+from sdlon.metrics import sd_payload_rows_written
+
+logger = get_logger()
+
+# Put on the queue to stop the writer thread
+_STOP = None
+
+
+class PayloadWriter:
+    """
+    Persist SD payloads to the payload database in a background thread, so
+    that the SD calls do not have to wait for the database.
+
+    The payloads are put on a bounded queue and written in batches (using
+    multi-row inserts on a single, long-lived engine) of up to `batch_size`
+    payloads, i.e. as many as have been queued while the previous batch was
+    written. The payload bodies (see db.payload_body) and payload index rows
+    (see db.payload_index) of the payloads are written in the same
+    transaction. If the queue is full, the payload is dropped rather than
+    blocking the SD call. The queue is flushed when the writer is closed,
+    which happens at the latest when the process exits.
+    """
+
+    def __init__(self, engine: Engine, queue_size: int, batch_size: int):
+        self._engine = engine
+        self._batch_size = batch_size
+        self._queue: queue.Queue[Optional[Dict[str, Any]]] = queue.Queue(
+            maxsize=queue_size
+        )
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="sd-payload-writer", daemon=True
+        )
+        self._thread.start()
+
+    def put(
+        self,
+        request_uuid: UUID,
+        full_url: str,
+        params: str,
+        response: Union[str, IO[bytes]],
+        status_code: int,
+        compress: bool = False,
+    ) -> bool:
+        """
+        Queue a payload for persistence (see `db.queries.log_payload` for the
+        arguments). The response is compressed in the writer thread, except
+        for a response in a file, which is hashed, compressed and indexed
+        before it is queued, as the file is not kept open.
+
+        Returns:
+            True if the payload was queued and False if it was dropped
+        """
+        timestamp = datetime.now(timezone.utc)
+        row: Dict[str, Any] = {
+            "id": request_uuid,
+            "timestamp": timestamp,
+            "full_url": full_url,
+            "params": params,
+            "response": response,
+            "status_code": status_code,
+            "compress": compress,
+        }
+        if not isinstance(response, str):
+            row["body"] = payload_body_row(response, compress)
+            row["index_rows"] = payload_index_rows(request_uuid, response, timestamp)
+            del row["response"]
+        with self._lock:
+            if self._closed:
+                return self._drop("closed")
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                return self._drop("queue_full")
+        sd_payload_queue_depth.set(self._queue.qsize())
+        return True
+
+    def flush(self) -> None:
+        """Wait until all queued payloads have been written (or dropped)."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Write the queued payloads and stop the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        # The writer thread empties the queue, so this eventually succeeds
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _drop(self, reason: str) -> bool:
+        logger.warning("Dropping SD payload", reason=reason)
+        sd_payload_rows_dropped.labels(reason).inc()
+        return False
+
+    def _next_batch(self) -> List[Optional[Dict[str, Any]]]:
+        batch = [self._queue.get()]
+        while batch[-1] is not _STOP and len(batch) < self._batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _to_db_rows(
+        row: Dict[str, Any],
+    ) -> Tuple[Dict[str, Any], Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        The payload row, the payload body row and the payload index rows of a
+        queued payload.
+        """
+        row = dict(row)
+        compress = row.pop("compress")
+        if "body" in row:
+            body = row.pop("body")
+            index_rows = row.pop("index_rows")
+        else:
+            response = row.pop("response")
+            body = payload_body_row(response, compress)
+            index_rows = payload_index_rows(row["id"], response, row["timestamp"])
+        row["response_hash"] = body["hash"]
+        return row, body, index_rows
+
+    def _write_batch(self, rows: List[Dict[str, Any]]) -> None:
+        payload_rows = []
+        index_rows = []
+        # Identical responses are only written once. The bodies are inserted in
+        # hash order to avoid deadlocks between writers
+        body_rows = {}
+        for row in rows:
+            payload_row, body_row, payload_index = self._to_db_rows(row)
+            payload_rows.append(payload_row)
+            body_rows[body_row["hash"]] = body_row
+            index_rows.extend(payload_index)
+        for row in payload_rows:
+            ensure_partitions(self._engine, row["timestamp"])
+        with self._engine.begin() as connection:
+            lock_payload_bodies(connection)
+            connection.execute(
+                insert_payload_bodies(),
+                [body_rows[key] for key in sorted(body_rows)],
+            )
+            connection.execute(insert(Payload), payload_rows)
+            if index_rows:
+                connection.execute(insert(PayloadIndex), index_rows)
+        sd_payload_rows_written.inc(len(rows))
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Write a batch of payloads. If the batch cannot be written, e.g. due to
+        a single bad payload, the payloads are written one at a time, so only
+        the failing payloads are dropped.
+        """
+        try:
+            self._write_batch(rows)
+            return
+        except Exception:
+            if len(rows) == 1:
+                logger.exception(
+                    "could not save SD response to payload database",
+                    payload_id=rows[0]["id"],
+                )
+                sd_payload_rows_dropped.labels("error").inc()
+                return
+            logger.warning(
+                "could not save SD responses to payload database, "
+                "retrying one at a time",
+                n=len(rows),
+            )
+        for row in rows:
+            self._write([row])
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            rows = [row for row in batch if row is not _STOP]
+            if rows:
+                self._write(rows)
+            for _ in batch:
+                self._queue.task_done()
+            sd_payload_queue_depth.set(self._queue.qsize())
+            if batch[-1] is _STOP:
+                return
+
+
+@lru_cache(maxsize=None)
+def _create_payload_writer(queue_size: int, batch_size: int) -> PayloadWriter:
+    writer = PayloadWriter(get_engine(), queue_size, batch_size)
+    atexit.register(writer.close)
+    return writer
+
+
+def get_payload_writer(settings: Settings) -> PayloadWriter | None:
+    """
+    Get the process wide background payload writer.
+
+    Args:
+        settings: the application settings
+
+    Returns:
+        The payload writer or None if the payloads should not be persisted
+        or should be persisted synchronously
+    """
+    if not (
+        settings.sd_persist_payloads and settings.sd_persist_payloads_in_background
+    ):
+        return None
+    return _create_payload_writer(
+        settings.sd_payload_queue_size, settings.sd_payload_batch_size
+    )
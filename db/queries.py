@@ -1,17 +1,37 @@
 # SPDX-FileCopyrightText: Magenta ApS
 # SPDX-License-Identifier: MPL-2.0
 from datetime import datetime
+from datetime import timezone
+from typing import IO
+from typing import Any
+from typing import Iterable
+from typing import NamedTuple
+from typing import Optional
+from typing import Union
 from uuid import UUID
 
 from sqlalchemy import delete
 from sqlalchemy import desc
+from sqlalchemy import func
 from sqlalchemy import select
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.orm import aliased
 from sqlalchemy.orm import sessionmaker
 from structlog import get_logger
 
 from db.engine import get_engine
 from db.models import Payload
+from db.models import PayloadIndex
+from db.models import RunCheckpoint
 from db.models import Runs
+from db.models import RunStatistics
+from db.partitions import ensure_partitions
+from db.partitions import prune_partitions
+from db.payload_body import delete_unreferenced_payload_bodies
+from db.payload_body import insert_payload_bodies
+from db.payload_body import lock_payload_bodies
+from db.payload_body import payload_body_row
+from db.payload_index import payload_index_rows
 from sdlon.metrics import RunDBState
 
 logger = get_logger()
@@ -19,12 +39,17 @@ logger = get_logger()
 Session = sessionmaker()
 
 
+def _get_session() -> OrmSession:
+    return Session(bind=get_engine())
+
+
 def log_payload(
     request_uuid: UUID,
     full_url: str,
     params: str,
-    response: str,
+    response: Union[str, IO[bytes]],
     status_code: int,
+    compress: bool = False,
 ) -> None:
     """Log a given SD payload to the payload database
 
@@ -32,26 +57,43 @@ def log_payload(
         request_uuid: Unique UUID of this API request. Must be generated by the caller.
         full_url: Full URL of API endpoint called, e.g. containing the SD server name.
         params: Stringified version of the `payload` variable in `sd_lookup`.
-        response: The raw/unparsed XML response from the SD API endpoint called.
+        response: The raw/unparsed XML response from the SD API endpoint called,
+            or a (binary) file with it, which is always stored compressed
+            (see db.payload_body).
         status_code: The HTTP status code from the SD API endpoint called.
+        compress: Store the response compressed (see db.compression).
+
+    The response is stored once per distinct response (see db.payload_body),
+    and the persons and employments in the response are added to the payload
+    index (see db.payload_index).
     """
-    Session.configure(bind=get_engine())
-    session = Session()
-    payload = Payload(
-        id=request_uuid,
-        full_url=full_url,
-        params=params,
-        response=response,
-        status_code=status_code,
-    )
-    session.add(payload)
-    session.commit()
+    timestamp = datetime.now(timezone.utc)
+    body = payload_body_row(response, compress)
+    ensure_partitions(get_engine(), timestamp)
+    # The session is closed (and rolled back, if the insert fails) on exit,
+    # which releases the payload body lock and the connection
+    with _get_session() as session:
+        lock_payload_bodies(session.connection())
+        session.execute(insert_payload_bodies().values(**body))
+        payload = Payload(
+            id=request_uuid,
+            timestamp=timestamp,
+            full_url=full_url,
+            params=params,
+            response_hash=body["hash"],
+            status_code=status_code,
+        )
+        session.add(payload)
+        session.add_all(
+            PayloadIndex(**row)
+            for row in payload_index_rows(request_uuid, response, timestamp)
+        )
+        session.commit()
 
 
 def get_status() -> RunDBState:
     try:
-        Session.configure(bind=get_engine())
-        with Session() as session:
+        with _get_session() as session:
             statement = select(Runs.status).order_by(desc(Runs.id)).limit(1)
             status = session.execute(statement).scalar_one_or_none()
 
@@ -68,26 +110,268 @@ def get_status() -> RunDBState:
         return RunDBState.UNKNOWN
 
 
-def persist_status(from_date: datetime, to_date: datetime, status: RunDBState) -> None:
-    Session.configure(bind=get_engine())
-    with Session() as session:
+def persist_status(from_date: datetime, to_date: datetime, status: RunDBState) -> int:
+    """
+    Persist the status of the run of the interval and return the run id. When
+    the interval is completed, the run checkpoints of the interval are deleted
+    along with any stale checkpoints of earlier intervals.
+    """
+    with _get_session() as session:
         run = Runs(from_date=from_date, to_date=to_date, status=status.value)
         session.add(run)
+        if status == RunDBState.COMPLETED:
+            session.execute(
+                delete(RunCheckpoint).where(RunCheckpoint.from_date < to_date)
+            )
         session.commit()
+        return run.id
 
 
 def get_run_db_from_date() -> datetime:
-    Session.configure(bind=get_engine())
-    with Session() as session:
+    with _get_session() as session:
         # Note: we use the last to_date as the new from_date
         statement = select(Runs.to_date).order_by(desc(Runs.id)).limit(1)
         from_date = session.execute(statement).scalar_one_or_none()
         return from_date
 
 
+class CompletedRun(NamedTuple):
+    from_date: datetime
+    to_date: datetime
+    # The period in which the run was executed, i.e. in which its payloads
+    # were persisted. None for the runs persisted before the runs were
+    # timestamped
+    started: Optional[datetime]
+    finished: Optional[datetime]
+
+
+def get_completed_runs(from_date: datetime, to_date: datetime) -> list[CompletedRun]:
+    """
+    The completed runs ending in the period.
+
+    A run is started when the RUNNING status of its interval is persisted, but
+    the SD change feeds of an interval may be prefetched while the previous
+    interval is running (see the sd_prefetch_intervals setting), so the start
+    of the previous interval is taken as the start of the run when known.
+    """
+    running = aliased(Runs)
+
+    def started(interval_to_date: Any) -> Any:
+        return (
+            select(func.max(running.timestamp))
+            .where(
+                running.status == RunDBState.RUNNING.value,
+                running.to_date == interval_to_date,
+                running.id < Runs.id,
+            )
+            .scalar_subquery()
+        )
+
+    with _get_session() as session:
+        statement = (
+            select(
+                Runs.from_date,
+                Runs.to_date,
+                # The previous interval ends where the interval starts
+                started(Runs.from_date),
+                started(Runs.to_date),
+                Runs.timestamp,
+            )
+            .where(
+                Runs.status == RunDBState.COMPLETED.value,
+                Runs.to_date >= from_date,
+                Runs.to_date < to_date,
+            )
+            .order_by(Runs.id)
+        )
+        return [
+            CompletedRun(
+                run_from,
+                run_to,
+                previous_started or run_started,
+                finished,
+            )
+            for run_from, run_to, previous_started, run_started, finished in (
+                session.execute(statement)
+            )
+        ]
+
+
+def persist_checkpoint(
+    run_id: int,
+    from_date: datetime,
+    to_date: datetime,
+    institution_identifier: str,
+    cpr: str,
+    employment_identifiers: Iterable[str],
+) -> None:
+    """
+    Record that the employments of the person have been updated in MO in the
+    run of the interval (see db.models.RunCheckpoint).
+    """
+    with _get_session() as session:
+        for employment_identifier in employment_identifiers:
+            session.merge(
+                RunCheckpoint(
+                    run_id=run_id,
+                    institution_identifier=institution_identifier,
+                    cpr=cpr,
+                    employment_identifier=employment_identifier,
+                    from_date=from_date,
+                    to_date=to_date,
+                )
+            )
+        session.commit()
+
+
+def get_checkpoints(
+    from_date: datetime, institution_identifier: str
+) -> dict[tuple[str, str], datetime]:
+    """
+    The (CPR, EmploymentIdentifier) of the employments updated in MO by the
+    (earlier) runs of the interval starting at from_date, mapped to the end of
+    the interval they were updated in. The end is the latest one, if the
+    employment was updated by several runs.
+    """
+    with _get_session() as session:
+        statement = (
+            select(
+                RunCheckpoint.cpr,
+                RunCheckpoint.employment_identifier,
+                func.max(RunCheckpoint.to_date),
+            )
+            .where(
+                RunCheckpoint.from_date == from_date,
+                RunCheckpoint.institution_identifier == institution_identifier,
+            )
+            .group_by(RunCheckpoint.cpr, RunCheckpoint.employment_identifier)
+        )
+        return {
+            (cpr, identifier): to_date
+            for cpr, identifier, to_date in session.execute(statement)
+        }
+
+
+def get_resume_to_date(from_date: datetime) -> Optional[datetime]:
+    """
+    The end of the interval starting at from_date of an interrupted run, i.e.
+    the latest end of the checkpoints of the interval, if any.
+    """
+    with _get_session() as session:
+        statement = select(func.max(RunCheckpoint.to_date)).where(
+            RunCheckpoint.from_date == from_date
+        )
+        return session.execute(statement).scalar_one_or_none()
+
+
+def persist_run_stats(
+    run_id: int,
+    institution_identifier: str,
+    from_date: datetime,
+    to_date: datetime | None,
+    stats: dict[str, Any],
+) -> None:
+    """
+    Persist the statistics of the updates of the institution in the run (see
+    sdlon.run_stats.RunStats.as_dict).
+    """
+    with _get_session() as session:
+        session.add(
+            RunStatistics(
+                run_id=run_id,
+                institution_identifier=institution_identifier,
+                from_date=from_date,
+                to_date=to_date,
+                **stats,
+            )
+        )
+        session.commit()
+
+
+def _get_run_rows(
+    session: OrmSession, run_id: int
+) -> tuple[Optional[Runs], Optional[Runs]]:
+    """
+    The RUNNING and the COMPLETED row of the run of an interval, given the id
+    of either of them. The statistics of the run are persisted with the id of
+    the RUNNING row (see sdlon.sd_changed_at), while the last run id in the
+    RunDB is the id of the COMPLETED row.
+    """
+    run = session.get(Runs, run_id)
+    if run is None:
+        return None, None
+    same_interval = (
+        Runs.from_date == run.from_date,
+        Runs.to_date == run.to_date,
+    )
+    if run.status == RunDBState.COMPLETED.value:
+        running = session.execute(
+            select(Runs)
+            .where(
+                Runs.status == RunDBState.RUNNING.value,
+                Runs.id < run.id,
+                *same_interval,
+            )
+            .order_by(desc(Runs.id))
+            .limit(1)
+        ).scalar_one_or_none()
+        return running, run
+    completed = session.execute(
+        select(Runs)
+        .where(
+            Runs.status == RunDBState.COMPLETED.value, Runs.id > run.id, *same_interval
+        )
+        .order_by(Runs.id)
+        .limit(1)
+    ).scalar_one_or_none()
+    return run, completed
+
+
+def get_run_stats(run_id: int) -> list[dict[str, Any]]:
+    """
+    The statistics of each of the institutions updated in the run, given the
+    id of its RUNNING or COMPLETED row.
+    """
+    with _get_session() as session:
+        running, _ = _get_run_rows(session, run_id)
+        statement = (
+            select(RunStatistics)
+            .where(
+                RunStatistics.run_id == (running.id if running is not None else run_id)
+            )
+            .order_by(RunStatistics.id)
+        )
+        return [
+            {
+                column.name: getattr(run_stats, column.name)
+                for column in RunStatistics.__table__.columns
+                if column.name != "id"
+            }
+            for run_stats in session.execute(statement).scalars()
+        ]
+
+
+def get_run_elapsed_seconds(run_id: int) -> Optional[float]:
+    """
+    The elapsed (wall) time of the run, given the id of its RUNNING or
+    COMPLETED row, i.e. the time from it was started until it was completed
+    (or until now, if it is still running). None if the times are unknown.
+    """
+    with _get_session() as session:
+        running, completed = _get_run_rows(session, run_id)
+        if running is None or running.timestamp is None:
+            return None
+        if completed is not None:
+            if completed.timestamp is None:
+                return None
+            finished = completed.timestamp
+        else:
+            finished = datetime.now(running.timestamp.tzinfo)
+        return (finished - running.timestamp).total_seconds()
+
+
 def delete_last_run() -> None:
-    Session.configure(bind=get_engine())
-    with Session() as session:
+    with _get_session() as session:
         statement = select(Runs.id, Runs.status).order_by(desc(Runs.id)).limit(1)
         last_run_id, status = session.execute(statement).fetchone()
 
@@ -98,3 +382,20 @@ def delete_last_run() -> None:
         statement = delete(Runs).where(Runs.id == last_run_id)
         session.execute(statement)
         session.commit()
+
+
+def prune_payloads(retention_months: int) -> list[str]:
+    """
+    Drop the payload partitions older than the retention period (see
+    db.partitions.prune_partitions) and delete the payload bodies which are
+    no longer referenced (see db.payload_body).
+
+    Returns:
+        The names of the dropped partitions
+    """
+    engine = get_engine()
+    with engine.begin() as connection:
+        dropped = prune_partitions(connection, retention_months)
+    if dropped:
+        delete_unreferenced_payload_bodies(engine)
+    return dropped
@@ -5,7 +5,9 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 #
 from datetime import date
+from datetime import datetime
 from functools import lru_cache
+from typing import Dict
 from typing import List
 from typing import Optional
 
@@ -13,14 +15,17 @@ from pydantic import UUID4
 from pydantic import AnyHttpUrl
 from pydantic import BaseSettings
 from pydantic import Field
+from pydantic import PositiveFloat
 from pydantic import PositiveInt
 from pydantic import SecretStr
+from pydantic import confloat
 from pydantic import conint
 from pydantic import constr
 from ra_utils.job_settings import JobSettings
 
 from .log import LogLevel
 from .models import JobFunction
+from .models import SDCacheBackend
 
 
 class Settings(BaseSettings):  # type: ignore
@@ -39,8 +44,108 @@ class Settings(BaseSettings):  # type: ignore
     sd_job_function: JobFunction
     sd_monthly_hourly_divide: PositiveInt
 
+    # The base URL of the SD web services. Can be pointed at a local SD
+    # stand-in (see sdstandin) for offline testing
+    sd_base_url: AnyHttpUrl = Field("https://service.sd.dk/sdws/")
+
     # Persist SD payloads in the SD payloads DB
     sd_persist_payloads: bool = True
+    # Persist the payloads in a background thread, which writes them to the DB
+    # in batches of up to sd_payload_batch_size, instead of on the critical
+    # path of every SD call. If more than sd_payload_queue_size payloads are
+    # waiting to be written, further payloads are dropped
+    sd_persist_payloads_in_background: bool = True
+    sd_payload_queue_size: PositiveInt = 100
+    sd_payload_batch_size: PositiveInt = 20
+    # Store the payload responses gzip compressed (in the response_compressed
+    # column) instead of as text. Existing payloads can be compressed with
+    # sdlon/scripts/compress_payloads.py
+    sd_compress_payloads: bool = False
+    # The payload tables are partitioned by month. The months older than the
+    # retention period (not counting the current month) are dropped when
+    # POST /payloads/prune is called. The payloads are kept forever if unset
+    sd_payload_retention_months: Optional[PositiveInt] = None
+
+    # Replay mode: serve the SD lookups from the payloads persisted in the
+    # payload DB from sd_replay_from until sd_replay_to (or now) instead of
+    # calling SD (see sdlon/sd_replay.py). The index of the payloads is
+    # preloaded by sd_replay_preload_workers threads, and the responses are
+    # loaded when requested. Nothing is persisted while replaying
+    sd_replay_from: Optional[datetime] = None
+    sd_replay_to: Optional[datetime] = None
+    sd_replay_preload_workers: PositiveInt = 4
+
+    # HTTP connection settings for the calls to SD. The timeouts are in seconds
+    # and the pool settings are passed on to the requests HTTPAdapter
+    sd_http_connect_timeout: PositiveInt = 10
+    sd_http_read_timeout: PositiveInt = 120
+    sd_http_pool_connections: PositiveInt = 4
+    sd_http_pool_maxsize: PositiveInt = 10
+    # Number of retries (with exponential backoff, plus the backoff of the rate
+    # limiter if rate limiting is enabled) on transient 5xx responses
+    sd_http_retries: conint(ge=0) = 3  # type: ignore
+    sd_http_retry_backoff_factor: confloat(ge=0) = 0.5  # type: ignore
+    # Maximum number of concurrent SD calls made by the threaded SD clients (in
+    # total for the process). Should not exceed sd_http_pool_maxsize
+    sd_max_concurrent_requests: PositiveInt = 5
+
+    # Adaptive rate limiting of the calls to SD (shared by all SD calls in the
+    # process). The rate (requests per second) starts at sd_rate_limit (or the
+    # value in sd_rate_limit_per_institution for the given institution). It is
+    # multiplied by sd_rate_limit_decrease_factor when SD responds with 5xx or
+    # error envelopes and increased by sd_rate_limit_increase for every healthy
+    # response, but never above the starting rate or below sd_rate_limit_min
+    sd_rate_limit_enabled: bool = False
+    sd_rate_limit: PositiveFloat = 10.0
+    sd_rate_limit_per_institution: Dict[str, PositiveFloat] = {}
+    sd_rate_limit_min: PositiveFloat = 0.5
+    sd_rate_limit_burst: PositiveInt = 5
+    sd_rate_limit_increase: confloat(ge=0) = 0.1  # type: ignore
+    sd_rate_limit_decrease_factor: confloat(gt=0, lt=1) = 0.5  # type: ignore
+
+    # If true, the (potentially huge) responses from GetPersonChangedAtDate and
+    # GetEmploymentChanged(AtDate) are downloaded to a temporary file, parsed
+    # incrementally and processed one person at a time instead of being parsed
+    # into memory as a whole. Their payloads are always persisted compressed
+    sd_streaming_parse: bool = False
+
+    # Number of day intervals of a changed-at run whose GetPersonChangedAtDate
+    # and GetEmploymentChangedAtDate responses are fetched (in a background
+    # thread) ahead of the interval written to MO. 0 disables the read-ahead.
+    # The prefetched responses are held in memory, i.e. sd_streaming_parse
+    # does not apply to them
+    sd_prefetch_intervals: conint(ge=0) = 0  # type: ignore
+
+    # If true, the GetEmploymentChangedAtDate response of each interval of a
+    # changed-at run is fetched (and parsed into memory, regardless of
+    # sd_streaming_parse) in a background thread while the changed persons
+    # are fetched and updated
+    sd_fetch_changes_concurrently: bool = False
+
+    # Number of institutions (of sd_institution_identifier) updated
+    # concurrently (in threads) within each day interval of a changed-at run.
+    # An interval is only marked as completed in the RunDB once all of the
+    # institutions have been updated
+    sd_institution_workers: PositiveInt = 1
+
+    # Number of persons whose employments are updated concurrently (in
+    # threads) by update_all_employments. All of the employments of a person
+    # are updated by the same thread, in order
+    sd_employment_workers: PositiveInt = 1
+
+    # Read-through cache for the responses of the slowly changing SD lookups.
+    # Only the endpoints listed in sd_cache_ttls are cached, each with its own
+    # time to live (in seconds). The sqlite backend allows the cache to be
+    # shared between processes and to survive restarts
+    sd_cache_enabled: bool = False
+    sd_cache_backend: SDCacheBackend = SDCacheBackend.memory
+    sd_cache_sqlite_path: str = "/tmp/sd_cache.sqlite"
+    sd_cache_ttls: Dict[str, PositiveInt] = {
+        "GetInstitution20111201": 3600,
+        "GetDepartment20111201": 900,
+        "GetDepartmentParent20190701": 900,
+        "GetProfession20080201": 3600,
+    }
 
     # List of SD JobPositionIdentifiers which should not result in creation
     # of engagements
@@ -99,6 +204,13 @@ class Settings(BaseSettings):  # type: ignore
     app_database: str = "sd"
     app_dbuser: str = "sd"
     app_dbpassword: SecretStr
+    # Connection pool of the (process wide) SD payload DB engine. Connections
+    # are checked before use (pre-ping) and statements running longer than
+    # app_db_statement_timeout seconds are cancelled (0 disables the timeout)
+    app_db_pool_size: PositiveInt = 5
+    app_db_max_overflow: conint(ge=0) = 10  # type: ignore
+    app_db_pool_pre_ping: bool = True
+    app_db_statement_timeout: conint(ge=0) = 300  # type: ignore
 
 
 @lru_cache()
@@ -11,7 +11,6 @@ import requests
 from cachetools.func import ttl_cache  # type: ignore
 from more_itertools import one
 from os2mo_helpers.mora_helpers import MoraHelper
-from sdclient.client import SDClient
 from sdclient.requests import GetDepartmentParentRequest
 from sdclient.requests import GetDepartmentRequest
 from sdclient.requests import GetEmploymentRequest
@@ -31,9 +30,12 @@ from .engagement import get_eng_user_key
 from .engagement import re_terminate_engagement
 from .exceptions import NoCurrentValdityException
 from .log import setup_logging
+from .sd import SDLookupClient
 from .sd_common import ensure_list
 from .sd_common import mora_assert
 from .sd_common import sd_lookup
+from .sd_threaded import ThreadedSDClient
+from .single_flight import SingleFlightMoraHelper
 
 logger = get_logger()
 
@@ -74,13 +76,12 @@ class FixDepartments:
         if self.unit_type is None:
             raise Exception("Unit types not correctly configured")
 
-        self.sd_client = SDClient(
-            sd_username=settings.sd_user,
-            sd_password=settings.sd_password.get_secret_value(),
+        self.sd_client = SDLookupClient(
+            settings, self.current_inst_id, dry_run=self.dry_run
         )
 
-    def _get_mora_helper(self, settings):
-        return MoraHelper(hostname=self.settings.mora_base, use_cache=False)
+    def _get_mora_helper(self, settings) -> MoraHelper:
+        return SingleFlightMoraHelper(hostname=self.settings.mora_base, use_cache=False)
 
     def get_institution(self, inst_id: str):
         """
@@ -382,23 +383,8 @@ class FixDepartments:
 
         all_people = {}
         logger.debug("Perform GetEmployments", time_deltas=time_deltas)
-        for time_delta in time_deltas:
-            effective_date = validity_date + datetime.timedelta(days=time_delta)
-            params["EffectiveDate"] = (effective_date.strftime("%d.%m.%Y"),)
-            request_uuid = uuid4()
-            logger.info(
-                "_read_department_engagements",
-                request_uuid=request_uuid,
-                time_delta=time_delta,
-            )
-            employments = sd_lookup(
-                "GetEmployment20111201",
-                settings=self.settings,
-                params=params,
-                request_uuid=request_uuid,
-                dry_run=self.dry_run,
-                institution_identifier=self.current_inst_id,
-            )
+        all_employments = self._get_employments(params, validity_date, time_deltas)
+        for employments in all_employments:
             people = employments.get("Person", [])
             if not isinstance(people, list):
                 people = [people]
@@ -410,6 +396,40 @@ class FixDepartments:
         logger.debug("Department engagements", all_people=all_people.keys())
         return all_people
 
+    def _get_employments(
+        self,
+        params: dict[str, Any],
+        validity_date: datetime.date,
+        time_deltas: list[int],
+    ) -> list[OrderedDict]:
+        """
+        Call GetEmployment concurrently for each of the effective dates given by
+        `validity_date` and `time_deltas`. The responses are returned in the same
+        order as the `time_deltas`.
+        """
+        sd = ThreadedSDClient(self.settings, self.current_inst_id, self.dry_run)
+
+        lookups = []
+        for time_delta in time_deltas:
+            effective_date = validity_date + datetime.timedelta(days=time_delta)
+            request_uuid = uuid4()
+            logger.info(
+                "_read_department_engagements",
+                request_uuid=request_uuid,
+                time_delta=time_delta,
+            )
+            lookups.append(
+                sd.lookup(
+                    "GetEmployment20111201",
+                    params={
+                        **params,
+                        "EffectiveDate": (effective_date.strftime("%d.%m.%Y"),),
+                    },
+                    request_uuid=request_uuid,
+                )
+            )
+        return [lookup.result() for lookup in lookups]
+
     @ttl_cache(ttl=1800)
     def _get_sd_ny_logic_unit(self, unit: UUID, lookup_date: datetime.date) -> UUID:
         """
@@ -699,25 +719,29 @@ class FixDepartments:
             "from_date": validity_date.strftime("%d.%m.%Y"),
             "to_date": validity_date.strftime("%d.%m.%Y"),
         }
-        department_branch = []
-        department = self.get_department(validity=validity, uuid=leaf_uuid)[0]
-        department_branch.append((department["DepartmentIdentifier"], leaf_uuid))
-
-        current_uuid = self.get_parent(
-            department["DepartmentUUIDIdentifier"], validity_date=validity_date
-        )
+        sd = ThreadedSDClient(self.settings, self.current_inst_id, self.dry_run)
 
+        # The department itself and its parent are independent lookups, so we
+        # fetch them concurrently for each step up the tree
+        department_branch = []
+        current_uuid = leaf_uuid
         while current_uuid is not None:
-            current_uuid = self.get_parent(
-                department["DepartmentUUIDIdentifier"], validity_date=validity_date
+            department_lookup = sd.run(
+                self.get_department, validity=validity, uuid=current_uuid
+            )
+            parent_lookup = sd.run(
+                self.get_parent, current_uuid, validity_date=validity_date
             )
-            department = self.get_department(validity=validity, uuid=current_uuid)[0]
+            departments = department_lookup.result()
+            parent_uuid = parent_lookup.result()
+            department = departments[0]
             shortname = department["DepartmentIdentifier"]
             level = department["DepartmentLevelIdentifier"]
-            uuid = department["DepartmentUUIDIdentifier"]
-            department_branch.append((shortname, uuid))
-            current_uuid = self.get_parent(current_uuid, validity_date=validity_date)
-            logger.debug("Department", shortname=shortname, uuid=uuid, level=level)
+            department_branch.append((shortname, current_uuid))
+            logger.debug(
+                "Department", shortname=shortname, uuid=current_uuid, level=level
+            )
+            current_uuid = parent_uuid
         return department_branch
 
     def sd_uuid_from_short_code(self, validity_date, shortname):
@@ -1,5 +1,23 @@
+from typing import Any
+
+from graphql import DocumentNode
+from graphql import OperationType
 from raclients.graph.client import GraphQLClient
 
+from .run_stats import count_mo_call
+
+
+class CountingGraphQLClient(GraphQLClient):
+    """GraphQLClient counting the MO reads and writes (mutations) in RunStats."""
+
+    def execute(self, document: DocumentNode, *args: Any, **kwargs: Any) -> Any:
+        is_mutation = any(
+            getattr(definition, "operation", None) == OperationType.MUTATION
+            for definition in document.definitions
+        )
+        count_mo_call(write=is_mutation)
+        return super().execute(document, *args, **kwargs)
+
 
 def get_mo_client(
     auth_server: str,
@@ -24,7 +42,7 @@ def get_mo_client(
         A GraphQL client
     """
 
-    return GraphQLClient(
+    return CountingGraphQLClient(
         url=f"{mo_base_url}/graphql/v{str(gql_version)}",
         client_id=client_id,
         client_secret=client_secret,
@@ -1,20 +1,26 @@
 import asyncio
 from datetime import datetime
+from typing import Any
 from uuid import UUID
 
 from fastapi import FastAPI
 from fastapi import Response
 from prometheus_fastapi_instrumentator import Instrumentator
+from starlette.status import HTTP_404_NOT_FOUND
 from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
 from structlog.stdlib import get_logger
 
 from db.queries import delete_last_run
+from db.queries import get_run_elapsed_seconds
+from db.queries import get_run_stats
 from db.queries import get_status
+from db.queries import prune_payloads
 
 from .config import get_settings
 from .fix_departments import FixDepartments
 from .metrics import dipex_last_success_timestamp
 from .metrics import sd_changed_at_state
+from .run_stats import total_stats
 from .sd_changed_at import changed_at
 
 logger = get_logger()
@@ -38,6 +44,25 @@ def create_app(**kwargs) -> FastAPI:
         delete_last_run()
         return {"msg": "Last run deleted"}
 
+    @app.get("/runs/{run_id}/stats")
+    def run_stats(run_id: int, response: Response) -> dict[str, Any]:
+        institutions = get_run_stats(run_id)
+        if not institutions:
+            response.status_code = HTTP_404_NOT_FOUND
+            return {"msg": "No statistics recorded for the run"}
+        return {
+            "run_id": run_id,
+            "total": total_stats(institutions, get_run_elapsed_seconds(run_id)),
+            "institutions": institutions,
+        }
+
+    @app.post("/payloads/prune")
+    def payloads_prune() -> dict[str, str | list[str]]:
+        if settings.sd_payload_retention_months is None:
+            return {"msg": "No payload retention configured"}
+        dropped = prune_payloads(settings.sd_payload_retention_months)
+        return {"msg": "Payloads pruned", "dropped_partitions": dropped}
+
     @app.post("/trigger")
     async def trigger() -> dict[str, str]:
         loop = asyncio.get_running_loop()
@@ -1,7 +1,9 @@
 import enum
 
+from prometheus_client import Counter
 from prometheus_client import Enum
 from prometheus_client import Gauge
+from prometheus_client import Histogram
 
 
 class RunDBState(enum.Enum):
@@ -22,3 +24,59 @@ sd_changed_at_state = Enum(
     documentation="Reflecting the RunDB state",
     states=[state.value for state in RunDBState],
 )
+sd_cache_hits = Counter(
+    name="sd_cache_hits",
+    documentation="Number of SD lookups served from the SD response cache",
+    labelnames=["endpoint"],
+)
+sd_cache_misses = Counter(
+    name="sd_cache_misses",
+    documentation="Number of cacheable SD lookups not found in the SD response cache",
+    labelnames=["endpoint"],
+)
+sd_rate_limit = Gauge(
+    name="sd_rate_limit",
+    documentation="The current rate limit (requests per second) for the calls to SD",
+    labelnames=["institution"],
+)
+sd_request_duration = Histogram(
+    name="sd_request_duration_seconds",
+    documentation="Latency of the requests to SD (until the response headers are read)",
+    labelnames=["endpoint", "institution"],
+    buckets=[0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300],
+)
+sd_response_size = Histogram(
+    name="sd_response_size_bytes",
+    documentation="Size of the responses from SD",
+    labelnames=["endpoint", "institution"],
+    buckets=[1e3, 1e4, 1e5, 1e6, 1e7, 5e7, 1e8, 5e8],
+)
+sd_parse_duration = Histogram(
+    name="sd_parse_duration_seconds",
+    documentation="Time spent parsing the (non-streamed) XML responses from SD",
+    labelnames=["endpoint", "institution"],
+    buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60],
+)
+sd_error_envelopes = Counter(
+    name="sd_error_envelopes",
+    documentation="Number of SD responses with an error envelope",
+    labelnames=["endpoint", "institution"],
+)
+sd_employment_not_found = Counter(
+    name="sd_employment_not_found",
+    documentation="Number of SD error envelopes stating that an employment does not exist",
+    labelnames=["endpoint", "institution"],
+)
+sd_payload_queue_depth = Gauge(
+    name="sd_payload_queue_depth",
+    documentation="Number of SD payloads waiting to be written to the payload DB",
+)
+sd_payload_rows_written = Counter(
+    name="sd_payload_rows_written",
+    documentation="Number of SD payloads written to the payload DB in the background",
+)
+sd_payload_rows_dropped = Counter(
+    name="sd_payload_rows_dropped",
+    documentation="Number of SD payloads which could not be written to the payload DB",
+    labelnames=["reason"],
+)
@@ -11,6 +11,11 @@ class JobFunction(str, Enum):
     always_medarbejder = "AlwaysMedarbejder"
 
 
+class SDCacheBackend(str, Enum):
+    memory = "memory"
+    sqlite = "sqlite"
+
+
 # TODO: replace these models with the one present in the new SD client
 
 
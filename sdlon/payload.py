@@ -1,36 +1,118 @@
+import json
+import os
+from collections import deque
+from concurrent.futures import Executor
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from enum import Enum
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import TextIO
 
 import click
+import xmltodict
 from lxml import etree
 from sqlalchemy import select
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
 
+from db.compression import payload_response
 from db.engine import get_engine
 from db.models import Payload
+from db.models import PayloadIndex
+from db.payload_body import join_payload_body
+from db.payload_body import payload_response_column
+from db.payload_body import payload_response_compressed_column
 
-GET_EMPLOYMENT_CHANGED_AT_DATE = (
-    "https://service.sd.dk/sdws/GetEmploymentChangedAtDate20111201"
-)
+from .config import get_settings
+from .sd_common import get_sd_url
+
+GET_EMPLOYMENT_CHANGED_AT_DATE = "GetEmploymentChangedAtDate20111201"
 
 
-def get_payloads(engine: Engine, cpr: str) -> list[tuple[datetime, str]]:
+def _payloads_stmt(
+    sd_base_url: str,
+    cpr: str,
+    employment_identifier: str | None = None,
+    from_date: datetime | None = None,
+    to_date: datetime | None = None,
+) -> Select:
     """
-    Get payloads containing the CPR from the payload DB
+    Select the GetEmploymentChangedAtDate payloads from the SD service at
+    `sd_base_url` containing the CPR (and employment) from the payload DB
+
+    The payloads are looked up in the payload index, so payloads persisted
+    before the index was introduced must be indexed with
+    sdlon/scripts/index_payloads.py first. Limiting the period (from_date
+    inclusive, to_date exclusive) limits the lookup to the partitions of the
+    months in the period.
     """
-    stmt = (
-        select(Payload.timestamp, Payload.response)
-        .where(
-            Payload.response.contains(cpr),
-            Payload.full_url == GET_EMPLOYMENT_CHANGED_AT_DATE,
+    index_stmt = select(PayloadIndex.payload_id).where(PayloadIndex.cpr == cpr)
+    if employment_identifier is not None:
+        index_stmt = index_stmt.where(
+            PayloadIndex.employment_identifier == employment_identifier
         )
-        .order_by(Payload.timestamp)
-    )
+    stmt = join_payload_body(
+        select(
+            Payload.timestamp,
+            payload_response_column,
+            payload_response_compressed_column,
+        )
+    ).where(Payload.full_url == get_sd_url(sd_base_url, GET_EMPLOYMENT_CHANGED_AT_DATE))
+    if from_date is not None:
+        index_stmt = index_stmt.where(PayloadIndex.timestamp >= from_date)
+        stmt = stmt.where(Payload.timestamp >= from_date)
+    if to_date is not None:
+        index_stmt = index_stmt.where(PayloadIndex.timestamp < to_date)
+        stmt = stmt.where(Payload.timestamp < to_date)
+    stmt = stmt.where(Payload.id.in_(index_stmt)).order_by(Payload.timestamp)
+    return stmt
+
 
+def iter_payloads(
+    engine: Engine,
+    sd_base_url: str,
+    cpr: str,
+    employment_identifier: str | None = None,
+    from_date: datetime | None = None,
+    to_date: datetime | None = None,
+    batch_size: int = 100,
+) -> Iterator[tuple[datetime, str | None, bytes | None]]:
+    """
+    Stream the (timestamp, response, response_compressed) of the payloads
+    selected by `_payloads_stmt`, using a server-side cursor fetching
+    batch_size payloads at a time. The responses are not decompressed, which
+    is left to the consumer.
+    """
+    stmt = _payloads_stmt(sd_base_url, cpr, employment_identifier, from_date, to_date)
     with Session(engine) as session:
-        result = session.execute(stmt)
+        result = session.execute(stmt.execution_options(yield_per=batch_size))
+        for timestamp, response, response_compressed in result:
+            yield timestamp, response, response_compressed
 
-    return [(row[0], row[1]) for row in result]
+
+def get_payloads(
+    engine: Engine,
+    sd_base_url: str,
+    cpr: str,
+    employment_identifier: str | None = None,
+    from_date: datetime | None = None,
+    to_date: datetime | None = None,
+) -> list[tuple[datetime, str]]:
+    """
+    Get payloads containing the CPR (and employment) from the payload DB (see
+    `_payloads_stmt`)
+    """
+    return [
+        (timestamp, payload_response(response, response_compressed) or "")
+        for timestamp, response, response_compressed in iter_payloads(
+            engine, sd_base_url, cpr, employment_identifier, from_date, to_date
+        )
+    ]
 
 
 def get_sd_persons(payload: str, cpr: str):
@@ -47,19 +129,149 @@ def get_sd_persons(payload: str, cpr: str):
     ]
 
 
+class OutputFormat(str, Enum):
+    xml = "xml"
+    jsonl = "jsonl"
+
+
+def format_payload(
+    timestamp: datetime,
+    response: str | None,
+    response_compressed: bytes | None,
+    cpr: str,
+    output_format: OutputFormat,
+) -> str:
+    """
+    Decompress and decode a payload and format the persons with the CPR in
+    it, i.e. the CPU bound part of the export.
+    """
+    payload = payload_response(response, response_compressed) or ""
+    persons = get_sd_persons(payload, cpr)
+    if output_format == OutputFormat.jsonl:
+        return "".join(
+            json.dumps(
+                {
+                    "timestamp": timestamp.isoformat(),
+                    "person": xmltodict.parse(etree.tostring(person))["Person"],
+                }
+            )
+            + "\n"
+            for person in persons
+        )
+    return f"---------- {timestamp.strftime('%Y-%m-%d')} ----------\n" + "".join(
+        etree.tostring(person, pretty_print=True).decode() for person in persons
+    )
+
+
+def _format_payload(args: tuple) -> str:
+    return format_payload(*args)
+
+
+def _map_bounded(
+    executor: Executor, fn: Callable[[Any], str], items: Iterable[Any], limit: int
+) -> Iterator[str]:
+    """
+    Like `executor.map`, but with at most `limit` items submitted at a time,
+    so the items are consumed (from the DB cursor) only as fast as they are
+    processed.
+    """
+    pending: deque[Future] = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def export_payloads(
+    payloads: Iterable[tuple[datetime, str | None, bytes | None]],
+    cpr: str,
+    output_format: OutputFormat,
+    output: TextIO,
+    workers: int,
+) -> None:
+    """
+    Write the persons with the CPR in the payloads to the output in the order
+    of the payloads, as each payload is decoded. The payloads are decoded by
+    a pool of `workers` processes (in this process if workers is 1).
+    """
+    items = (
+        (timestamp, response, response_compressed, cpr, output_format)
+        for timestamp, response, response_compressed in payloads
+    )
+    if workers == 1:
+        for item in items:
+            output.write(_format_payload(item))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for formatted in _map_bounded(executor, _format_payload, items, 2 * workers):
+            output.write(formatted)
+
+
 @click.command()
 @click.option("--cpr", required=True, help="CPR number of person to payloads for")
-def main(cpr: str):
+@click.option(
+    "--employment-identifier",
+    help="Only show payloads containing this employment of the person",
+)
+@click.option(
+    "--from-date",
+    type=click.DateTime(),
+    help="Only show payloads persisted at or after this time",
+)
+@click.option(
+    "--to-date",
+    type=click.DateTime(),
+    help="Only show payloads persisted before this time",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice([f.value for f in OutputFormat]),
+    default=OutputFormat.xml.value,
+    help="Pretty printed XML or one JSON object per person and payload",
+)
+@click.option(
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="File to write to (default: stdout)",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=lambda: os.cpu_count() or 1,
+    help="Number of processes decoding the payloads",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=100,
+    help="Number of payloads fetched from the DB at a time",
+)
+def main(
+    cpr: str,
+    employment_identifier: str | None,
+    from_date: datetime | None,
+    to_date: datetime | None,
+    output_format: str,
+    output: TextIO,
+    workers: int,
+    batch_size: int,
+):
     engine = get_engine()
 
-    payloads = get_payloads(engine, cpr)
-
-    for timestamp, payload in payloads:
-        print(f"---------- {timestamp.strftime('%Y-%m-%d')} ----------")
-        persons = get_sd_persons(payload, cpr)
-        for person in persons:
-            output = etree.tostring(person, pretty_print=True)
-            print(output.decode(), end="")
+    payloads = iter_payloads(
+        engine,
+        get_settings().sd_base_url,
+        cpr,
+        employment_identifier,
+        from_date,
+        to_date,
+        batch_size,
+    )
+    export_payloads(payloads, cpr, OutputFormat(output_format), output, workers)
 
 
 if __name__ == "__main__":
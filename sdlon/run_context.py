@@ -0,0 +1,59 @@
+import threading
+from dataclasses import dataclass
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+from typing import TypeVar
+
+from structlog.stdlib import get_logger
+
+logger = get_logger()
+
+T = TypeVar("T")
+
+
+@dataclass
+class MOClasses:
+    """The MO organisation and classes used by the changed-at updaters."""
+
+    org_uuid: str
+    # Map from user-key to uuid if jpi, name to uuid otherwise
+    job_functions: Dict[str, str]
+    job_function_facet: str
+    # Map from user-key to uuid
+    engagement_types: Dict[str, str]
+    engagement_type_facet: str
+    leave_uuid: str
+    association_uuid: str
+
+
+class RunContext:
+    """
+    State shared by the ChangeAtSD updaters of a changed-at run.
+
+    A run creates an updater for each (day interval, institution) pair. The
+    objects which are expensive to set up, but do not depend on the interval
+    (the GraphQL client, the MO classes and the FixDepartments and JobIdSync
+    of each institution), are loaded by the first updater needing them and
+    reused by the later ones. Classes created by an updater are added to the
+    shared MOClasses, so the later updaters know them without reading the
+    facets again.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._objects: Dict[Hashable, Any] = {}
+        # Held while looking up and creating missing classes, so concurrent
+        # updaters do not create the same class twice
+        self.classes_lock = threading.Lock()
+        # Held while fixing (creating or moving) a department in MO
+        self.departments_lock = threading.Lock()
+
+    def get(self, key: Hashable, load: Callable[[], T]) -> T:
+        """Get the object for the key, loading it on first use."""
+        with self._lock:
+            if key not in self._objects:
+                logger.debug("Load run context object", key=key)
+                self._objects[key] = load()
+            return self._objects[key]
@@ -0,0 +1,190 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+from os2mo_helpers.mora_helpers import MoraHelper
+
+from .single_flight import SingleFlightMoraHelper
+
+PHASES = ("persons", "employments")
+COUNTERS = (
+    "mo_reads",
+    "mo_writes",
+    "persons_processed",
+    "employments_processed",
+    "engagements_created",
+    "engagements_edited",
+    "engagements_terminated",
+    "noop_edits",
+)
+
+_active_stats: ContextVar[Optional["RunStats"]] = ContextVar(
+    "active_run_stats", default=None
+)
+# The MO writes made by the current thread (see mo_writes_in_thread)
+_thread_counts = threading.local()
+
+
+class RunStats:
+    """
+    Statistics of the updates made by a ChangeAtSD updater, i.e. of one
+    institution in one day interval of a changed-at run: the wall time of
+    each phase, the number of SD calls per endpoint, the number of MO reads
+    and writes and the number of persons, employments and engagements
+    processed. The SD and MO calls are the requests actually sent, i.e. not
+    the lookups served from a cache or shared with an identical call in
+    flight.
+
+    The SD and MO calls and the engagement updates are counted (by `count`
+    and friends) in the RunStats active in the context making them, so
+    threads doing work on behalf of an updater must run in a copy of the
+    context of the thread activating its RunStats.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.phase_seconds: Dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        self.sd_calls: Counter[str] = Counter()
+        self.counts: Counter[str] = Counter(dict.fromkeys(COUNTERS, 0))
+
+    @contextmanager
+    def activate(self) -> Iterator[None]:
+        """Count the calls made in the context in these statistics."""
+        token = _active_stats.set(self)
+        try:
+            yield
+        finally:
+            _active_stats.reset(token)
+
+    @contextmanager
+    def timed(self, phase: str) -> Iterator[None]:
+        """Add the wall time spent in the block to the phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phase_seconds[phase] += time.perf_counter() - start
+
+    def add(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counts[name] += n
+
+    def add_sd_call(self, endpoint: str) -> None:
+        with self._lock:
+            self.sd_calls[endpoint] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **{f"{phase}_seconds": s for phase, s in self.phase_seconds.items()},
+                "sd_calls": dict(self.sd_calls),
+                **self.counts,
+            }
+
+
+def total_stats(
+    institution_stats: Iterable[Dict[str, Any]], elapsed_seconds: Optional[float]
+) -> Dict[str, Any]:
+    """
+    The total of the statistics (as persisted, see `RunStats.as_dict`) of the
+    institutions of a run.
+
+    The institutions may be updated concurrently (see the
+    sd_institution_workers setting), so the wall time of their phases does
+    not add up. The elapsed (wall) time of the run is reported instead.
+    """
+    stats: List[Dict[str, Any]] = list(institution_stats)
+    sd_calls: Counter[str] = Counter()
+    for institution in stats:
+        sd_calls.update(institution["sd_calls"])
+    return {
+        "elapsed_seconds": elapsed_seconds,
+        "sd_calls": dict(sd_calls),
+        **{name: sum(s[name] for s in stats) for name in COUNTERS},
+    }
+
+
+def count(name: str, n: int = 1) -> None:
+    """Add to the counter of the active RunStats, if any."""
+    stats = _active_stats.get()
+    if stats is not None:
+        stats.add(name, n)
+
+
+def count_sd_call(endpoint: str) -> None:
+    stats = _active_stats.get()
+    if stats is not None:
+        stats.add_sd_call(endpoint)
+
+
+def count_mo_call(write: bool) -> None:
+    if write:
+        _thread_counts.mo_writes = mo_writes_in_thread() + 1
+    count("mo_writes" if write else "mo_reads")
+
+
+def mo_writes_in_thread() -> int:
+    """
+    The number of MO writes made by the current thread, for telling whether a
+    (single threaded) operation wrote anything to MO.
+    """
+    return getattr(_thread_counts, "mo_writes", 0)
+
+
+class _MoResponseCache(dict):
+    """
+    The response cache of a MoraHelper, which records (per thread) whether a
+    lookup was served from it. MoraHelper only reads the cache on a cache hit.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._hits = threading.local()
+
+    def __getitem__(self, key: Any) -> Any:
+        self._hits.hit = True
+        return super().__getitem__(key)
+
+    def take_hit(self) -> bool:
+        """Whether the cache was hit in this thread since the last call."""
+        hit = getattr(self._hits, "hit", False)
+        self._hits.hit = False
+        return hit
+
+
+class _MoCallCountingMoraHelper(MoraHelper):
+    """MoraHelper counting the requests it sends to MO in RunStats."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = _MoResponseCache()
+
+    def _mo_lookup(self, *args, **kwargs):
+        self.cache.take_hit()
+        try:
+            return super()._mo_lookup(*args, **kwargs)
+        finally:
+            # The cache hits of MoraHelper are not sent to MO
+            if not self.cache.take_hit():
+                count_mo_call(write=False)
+
+    def _mo_post(self, *args, **kwargs):
+        count_mo_call(write=True)
+        return super()._mo_post(*args, **kwargs)
+
+
+class CountingMoraHelper(SingleFlightMoraHelper, _MoCallCountingMoraHelper):
+    """
+    SingleFlightMoraHelper counting the MO reads and writes in RunStats. The
+    reads are counted below the single flight, so identical concurrent reads
+    sharing a request are counted once.
+    """
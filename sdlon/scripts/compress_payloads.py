@@ -0,0 +1,148 @@
+"""
+Compress the responses of the existing payloads and payload bodies in the
+payload DB (see the sd_compress_payloads setting).
+
+The rows are compressed in batches, each in its own short transaction, so
+the script can run alongside the integration and be interrupted and resumed
+at any time.
+"""
+
+import time
+from typing import Any
+from typing import Sequence
+
+import click
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from structlog import get_logger
+
+from db.compression import compress_response
+from db.engine import get_engine
+from db.models import Payload
+from db.models import PayloadBody
+
+logger = get_logger()
+
+
+def _compress(
+    engine: Engine,
+    model: Any,
+    stmt: Select,
+    keys: Sequence[str],
+    max_batches: int | None,
+    pause: float,
+) -> int:
+    """
+    Compress the responses of the rows selected by `stmt`, which selects the
+    primary key columns `keys` of `model` followed by the response.
+    """
+    compressed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with Session(engine) as session:
+            rows = session.execute(stmt).all()
+            if not rows:
+                break
+            session.bulk_update_mappings(
+                model,
+                [
+                    {
+                        **dict(zip(keys, row[:-1])),
+                        "response": None,
+                        "response_compressed": compress_response(row[-1]),
+                    }
+                    for row in rows
+                ],
+            )
+            session.commit()
+        compressed += len(rows)
+        batches += 1
+        logger.info(
+            "Compressed responses",
+            table=model.__tablename__,
+            batch=len(rows),
+            total=compressed,
+        )
+        if pause:
+            time.sleep(pause)
+    return compressed
+
+
+def compress_payloads(
+    engine: Engine,
+    batch_size: int = 100,
+    max_batches: int | None = None,
+    pause: float = 0.0,
+) -> int:
+    """
+    Compress the uncompressed payload responses.
+
+    Args:
+        engine: the payload DB engine
+        batch_size: the number of payloads to compress in each transaction
+        max_batches: stop after this many batches (None for no limit)
+        pause: seconds to sleep between the batches to reduce the DB load
+
+    Returns:
+        The number of compressed payloads
+    """
+    stmt = (
+        select(Payload.id, Payload.timestamp, Payload.response)
+        .where(Payload.response.is_not(None), Payload.response_compressed.is_(None))
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    return _compress(engine, Payload, stmt, ("id", "timestamp"), max_batches, pause)
+
+
+def compress_payload_bodies(
+    engine: Engine,
+    batch_size: int = 100,
+    max_batches: int | None = None,
+    pause: float = 0.0,
+) -> int:
+    """
+    Compress the uncompressed payload body responses (see db.payload_body).
+
+    Takes the same arguments as `compress_payloads`.
+
+    Returns:
+        The number of compressed payload bodies
+    """
+    stmt = (
+        select(PayloadBody.hash, PayloadBody.response)
+        .where(
+            PayloadBody.response.is_not(None),
+            PayloadBody.response_compressed.is_(None),
+        )
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    return _compress(engine, PayloadBody, stmt, ("hash",), max_batches, pause)
+
+
+@click.command()
+@click.option("--batch-size", type=click.IntRange(min=1), default=100)
+@click.option(
+    "--max-batches",
+    type=click.IntRange(min=1),
+    help="Stop after this many batches (default: until all are compressed)",
+)
+@click.option(
+    "--pause",
+    type=click.FloatRange(min=0),
+    default=0.0,
+    help="Seconds to sleep between the batches",
+)
+def main(batch_size: int, max_batches: int | None, pause: float):
+    engine = get_engine()
+    compressed = compress_payloads(engine, batch_size, max_batches, pause)
+    print(f"Compressed {compressed} payloads")
+    compressed = compress_payload_bodies(engine, batch_size, max_batches, pause)
+    print(f"Compressed {compressed} payload bodies")
+
+
+if __name__ == "__main__":
+    main()
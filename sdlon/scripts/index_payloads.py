@@ -0,0 +1,96 @@
+"""
+Add the payloads persisted before the payload index was introduced to the
+payload index (see db.payload_index).
+
+The payloads are indexed in batches (in the order they were persisted), each
+in its own transaction, so the script can run alongside the integration and
+be interrupted and resumed at any time. Payloads which are already indexed
+are skipped.
+"""
+
+import click
+from sqlalchemy import exists
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy import tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from structlog import get_logger
+
+from db.compression import payload_response
+from db.engine import get_engine
+from db.models import Payload
+from db.models import PayloadIndex
+from db.payload_body import join_payload_body
+from db.payload_body import payload_response_column
+from db.payload_body import payload_response_compressed_column
+from db.payload_index import payload_index_rows
+
+logger = get_logger()
+
+
+def index_payloads(engine: Engine, batch_size: int = 100) -> int:
+    """
+    Index the payloads which are not in the payload index.
+
+    Args:
+        engine: the payload DB engine
+        batch_size: the number of payloads to index in each transaction
+
+    Returns:
+        The number of indexed payloads
+    """
+    stmt = (
+        join_payload_body(
+            select(
+                Payload.id,
+                Payload.timestamp,
+                payload_response_column,
+                payload_response_compressed_column,
+            )
+        )
+        .where(~exists().where(PayloadIndex.payload_id == Payload.id))
+        .order_by(Payload.timestamp, Payload.id)
+        .limit(batch_size)
+    )
+
+    indexed = 0
+    last_key = None
+    while True:
+        # Payloads without persons get no index rows, so they are skipped by
+        # continuing after the last payload of the previous batch
+        batch_stmt = stmt
+        if last_key is not None:
+            batch_stmt = stmt.where(tuple_(Payload.timestamp, Payload.id) > last_key)
+        with Session(engine) as session:
+            payloads = session.execute(batch_stmt).all()
+            if not payloads:
+                break
+            index_rows = [
+                index_row
+                for payload_id, timestamp, response, response_compressed in payloads
+                for index_row in payload_index_rows(
+                    payload_id,
+                    payload_response(response, response_compressed) or "",
+                    timestamp,
+                )
+            ]
+            if index_rows:
+                session.execute(insert(PayloadIndex), index_rows)
+            session.commit()
+        last_payload_id, last_timestamp = payloads[-1][:2]
+        last_key = tuple_(last_timestamp, last_payload_id)
+        indexed += len(payloads)
+        logger.info("Indexed payloads", batch=len(payloads), total=indexed)
+    return indexed
+
+
+@click.command()
+@click.option("--batch-size", type=click.IntRange(min=1), default=100)
+def main(batch_size: int):
+    indexed = index_payloads(get_engine(), batch_size)
+    print(f"Indexed {indexed} payloads")
+
+
+if __name__ == "__main__":
+    main()
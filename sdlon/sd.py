@@ -1,11 +1,80 @@
+from collections import OrderedDict
 from datetime import date
+from typing import Any
+from typing import Tuple
 
 from sdclient.client import SDClient
 from sdclient.requests import GetEmploymentChangedRequest
 from sdclient.requests import GetEmploymentRequest
+from sdclient.requests import SDRequest
 from sdclient.responses import GetEmploymentChangedResponse
 from sdclient.responses import GetEmploymentResponse
 
+from .config import Settings
+from .sd_common import ensure_list
+from .sd_common import sd_lookup
+
+
+def _force_list(element: Any, keys: Tuple[str, ...]) -> Any:
+    """
+    Copy of the parsed XML element, where the children with the given keys
+    are always lists (like the `force_list` argument of `xmltodict.parse`).
+    """
+    if isinstance(element, list):
+        return [_force_list(child, keys) for child in element]
+    if isinstance(element, dict):
+        return OrderedDict(
+            (
+                key,
+                ensure_list(_force_list(value, keys))
+                if key in keys
+                else _force_list(value, keys),
+            )
+            for key, value in element.items()
+        )
+    return element
+
+
+class SDLookupClient(SDClient):
+    """
+    SDClient making its calls with `sd_lookup`, i.e. against
+    `settings.sd_base_url` using the shared SD session, rate limiter, cache
+    and payload persistence, instead of calling the SD production service
+    directly.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        institution_identifier: str | None = None,
+        dry_run: bool = False,
+    ):
+        super().__init__(
+            settings.sd_user,
+            settings.sd_password.get_secret_value(),
+            timeout=settings.sd_http_read_timeout,
+        )
+        self.settings = settings
+        self.institution_identifier = institution_identifier
+        self.dry_run = dry_run
+
+    def _call_sd(
+        self, query_params: SDRequest, xml_force_list: Tuple[str, ...] = tuple()
+    ) -> OrderedDict:
+        params = query_params.to_query_params()
+        response = sd_lookup(
+            query_params.get_name(),
+            settings=self.settings,
+            params=params,
+            dry_run=self.dry_run,
+            institution_identifier=params.get(
+                "InstitutionIdentifier", self.institution_identifier
+            ),
+        )
+        # The parsed response may be shared with concurrent lookups (see
+        # sd_lookup), so it is copied rather than modified
+        return _force_list(response, xml_force_list)
+
 
 class SD:
     def __init__(self, username: str, password: str, institution_identifier: str):
@@ -0,0 +1,178 @@
+import json
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Protocol
+from typing import Tuple
+
+from structlog.stdlib import get_logger
+
+from .config import Settings
+from .metrics import sd_cache_hits
+from .metrics import sd_cache_misses
+from .models import SDCacheBackend
+
+logger = get_logger()
+
+
+class _Backend(Protocol):
+    def get(self, key: str) -> Optional[str]: ...
+
+    def set(self, key: str, value: str, ttl: int) -> None: ...
+
+    def clear(self) -> None: ...
+
+
+class _MemoryBackend:
+    """Process local cache backend."""
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class _SQLiteBackend:
+    """On-disk cache backend, which can be shared between processes."""
+
+    def __init__(self, path: str) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sd_cache "
+                "(key TEXT PRIMARY KEY, expires REAL NOT NULL, response TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "DELETE FROM sd_cache WHERE expires <= ?", (time.time(),)
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM sd_cache WHERE key = ? AND expires > ?",
+                (key, time.time()),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sd_cache (key, expires, response) "
+                "VALUES (?, ?, ?)",
+                (key, time.time() + ttl, value),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sd_cache")
+
+
+class SDCache:
+    """
+    Read-through cache for the raw responses of the SD lookups.
+
+    Only responses from the endpoints in `ttls` are cached. The cache key is
+    the SD base URL, the endpoint, the SD user and the (normalized) request
+    parameters, including the InstitutionIdentifier, so SD instances and users
+    sharing a cache backend never see each other's responses. The raw response
+    text is stored, so every lookup gets its own freshly parsed copy of the
+    response.
+    """
+
+    def __init__(self, backend: _Backend, ttls: Dict[str, int]):
+        self.backend = backend
+        self.ttls = ttls
+
+    @staticmethod
+    def _key(url: str, settings: Settings, params: Dict[str, Any]) -> str:
+        return ":".join(
+            [
+                settings.sd_base_url,
+                url,
+                settings.sd_user,
+                json.dumps(params, sort_keys=True, default=str),
+            ]
+        )
+
+    def is_cacheable(self, url: str) -> bool:
+        return url in self.ttls
+
+    def get(
+        self, url: str, settings: Settings, params: Dict[str, Any]
+    ) -> Optional[str]:
+        if not self.is_cacheable(url):
+            return None
+        value = self.backend.get(self._key(url, settings, params))
+        if value is None:
+            sd_cache_misses.labels(endpoint=url).inc()
+        else:
+            sd_cache_hits.labels(endpoint=url).inc()
+            logger.debug("SD cache hit", url=url)
+        return value
+
+    def set(
+        self,
+        url: str,
+        settings: Settings,
+        params: Dict[str, Any],
+        response_text: str,
+    ) -> None:
+        if not self.is_cacheable(url):
+            return
+        self.backend.set(
+            self._key(url, settings, params), response_text, self.ttls[url]
+        )
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+
+@lru_cache(maxsize=None)
+def _create_sd_cache(
+    backend: SDCacheBackend, sqlite_path: str, ttls: Tuple[Tuple[str, int], ...]
+) -> SDCache:
+    if backend == SDCacheBackend.sqlite:
+        return SDCache(_SQLiteBackend(sqlite_path), dict(ttls))
+    return SDCache(_MemoryBackend(), dict(ttls))
+
+
+def get_sd_cache(settings: Settings) -> SDCache | None:
+    """
+    Get the process wide SD response cache.
+
+    Args:
+        settings: the application settings
+
+    Returns:
+        The SD cache or None if caching is disabled
+    """
+    if not settings.sd_cache_enabled:
+        return None
+    return _create_sd_cache(
+        settings.sd_cache_backend,
+        settings.sd_cache_sqlite_path,
+        tuple(sorted(settings.sd_cache_ttls.items())),
+    )
@@ -1,13 +1,22 @@
+import contextvars
 import datetime
 import sys
+import threading
 import uuid
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 from functools import partial
+from itertools import chain
 from itertools import tee
 from operator import itemgetter
 from typing import Any
 from typing import Callable
+from typing import Deque
 from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
 from typing import Optional
 from typing import OrderedDict
@@ -35,8 +44,14 @@ from ramodels.mo import Employee
 from ramodels.mo._shared import OrganisationRef
 from structlog.stdlib import get_logger
 
+from db.payload_writer import get_payload_writer
+from db.queries import get_checkpoints
+from db.queries import get_completed_runs
+from db.queries import get_resume_to_date
 from db.queries import get_run_db_from_date
 from db.queries import get_status
+from db.queries import persist_checkpoint
+from db.queries import persist_run_stats
 from db.queries import persist_status
 from sdlon.ad import LdapADGUIDReader
 from sdlon.employees import get_employee
@@ -74,10 +89,17 @@ from .fix_departments import FixDepartments
 from .models import JobFunction
 from .models import MOBasePerson
 from .models import SDBasePerson
+from .run_context import MOClasses
+from .run_context import RunContext
+from .run_stats import CountingMoraHelper
+from .run_stats import RunStats
+from .run_stats import count
+from .run_stats import mo_writes_in_thread
 from .sd_common import EmploymentStatus
 from .sd_common import calc_employment_id
 from .sd_common import ensure_list
 from .sd_common import mora_assert
+from .sd_common import sd_iter_persons
 from .sd_common import sd_lookup
 from .skip import cpr_env_filter
 from .skip import is_valid_cpr
@@ -99,23 +121,35 @@ class ChangeAtSD:
         from_date: datetime.datetime,
         to_date: Optional[datetime.datetime] = None,
         dry_run: bool = False,
+        run_context: Optional[RunContext] = None,
     ):
         self.settings = settings
         self.dry_run = dry_run
         self.current_inst_id = current_inst_id
 
+        # Share the MO client and classes with the other updaters of the run
+        self.run_context = run_context if run_context is not None else RunContext()
+
         # No more service API... let's get started using GraphQL!
-        self.mo_graphql_client = get_mo_client(
-            settings.job_settings.auth_server,
-            settings.job_settings.client_id,
-            settings.job_settings.client_secret,
-            settings.mora_base,
-            22,
+        self.mo_graphql_client = self.run_context.get(
+            "mo_graphql_client",
+            lambda: get_mo_client(
+                settings.job_settings.auth_server,
+                settings.job_settings.client_id,
+                settings.job_settings.client_secret,
+                settings.mora_base,
+                22,
+            ),
         )
 
-        self.department_fixer = self._get_fix_departments()
+        self.department_fixer = self.run_context.get(
+            ("department_fixer", current_inst_id), self._get_fix_departments
+        )
+        # Not shared, as the MoraHelper caches every MO read it makes
         self.helper = self._get_mora_helper(self.settings.mora_base)
-        self.job_sync = self._get_job_sync(self.settings)
+        self.job_sync = self.run_context.get(
+            ("job_sync", current_inst_id), lambda: self._get_job_sync(self.settings)
+        )
 
         self.use_ad = self.settings.sd_use_ad_integration
 
@@ -123,22 +157,43 @@ class ChangeAtSD:
         # about no_salary_minimum
         self.no_salary_minimum = self.settings.sd_no_salary_minimum_id
 
-        try:
-            self.org_uuid = self.helper.read_organisation()
-        except requests.exceptions.RequestException as e:
-            logger.exception("Could not read MO organization", error=e)
-            exit()
-
         self.from_date = from_date
         self.to_date = to_date
 
+        # Statistics of the updates (persisted by changed_at)
+        self.stats = RunStats()
+
         # Cache of mo engagements
         self.mo_engagements_cache: Dict[str, list] = {}
+        self._mo_engagements_lock = threading.Lock()
+
+        # The SD change feeds of the interval, if fetched ahead of the updates
+        # (see prefetch_changes)
+        self._persons_changed: Optional[List[OrderedDict[str, Any]]] = None
+        self._employments_changed: Optional[List[OrderedDict[str, Any]]] = None
+        self._employments_changed_future: Optional[Future] = None
+
+        classes = self.run_context.get("mo_classes", self._read_mo_classes)
+        self.org_uuid = classes.org_uuid
+        # The dicts are shared, i.e. the classes created by this updater are
+        # known by the later updaters of the run
+        self.job_functions = classes.job_functions
+        self.job_function_facet = classes.job_function_facet
+        self.engagement_types = classes.engagement_types
+        self.engagement_type_facet = classes.engagement_type_facet
+        self.leave_uuid = classes.leave_uuid
+        self.association_uuid = classes.association_uuid
+
+    def _read_mo_classes(self) -> MOClasses:
+        try:
+            org_uuid = self.helper.read_organisation()
+        except requests.exceptions.RequestException as e:
+            logger.exception("Could not read MO organization", error=e)
+            exit()
 
         logger.info("Read job_functions")
         facet_info = self.helper.read_classes_in_facet("engagement_job_function")
         job_functions = facet_info[0]
-        self.job_function_facet = facet_info[1]
         # Map from user-key to uuid if jpi, name to uuid otherwise
         job_function_mapper = cast(
             Callable[[Any], Tuple[str, str]], itemgetter("name", "uuid")
@@ -147,33 +202,33 @@ class ChangeAtSD:
             job_function_mapper = cast(
                 Callable[[Any], Tuple[str, str]], itemgetter("user_key", "uuid")
             )
-        self.job_functions: Dict[str, str] = dict(
-            map(job_function_mapper, job_functions)
-        )
 
         logger.info("Read engagement types")
         # The Opus diff-import contains a slightly more abstrac def to do this
         engagement_types = self.helper.read_classes_in_facet("engagement_type")
-        self.engagement_type_facet = engagement_types[1]
         engagement_type_mapper = cast(
             Callable[[Any], Tuple[str, str]], itemgetter("user_key", "uuid")
         )
-        self.engagement_types: Dict[str, str] = dict(
-            map(engagement_type_mapper, engagement_types[0])
-        )
 
-        # SD supports only one type of leave
-        self.leave_uuid = self.helper.ensure_class_in_facet("leave_type", "Orlov")
-        # SD supports only one type of association
-        self.association_uuid = self.helper.ensure_class_in_facet(
-            "association_type", "SD-Medarbejder"
+        return MOClasses(
+            org_uuid=org_uuid,
+            job_functions=dict(map(job_function_mapper, job_functions)),
+            job_function_facet=facet_info[1],
+            engagement_types=dict(map(engagement_type_mapper, engagement_types[0])),
+            engagement_type_facet=engagement_types[1],
+            # SD supports only one type of leave
+            leave_uuid=self.helper.ensure_class_in_facet("leave_type", "Orlov"),
+            # SD supports only one type of association
+            association_uuid=self.helper.ensure_class_in_facet(
+                "association_type", "SD-Medarbejder"
+            ),
         )
 
     def _get_fix_departments(self) -> FixDepartments:
         return FixDepartments(self.settings, self.current_inst_id, self.dry_run)
 
     def _get_mora_helper(self, mora_base) -> MoraHelper:
-        return MoraHelper(hostname=mora_base, use_cache=False)
+        return CountingMoraHelper(hostname=mora_base, use_cache=False)
 
     def _get_job_sync(self, settings: Settings) -> JobIdSync:
         return JobIdSync(settings, self.current_inst_id, self.mo_graphql_client)
@@ -243,14 +298,13 @@ class ChangeAtSD:
             user_key,
         )
 
-    @lru_cache(maxsize=None)
-    def read_employment_changed(
+    def _employment_changed_request(
         self,
         from_date: Optional[datetime.datetime] = None,
         to_date: Optional[datetime.datetime] = None,
         employment_identifier: Optional[str] = None,
         in_cpr: Optional[str] = None,
-    ):
+    ) -> Tuple[str, Dict[str, str]]:
         from_date = from_date or self.from_date
         to_date = to_date or self.to_date
 
@@ -298,6 +352,20 @@ class ChangeAtSD:
                 }
             )
 
+        return url, params
+
+    @lru_cache(maxsize=None)
+    def read_employment_changed(
+        self,
+        from_date: Optional[datetime.datetime] = None,
+        to_date: Optional[datetime.datetime] = None,
+        employment_identifier: Optional[str] = None,
+        in_cpr: Optional[str] = None,
+    ):
+        url, params = self._employment_changed_request(
+            from_date, to_date, employment_identifier, in_cpr
+        )
+
         request_uuid = uuid.uuid4()
         logger.info("read_employment_changed", request_uuid=request_uuid)
         response = sd_lookup(
@@ -313,20 +381,38 @@ class ChangeAtSD:
 
         return employment_response
 
-    def get_sd_persons_changed(
+    def iter_employment_changed(
         self,
-        from_date: datetime.datetime,
-        to_date: datetime.datetime | None = None,
-        cpr: str | None = None,
-    ) -> List[OrderedDict[str, Any]]:
+        from_date: Optional[datetime.datetime] = None,
+        to_date: Optional[datetime.datetime] = None,
+        employment_identifier: Optional[str] = None,
+        in_cpr: Optional[str] = None,
+    ) -> Iterator[OrderedDict[str, Any]]:
         """
-        Get list of SD Løn persons that have changed between `from_date`
-        and `to_date`
-
-        Returns:
-            List of SD Løn persons changed between the two dates
+        Streaming version of `read_employment_changed`, which yields the
+        changed SD persons one at a time while the SD response is parsed.
         """
+        url, params = self._employment_changed_request(
+            from_date, to_date, employment_identifier, in_cpr
+        )
+
+        request_uuid = uuid.uuid4()
+        logger.info("iter_employment_changed", request_uuid=request_uuid)
+        yield from sd_iter_persons(
+            url,
+            settings=self.settings,
+            params=params,
+            request_uuid=request_uuid,
+            dry_run=self.dry_run,
+            institution_identifier=self.current_inst_id,
+        )
 
+    def _persons_changed_params(
+        self,
+        from_date: datetime.datetime,
+        to_date: datetime.datetime | None = None,
+        cpr: str | None = None,
+    ) -> Dict[str, str]:
         params = {
             "ActivationDate": from_date.strftime("%d.%m.%Y"),
             "ActivationTime": from_date.strftime("%H:%M"),
@@ -344,6 +430,23 @@ class ChangeAtSD:
         if to_date:
             params["DeactivationDate"] = to_date.strftime("%d.%m.%Y")
             params["DeactivationTime"] = to_date.strftime("%H:%M")
+        return params
+
+    def get_sd_persons_changed(
+        self,
+        from_date: datetime.datetime,
+        to_date: datetime.datetime | None = None,
+        cpr: str | None = None,
+    ) -> List[OrderedDict[str, Any]]:
+        """
+        Get list of SD Løn persons that have changed between `from_date`
+        and `to_date`
+
+        Returns:
+            List of SD Løn persons changed between the two dates
+        """
+
+        params = self._persons_changed_params(from_date, to_date, cpr)
 
         request_uuid = uuid.uuid4()
         logger.info("get_sd_persons_changed", request_uuid=request_uuid)
@@ -359,6 +462,62 @@ class ChangeAtSD:
         persons_changed = ensure_list(response.get("Person", []))
         return persons_changed
 
+    def iter_sd_persons_changed(
+        self,
+        from_date: datetime.datetime,
+        to_date: datetime.datetime | None = None,
+        cpr: str | None = None,
+    ) -> Iterator[OrderedDict[str, Any]]:
+        """
+        Streaming version of `get_sd_persons_changed`, which yields the
+        changed SD persons one at a time while the SD response is parsed.
+        """
+
+        params = self._persons_changed_params(from_date, to_date, cpr)
+
+        request_uuid = uuid.uuid4()
+        logger.info("iter_sd_persons_changed", request_uuid=request_uuid)
+        yield from sd_iter_persons(
+            "GetPersonChangedAtDate20111201",
+            settings=self.settings,
+            params=params,
+            request_uuid=request_uuid,
+            dry_run=self.dry_run,
+            institution_identifier=self.current_inst_id,
+        )
+
+    def fetch_employments_changed_in_background(self) -> None:
+        """
+        Start fetching the employments changed in the interval in a background
+        thread, to be used by the next call to `update_all_employments` (for
+        all persons), so the fetch overlaps the fetching and updating of the
+        changed persons.
+        """
+        if self._employments_changed_future is not None:
+            return
+        executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="sd-employments"
+        )
+        # Counted in the statistics of the updater (see sdlon.run_stats)
+        self._employments_changed_future = executor.submit(
+            contextvars.copy_context().run, self.read_employment_changed
+        )
+        executor.shutdown(wait=False)
+
+    def prefetch_changes(self) -> None:
+        """
+        Fetch the persons and employments changed in the interval (at the same
+        time), to be used by the next calls to `update_changed_persons` and
+        `update_all_employments` (for all persons) instead of fetching them
+        from SD there.
+        """
+        self.fetch_employments_changed_in_background()
+        self._persons_changed = self.get_sd_persons_changed(
+            self.from_date, self.to_date
+        )
+        assert self._employments_changed_future is not None
+        self._employments_changed = self._employments_changed_future.result()
+
     def get_sd_person(self, cpr: str) -> List[OrderedDict[str, Any]]:
         """
         Get a single person from SD Løn at `self.from_date`
@@ -418,6 +577,7 @@ class ChangeAtSD:
         )
 
         def fetch_mo_person(person: SDBasePerson) -> MOBasePerson | None:
+            count("persons_processed")
             employee = get_employee(self.mo_graphql_client, person.cpr)
             return employee
 
@@ -461,34 +621,9 @@ class ChangeAtSD:
             assert response.status_code == 201
             logger.info("Added AD account info to user", user_uuid=user_uuid)
 
-        # Fetch a list of persons to update
-        if in_cpr is not None:
-            all_sd_persons_changed = self.get_sd_person(in_cpr)
-        else:
-            all_sd_persons_changed = self.get_sd_persons_changed(
-                self.from_date, self.to_date, changed_at_run_cpr
-            )
-
-        logger.info("Number of changed persons", n=len(all_sd_persons_changed))
-        real_sd_persons_changed = filter(is_valid_cpr, all_sd_persons_changed)
-
-        # Filter employees based on the sd_cprs list
-        sd_cpr_filtered_persons = filter(
-            partial(cpr_env_filter, self.settings), real_sd_persons_changed
-        )
-
-        sd_persons_changed = map(convert_to_sd_base_person, sd_cpr_filtered_persons)
-
-        sd_persons_iter1, sd_persons_iter2 = tee(sd_persons_changed)
-        mo_persons_iter = map(fetch_mo_person, sd_persons_iter2)
-
-        person_pairs = zip(sd_persons_iter1, mo_persons_iter)
-        has_mo_person = itemgetter(1)
-
-        new_pairs, current_pairs = partition(has_mo_person, person_pairs)
-
-        # Update the names of the persons already in MO
-        for sd_person, mo_person in current_pairs:
+        def update_current_person(
+            sd_person: SDBasePerson, mo_person: MOBasePerson
+        ) -> None:
             given_name = sd_person.given_name or (
                 mo_person.givenname if mo_person.givenname is not None else ""
             )
@@ -535,8 +670,7 @@ class ChangeAtSD:
                         UUID(uuid), emp_tni.employment_identifier
                     )
 
-        # Create new SD persons in MO
-        for sd_person, _ in new_pairs:
+        def create_new_person(sd_person: SDBasePerson) -> None:
             given_name = sd_person.given_name or ""
             surname = sd_person.surname or ""
             logger.info(
@@ -575,6 +709,66 @@ class ChangeAtSD:
                         UUID(str(uuid)), emp_tni.employment_identifier
                     )
 
+        # Fetch a list of persons to update
+        streaming = self.settings.sd_streaming_parse and in_cpr is None
+        all_sd_persons_changed: Iterable[OrderedDict[str, Any]]
+        if in_cpr is not None:
+            all_sd_persons_changed = self.get_sd_person(in_cpr)
+        elif self._persons_changed is not None and changed_at_run_cpr is None:
+            all_sd_persons_changed = self._persons_changed
+        elif streaming:
+            all_sd_persons_changed = self.iter_sd_persons_changed(
+                self.from_date, self.to_date, changed_at_run_cpr
+            )
+        else:
+            all_sd_persons_changed = self.get_sd_persons_changed(
+                self.from_date, self.to_date, changed_at_run_cpr
+            )
+
+        if not streaming:
+            logger.info(
+                "Number of changed persons",
+                n=len(cast(list, all_sd_persons_changed)),
+            )
+        real_sd_persons_changed = filter(is_valid_cpr, all_sd_persons_changed)
+
+        # Filter employees based on the sd_cprs list
+        sd_cpr_filtered_persons = filter(
+            partial(cpr_env_filter, self.settings), real_sd_persons_changed
+        )
+
+        sd_persons_changed = map(convert_to_sd_base_person, sd_cpr_filtered_persons)
+
+        if streaming:
+            # Handle the persons one at a time as they are parsed, since
+            # partitioning them (below) would buffer all of them in memory
+            n = 0
+            for sd_person in sd_persons_changed:
+                mo_person = fetch_mo_person(sd_person)
+                if mo_person is not None:
+                    update_current_person(sd_person, mo_person)
+                else:
+                    create_new_person(sd_person)
+                n += 1
+            logger.info("Number of changed persons processed", n=n)
+            return
+
+        sd_persons_iter1, sd_persons_iter2 = tee(sd_persons_changed)
+        mo_persons_iter = map(fetch_mo_person, sd_persons_iter2)
+
+        person_pairs = zip(sd_persons_iter1, mo_persons_iter)
+        has_mo_person = itemgetter(1)
+
+        new_pairs, current_pairs = partition(has_mo_person, person_pairs)
+
+        # Update the names of the persons already in MO
+        for sd_person, mo_person in current_pairs:
+            update_current_person(sd_person, cast(MOBasePerson, mo_person))
+
+        # Create new SD persons in MO
+        for sd_person, _ in new_pairs:
+            create_new_person(sd_person)
+
     def _compare_dates(self, first_date, second_date, expected_diff=1):
         """
         Return true if the amount of days between second and first is smaller
@@ -595,16 +789,22 @@ class ChangeAtSD:
         return compare
 
     def _refresh_mo_engagements(self, person_uuid):
-        self.mo_engagements_cache.pop(person_uuid, None)
+        with self._mo_engagements_lock:
+            self.mo_engagements_cache.pop(person_uuid, None)
 
     def _fetch_mo_engagements(self, person_uuid):
-        if person_uuid in self.mo_engagements_cache:
-            return self.mo_engagements_cache[person_uuid]
+        with self._mo_engagements_lock:
+            if person_uuid in self.mo_engagements_cache:
+                return self.mo_engagements_cache[person_uuid]
 
+        # The persons are updated by one thread each (see
+        # update_all_employments), so the engagements of a person are not
+        # read concurrently
         mo_engagements = self.helper.read_user_engagement(
             person_uuid, read_all=True, only_primary=True, use_cache=False
         )
-        self.mo_engagements_cache[person_uuid] = mo_engagements
+        with self._mo_engagements_lock:
+            self.mo_engagements_cache[person_uuid] = mo_engagements
         return mo_engagements
 
     def _find_last_engagement(self, user_key, person_uuid):
@@ -699,7 +899,12 @@ class ChangeAtSD:
         engagement_type_uuid = self.engagement_types.get(engagement_type_ref)
         if engagement_type_uuid:
             return engagement_type_uuid
-        return self._create_engagement_type(engagement_type_ref, job_position)
+        with self.run_context.classes_lock:
+            # It may have been created by another institution in the meantime
+            engagement_type_uuid = self.engagement_types.get(engagement_type_ref)
+            if engagement_type_uuid:
+                return engagement_type_uuid
+            return self._create_engagement_type(engagement_type_ref, job_position)
 
     def _fetch_professions(self, job_function, job_position):
         """Fetch an job function UUID, create if missing.
@@ -723,7 +928,12 @@ class ChangeAtSD:
         job_uuid = self.job_functions.get(job_function)
         if job_uuid:
             return job_uuid
-        return self._create_professions(job_function, job_position)
+        with self.run_context.classes_lock:
+            # It may have been created by another institution in the meantime
+            job_uuid = self.job_functions.get(job_function)
+            if job_uuid:
+                return job_uuid
+            return self._create_professions(job_function, job_position)
 
     def create_leave(self, status, user_key, person_uuid: str):
         """Create a leave for a user"""
@@ -805,7 +1015,10 @@ class ChangeAtSD:
             org_unit, at=effective_fix_date_str, use_cache=False
         )
         if "status" in ou_info:
-            self.department_fixer.fix_department(org_unit, effective_fix_date)
+            # Fix one department at a time, as the persons may be updated
+            # concurrently (see sd_employment_workers)
+            with self.run_context.departments_lock:
+                self.department_fixer.fix_department(org_unit, effective_fix_date)
             ou_info = self.helper.read_ou(
                 org_unit, at=effective_fix_date_str, use_cache=False
             )
@@ -902,6 +1115,7 @@ class ChangeAtSD:
 
         self._refresh_mo_engagements(person_uuid)
         logger.info("Engagement created", user_key=user_key)
+        count("engagements_created")
 
         if also_edit:
             # This will take of the extra entries
@@ -949,6 +1163,7 @@ class ChangeAtSD:
             self.helper, mo_engagement["uuid"], self.dry_run, from_date, to_date
         )
         self._refresh_mo_engagements(person_uuid)
+        count("engagements_terminated")
 
         return True
 
@@ -1273,7 +1488,12 @@ class ChangeAtSD:
                 create_engagement(self, employment_id, person_uuid, cpr, sd_lookup_date)
             return
 
+        mo_writes = mo_writes_in_thread()
         update_existing_engagement(self, mo_eng, sd_employment, person_uuid)
+        if mo_writes_in_thread() == mo_writes:
+            count("noop_edits")
+        else:
+            count("engagements_edited")
 
     def _handle_employment_status_changes(
         self, cpr: str, sd_employment: OrderedDict, person_uuid: str
@@ -1459,14 +1679,65 @@ class ChangeAtSD:
                 continue
             self.edit_engagement(sd_employment, person_uuid, cpr)
 
-    def update_all_employments(self, in_cpr: Optional[str] = None) -> None:
+    def _get_checkpoints(self) -> Dict[Tuple[str, str], datetime.datetime]:
+        try:
+            return get_checkpoints(self.from_date, self.current_inst_id)
+        except Exception as error:
+            logger.error("Could not read the run checkpoints", error=error)
+            return {}
+
+    def _persist_checkpoint(
+        self, run_id: int, cpr: str, employment_identifiers: List[str]
+    ) -> None:
+        try:
+            persist_checkpoint(
+                run_id,
+                self.from_date,
+                cast(datetime.datetime, self.to_date),
+                self.current_inst_id,
+                cpr,
+                employment_identifiers,
+            )
+        except Exception as error:
+            # The person is just updated again if the run is restarted
+            logger.error("Could not persist the run checkpoint", error=error)
+
+    def update_all_employments(
+        self, in_cpr: Optional[str] = None, run_id: Optional[int] = None
+    ) -> None:
+        """Update the employments of all persons changed in the interval.
+
+        Args:
+            in_cpr: Optional CPR number of a specific person to update.
+            run_id: The RunDB id of the run of the interval. If set (and the
+                interval has a to_date), the updated persons are checkpointed,
+                and the persons checkpointed by earlier runs of the interval
+                are skipped, unless the earlier runs ended before this one.
+        """
+        if in_cpr is not None or self.to_date is None:
+            run_id = None
+        streaming = self.settings.sd_streaming_parse and in_cpr is None
+        employments_changed: Iterable[OrderedDict[str, Any]]
         if in_cpr is not None:
             employments_changed = self.read_employment_changed(in_cpr=in_cpr)
+        elif self._employments_changed is not None:
+            logger.info("Update all employments (prefetched)")
+            employments_changed = self._employments_changed
+        elif self._employments_changed_future is not None:
+            logger.info("Update all employments (fetched in the background)")
+            employments_changed = self._employments_changed_future.result()
+        elif streaming:
+            logger.info("Update all employments (streaming)")
+            employments_changed = self.iter_employment_changed()
         else:
             logger.info("Update all employments")
             employments_changed = self.read_employment_changed()
 
-        logger.info("Number of employments to update", n=len(employments_changed))
+        if not streaming:
+            logger.info(
+                "Number of employments to update",
+                n=len(cast(list, employments_changed)),
+            )
 
         employments_changed = filter(is_valid_cpr, employments_changed)
 
@@ -1475,15 +1746,34 @@ class ChangeAtSD:
             partial(cpr_env_filter, self.settings), employments_changed
         )
 
+        checkpoints = self._get_checkpoints() if run_id is not None else {}
+
         recalculate_users: Set[UUID] = set()
 
-        for employment in employments_changed:
+        def update_person(employment: OrderedDict[str, Any]) -> None:
             cpr = employment["PersonCivilRegistrationIdentifier"]
             sd_employments = ensure_list(employment["Employment"])
             sd_employments = [
                 filtered_professions(employment, self.settings.sd_skip_employment_types)
                 for employment in sd_employments
             ]
+            employment_identifiers = [
+                sd_employment["EmploymentIdentifier"]
+                for sd_employment in sd_employments
+            ]
+
+            # A person updated by an earlier run of a shorter interval may have
+            # changed since
+            if checkpoints and all(
+                checkpoints.get((cpr, employment_identifier), self.from_date)
+                >= cast(datetime.datetime, self.to_date)
+                for employment_identifier in employment_identifiers
+            ):
+                logger.info(
+                    "Skip person updated by an earlier run of the interval",
+                    cpr=anonymize_cpr(cpr),
+                )
+                return
 
             logger.info(30 * "#")
             logger.info("Update employment", cpr=anonymize_cpr(cpr))
@@ -1500,19 +1790,156 @@ class ChangeAtSD:
                     )
                 except Exception as exp:
                     logger.error("Unable to find person in MO", err=exp)
-                    continue
+                    return
 
             if not mo_person:
                 logger.warning("MO person not set!!")
-                continue
+                return
             person_uuid = mo_person["uuid"]
 
             self._refresh_mo_engagements(person_uuid)
             self._update_user_employments(cpr, sd_employments, person_uuid)
+            count("employments_processed", len(sd_employments))
+
+            if run_id is not None:
+                self._persist_checkpoint(run_id, cpr, employment_identifiers)
 
             # Re-calculate primary after all updates for user has been performed.
             recalculate_users.add(person_uuid)
 
+        workers = self.settings.sd_employment_workers
+        if workers == 1:
+            for employment in employments_changed:
+                update_person(employment)
+        else:
+            _update_persons_concurrently(update_person, employments_changed, workers)
+
+
+def _update_persons_concurrently(
+    update_person: Callable[[OrderedDict[str, Any]], None],
+    employments_changed: Iterable[OrderedDict[str, Any]],
+    workers: int,
+) -> None:
+    """
+    Update the persons of the employments changed feed in `workers` threads.
+
+    At most 2 * `workers` persons are submitted at a time, so a streamed feed
+    is consumed only as fast as the persons are updated. The updates of a
+    person appearing more than once in the feed are kept in order. The first
+    error stops the submission of more persons and is raised once the updates
+    in progress have finished.
+    """
+    slots = threading.BoundedSemaphore(2 * workers)
+    pending: Deque[Future] = deque()
+    # The last update submitted for each of the pending persons
+    last_updates: Dict[str, Future] = {}
+
+    def release(future: Future) -> None:
+        slots.release()
+
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="sd-person"
+    ) as executor:
+        try:
+            for employment in employments_changed:
+                cpr = employment["PersonCivilRegistrationIdentifier"]
+                previous_update = last_updates.get(cpr)
+                if previous_update is not None:
+                    previous_update.result()
+
+                slots.acquire()
+                future = executor.submit(
+                    contextvars.copy_context().run, update_person, employment
+                )
+                future.add_done_callback(release)
+                pending.append(future)
+                last_updates[cpr] = future
+
+                # Raise the errors of the finished updates
+                still_pending: Deque[Future] = deque()
+                for update in pending:
+                    if update.done():
+                        update.result()
+                    else:
+                        still_pending.append(update)
+                pending = still_pending
+                last_updates = {
+                    cpr: update
+                    for cpr, update in last_updates.items()
+                    if not update.done()
+                }
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+    for future in pending:
+        future.result()
+
+
+def _persist_run_stats(run_id: int, sd_updater: ChangeAtSD) -> None:
+    try:
+        persist_run_stats(
+            run_id,
+            sd_updater.current_inst_id,
+            sd_updater.from_date,
+            sd_updater.to_date,
+            sd_updater.stats.as_dict(),
+        )
+    except Exception as error:
+        logger.error("Could not persist the run statistics", error=error)
+
+
+def _update_institutions(
+    sd_updaters: Iterable[ChangeAtSD], workers: int, run_id: Optional[int] = None
+) -> None:
+    """
+    Update the changed persons and all employments with each of the updaters
+    (one per institution), in `workers` threads if more than one. The
+    employment updates are checkpointed in the run with the run_id, if set.
+
+    All of the updates are run to the end, even if some of them fail, after
+    which the first error (if any) is raised.
+    """
+
+    def update(sd_updater: ChangeAtSD) -> None:
+        inst_id = sd_updater.current_inst_id
+        logger.info("Start ChangedAt", inst_id=inst_id)
+
+        stats = sd_updater.stats
+        try:
+            with stats.activate():
+                if sd_updater.settings.sd_fetch_changes_concurrently:
+                    sd_updater.fetch_employments_changed_in_background()
+
+                logger.info("Update changed persons", inst_id=inst_id)
+                with stats.timed("persons"):
+                    sd_updater.update_changed_persons()
+
+                logger.info("Update all employments", inst_id=inst_id)
+                with stats.timed("employments"):
+                    sd_updater.update_all_employments(run_id=run_id)
+        finally:
+            if run_id is not None:
+                _persist_run_stats(run_id, sd_updater)
+
+        logger.info("Ended ChangedAt", inst_id=inst_id)
+
+    if workers == 1:
+        for sd_updater in sd_updaters:
+            update(sd_updater)
+        return
+
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="sd-institution"
+    ) as executor:
+        futures = [executor.submit(update, sd_updater) for sd_updater in sd_updaters]
+
+    errors = [error for error in (future.exception() for future in futures) if error]
+    for error in errors:
+        logger.error("Could not update institution", error=error)
+    if errors:
+        raise errors[0]
+
 
 def initialize_changed_at(from_date):
     persist_status(from_date, from_date, RunDBState.RUNNING)
@@ -1521,12 +1948,12 @@ def initialize_changed_at(from_date):
 
     logger.info("Start initialization run")
 
-    for inst_id in inst_ids:
-        logger.info("Start initial ChangedAt", inst_id=inst_id)
-        sd_updater = ChangeAtSD(settings, inst_id, from_date)
-        sd_updater.update_changed_persons()
-        sd_updater.update_all_employments()
-        logger.info("Ended initial ChangedAt", inst_id=inst_id)
+    run_context = RunContext()
+    sd_updaters = (
+        ChangeAtSD(settings, inst_id, from_date, run_context=run_context)
+        for inst_id in inst_ids
+    )
+    _update_institutions(sd_updaters, settings.sd_institution_workers)
 
     persist_status(from_date, from_date, RunDBState.COMPLETED)
 
@@ -1563,6 +1990,74 @@ def changed_at_init():
     initialize_changed_at(from_date)
 
 
+def _iter_interval_updaters(
+    settings: Settings,
+    inst_ids: List[str],
+    dates: Iterable[Tuple[datetime.datetime, datetime.datetime]],
+    run_context: RunContext,
+) -> Iterator[Tuple[datetime.datetime, datetime.datetime, Iterable[ChangeAtSD]]]:
+    """
+    The day intervals of a changed-at run and the updaters of each institution
+    for each interval.
+
+    If sd_prefetch_intervals is set, the updaters of the next intervals are
+    created and their SD change feeds fetched in a background thread, one
+    interval at a time, while the updaters of the current interval write to
+    MO. Otherwise the updaters are created when iterated.
+    """
+
+    def create_updater(
+        from_date: datetime.datetime, to_date: datetime.datetime, inst_id: str
+    ) -> ChangeAtSD:
+        logger.info(
+            "Initialize ChangedAtSD class",
+            from_date=from_date,
+            to_date=to_date,
+            inst_id=inst_id,
+        )
+        return ChangeAtSD(
+            settings, inst_id, from_date, to_date, run_context=run_context
+        )
+
+    if settings.sd_prefetch_intervals == 0:
+        for from_date, to_date in dates:
+            yield (
+                from_date,
+                to_date,
+                map(partial(create_updater, from_date, to_date), inst_ids),
+            )
+        return
+
+    def prefetch(
+        from_date: datetime.datetime, to_date: datetime.datetime
+    ) -> List[ChangeAtSD]:
+        sd_updaters = []
+        for inst_id in inst_ids:
+            sd_updater = create_updater(from_date, to_date, inst_id)
+            logger.info("Prefetch SD changes", from_date=from_date, inst_id=inst_id)
+            with sd_updater.stats.activate():
+                sd_updater.prefetch_changes()
+            sd_updaters.append(sd_updater)
+        return sd_updaters
+
+    pending: Deque[Tuple[datetime.datetime, datetime.datetime, Future]] = deque()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sd-prefetch")
+    try:
+        for from_date, to_date in dates:
+            pending.append(
+                (from_date, to_date, executor.submit(prefetch, from_date, to_date))
+            )
+            # The current interval and sd_prefetch_intervals intervals ahead
+            if len(pending) > settings.sd_prefetch_intervals:
+                from_date, to_date, future = pending.popleft()
+                yield from_date, to_date, future.result()
+        while pending:
+            from_date, to_date, future = pending.popleft()
+            yield from_date, to_date, future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
 def changed_at(
     dipex_last_success_timestamp: Gauge,
     sd_changed_at_state: Enum,
@@ -1598,25 +2093,29 @@ def changed_at(
 
     from_date = get_run_db_from_date()
     to_date = datetime.datetime.now(tz=ZoneInfo("Europe/Copenhagen"))
-    dates = gen_date_intervals(from_date, to_date)
-    for from_date, to_date in dates:
-        persist_status(from_date, to_date, RunDBState.RUNNING)
-
-        for inst_id in inst_ids:
-            logger.info(
-                "Initialize ChangedAtSD class",
-                from_date=from_date,
-                to_date=to_date,
-                inst_id=inst_id,
-            )
-            sd_updater = ChangeAtSD(settings, inst_id, from_date, to_date)  # type: ignore
-
-            logger.info("Update changed persons")
-            sd_updater.update_changed_persons()
+    resume_to_date = get_resume_to_date(from_date)
+    dates: Iterable[Tuple[datetime.datetime, datetime.datetime]]
+    if resume_to_date is not None and resume_to_date < to_date:
+        # Resume the interrupted run of the interval, so its checkpoints apply
+        logger.info("Resume interrupted run", to_date=resume_to_date)
+        dates = chain(
+            [(from_date, resume_to_date)],
+            gen_date_intervals(resume_to_date, to_date),
+        )
+    else:
+        dates = gen_date_intervals(from_date, to_date)
+    run_context = RunContext()
+    for from_date, to_date, sd_updaters in _iter_interval_updaters(
+        settings, inst_ids, dates, run_context
+    ):
+        run_id = persist_status(from_date, to_date, RunDBState.RUNNING)
 
-            logger.info("Update all employments")
-            sd_updater.update_all_employments()
+        _update_institutions(sd_updaters, settings.sd_institution_workers, run_id)
 
+        payload_writer = get_payload_writer(settings)
+        if payload_writer is not None:
+            # Persist the payloads of the interval before marking it completed
+            payload_writer.flush()
         persist_status(from_date, to_date, RunDBState.COMPLETED)
 
     dipex_last_success_timestamp.set_to_current_time()
@@ -1687,14 +2186,26 @@ def import_single_user(
     default=None,
     help="The SD InstitutionIdentifier",
 )
+@click.option(
+    "--replay-from",
+    type=click.DateTime(),
+    help="Serve the SD lookups from the payloads persisted from this date",
+)
+@click.option(
+    "--replay-to",
+    type=click.DateTime(),
+    help="Serve the SD lookups from the payloads persisted until this date",
+)
 def date_interval_run(
     from_date: datetime.datetime,
     to_date: datetime.datetime,
     cpr: str,
     dry_run: bool,
     institution_identifier: str | None,
+    replay_from: datetime.datetime | None,
+    replay_to: datetime.datetime | None,
 ):
-    settings = get_settings()
+    settings = get_settings(sd_replay_from=replay_from, sd_replay_to=replay_to)
     setup_logging(
         settings.log_level,
         settings.log_to_file,
@@ -1721,5 +2232,83 @@ def date_interval_run(
     logger.info("Date interval run finished")
 
 
+@cli.command()
+@click.option(
+    "--from-date",
+    type=click.DateTime(),
+    required=True,
+    help="Replay the runs which ended at or after this date",
+)
+@click.option(
+    "--to-date",
+    type=click.DateTime(),
+    required=True,
+    help="Replay the runs which ended before this date",
+)
+@click.option(
+    "--cpr", help="CPR as 10 digits if the replay should be for a single user"
+)
+@click.option(
+    "--dry-run", is_flag=True, help="If flag is set, no changes will be made to MO"
+)
+def replay(
+    from_date: datetime.datetime,
+    to_date: datetime.datetime,
+    cpr: str | None,
+    dry_run: bool,
+):
+    """
+    Re-run the completed changed-at runs which ended in the period against MO,
+    serving the SD lookups of each run from the payloads persisted while it was
+    running instead of calling SD. The payloads of the runs persisted before
+    the runs were timestamped are taken from the whole period. The RunDB is
+    left untouched.
+    """
+    settings = get_settings()
+    setup_logging(
+        settings.log_level,
+        settings.log_to_file,
+        settings.log_file,
+        settings.log_file_backup_count,
+    )
+
+    logger.info("Replay started")
+
+    inst_ids = ensure_list(settings.sd_institution_identifier)
+    for run in get_completed_runs(from_date, to_date):
+        if run.started is not None and run.finished is not None:
+            run_settings = get_settings(
+                sd_replay_from=run.started, sd_replay_to=run.finished
+            )
+        else:
+            run_settings = get_settings(sd_replay_from=from_date, sd_replay_to=to_date)
+        # The objects of the run context (e.g. the FixDepartments of each
+        # institution) call SD with the settings of the run, i.e. replay its
+        # payloads, so they are not shared with the other runs
+        run_context = RunContext()
+        for inst_id in inst_ids:
+            logger.info(
+                "Replay run",
+                from_date=run.from_date,
+                to_date=run.to_date,
+                inst_id=inst_id,
+                replay_from=run_settings.sd_replay_from,
+                replay_to=run_settings.sd_replay_to,
+            )
+            sd_updater = ChangeAtSD(
+                run_settings,
+                inst_id,
+                run.from_date,
+                run.to_date,
+                dry_run,
+                run_context=run_context,
+            )
+
+            sd_updater.update_changed_persons(changed_at_run_cpr=cpr)
+            sd_updater.update_all_employments(in_cpr=cpr)
+
+    logger.info("Replay finished")
+
+
 if __name__ == "__main__":
     cli()
@@ -1,26 +1,230 @@
 import datetime
 import hashlib
+import json
+import tempfile
+import time
 import uuid
 from enum import Enum
+from typing import IO
 from typing import Any
 from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import NoReturn
 from typing import Optional
 from typing import OrderedDict
+from typing import Tuple
 from typing import Union
+from xml.parsers.expat import ExpatError
 
 import requests
 import xmltodict
+from lxml import etree
 from structlog.stdlib import get_logger
 
+from db.payload_writer import get_payload_writer
 from db.queries import log_payload
 
 from .config import Settings
 from .exceptions import SDEmploymentNotFound
+from .metrics import sd_employment_not_found
+from .metrics import sd_error_envelopes
+from .metrics import sd_parse_duration
+from .metrics import sd_request_duration
+from .metrics import sd_response_size
+from .run_stats import count_sd_call
+from .sd_cache import get_sd_cache
+from .sd_rate_limit import get_sd_rate_limiter
+from .sd_session import RETRY_STATUS_CODES
+from .sd_session import get_sd_session
+from .sd_session import get_sd_timeout
+from .single_flight import SingleFlight
 
 logger = get_logger()
 
 
+_in_flight_sd_lookups = SingleFlight()
+
+# Size of the chunks read from SD when streaming a response
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _get_sd_payload(
+    settings: Settings,
+    params: Optional[Dict[str, Any]],
+    institution_identifier: str | None,
+) -> Dict[str, Any]:
+    payload = {
+        "InstitutionIdentifier": institution_identifier
+        if institution_identifier is not None
+        else settings.sd_institution_identifier
+    }
+    payload.update(params or dict())
+    return payload
+
+
+def get_sd_url(sd_base_url: str, url: str) -> str:
+    """The full URL of an SD endpoint, e.g. GetEmployment20111201."""
+    return sd_base_url.rstrip("/") + "/" + url
+
+
+def _get_sd_response(
+    url: str,
+    settings: Settings,
+    params: Optional[Dict[str, Any]],
+    institution_identifier: str | None,
+    stream: bool = False,
+) -> Tuple[str, Dict[str, Any], requests.Response]:
+    full_url = get_sd_url(settings.sd_base_url, url)
+
+    payload = _get_sd_payload(settings, params, institution_identifier)
+    auth = (settings.sd_user, settings.sd_password.get_secret_value())
+
+    # Counted here rather than in sd_lookup, so the lookups served from the SD
+    # cache or shared with an identical lookup in flight are not counted
+    count_sd_call(url)
+    session = get_sd_session(settings)
+    rate_limiter = get_sd_rate_limiter(settings, str(payload["InstitutionIdentifier"]))
+    # With rate limiting, the session does not retry (see get_sd_session), as
+    # every attempt must take a token, so the transient errors are retried here
+    retries = settings.sd_http_retries if rate_limiter is not None else 0
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = session.get(
+                full_url,
+                params=payload,
+                auth=auth,
+                timeout=get_sd_timeout(settings),
+                stream=stream,
+            )
+        except requests.ConnectionError:
+            if attempt == retries:
+                raise
+        else:
+            if attempt == retries or response.status_code not in RETRY_STATUS_CODES:
+                break
+            response.close()
+        finally:
+            sd_request_duration.labels(url, payload["InstitutionIdentifier"]).observe(
+                time.perf_counter() - start
+            )
+        logger.warning("Retry SD request", url=url, attempt=attempt + 1)
+        if rate_limiter is not None:
+            rate_limiter.throttled()
+        # Back off exponentially between the attempts, as the session does
+        time.sleep(settings.sd_http_retry_backoff_factor * 2**attempt)
+    return full_url, payload, response
+
+
+def _should_persist(settings: Settings, dry_run: bool) -> bool:
+    # The replayed payloads are already persisted
+    return (
+        settings.sd_persist_payloads and not dry_run and settings.sd_replay_from is None
+    )
+
+
+def _persist_payload(
+    settings: Settings,
+    request_uuid: uuid.UUID,
+    full_url: str,
+    payload: Dict[str, Any],
+    response: requests.Response,
+    response_text: Union[str, IO[bytes]],
+) -> None:
+    try:
+        # The payload writer persists the payload in the background, if enabled
+        payload_writer = get_payload_writer(settings)
+        persist = payload_writer.put if payload_writer is not None else log_payload
+        persist(
+            request_uuid=request_uuid,
+            full_url=full_url,
+            params=str(payload),
+            response=response_text,
+            status_code=response.status_code,
+            compress=settings.sd_compress_payloads,
+        )
+    except Exception:
+        logger.exception("could not save SD response to payload database")
+
+
+def _is_employment_not_found(response_text: str) -> bool:
+    # Hack - don't worry about it. Will soon deploy the new SD integration :-)
+    return (
+        "The stated EmploymentIdentifier" in response_text
+        and "does not exist" in response_text
+    )
+
+
+def _report_sd_health(
+    settings: Settings,
+    payload: Dict[str, Any],
+    response: requests.Response,
+    response_text: str,
+    is_error_envelope: bool,
+) -> None:
+    """
+    Adapt the SD rate limit (if enabled) to the outcome of a request. 5xx
+    responses, 429 and error envelopes are taken as signs of SD being
+    overloaded, except for the expected "employment not found" envelope, which
+    SD returns with status 500.
+    """
+    rate_limiter = get_sd_rate_limiter(settings, str(payload["InstitutionIdentifier"]))
+    if rate_limiter is None:
+        return
+    if is_error_envelope and _is_employment_not_found(response_text):
+        rate_limiter.succeeded()
+    elif (
+        response.status_code >= 500 or response.status_code == 429 or is_error_envelope
+    ):
+        rate_limiter.throttled()
+    else:
+        rate_limiter.succeeded()
+
+
+def _parse_sd_response(
+    url: str,
+    settings: Settings,
+    payload: Dict[str, Any],
+    response: requests.Response,
+    response_text: str,
+) -> OrderedDict:
+    labels = (url, payload["InstitutionIdentifier"])
+    sd_response_size.labels(*labels).observe(len(response_text.encode("utf-8")))
+    start = time.perf_counter()
+    try:
+        dict_response = xmltodict.parse(response_text)
+    except ExpatError:
+        # SD sometimes responds with an HTML error page when overloaded
+        logger.error("Could not parse SD response", response=response_text)
+        _report_sd_health(settings, payload, response, response_text, True)
+        raise
+    finally:
+        sd_parse_duration.labels(*labels).observe(time.perf_counter() - start)
+    _report_sd_health(
+        settings, payload, response, response_text, url not in dict_response
+    )
+    return dict_response
+
+
+def _raise_sd_api_error(
+    url: str,
+    payload: Dict[str, Any],
+    dict_response: OrderedDict,
+    response_text: str,
+) -> NoReturn:
+    msg = "SD api error, envelope: {}, response: {}"
+    logger.error(msg.format(dict_response["Envelope"], response_text))
+    labels = (url, payload["InstitutionIdentifier"])
+    sd_error_envelopes.labels(*labels).inc()
+    if _is_employment_not_found(response_text):
+        sd_employment_not_found.labels(*labels).inc()
+        raise SDEmploymentNotFound()
+    raise Exception(msg.format(dict_response["Envelope"], response_text))
+
+
 def sd_lookup(
     url: str,
     settings: Settings,
@@ -29,59 +233,175 @@ def sd_lookup(
     dry_run: bool = False,
     institution_identifier: str | None = None,
 ) -> OrderedDict:
-    """Fire a requests against SD."""
+    """
+    Fire a requests against SD.
+
+    If the SD cache is enabled, the responses from the slowly changing
+    endpoints are served from the cache when possible (see `SDCache`).
+    Identical concurrent lookups share a single request to SD and a single
+    parsed response (only the first request is persisted).
+
+    The latency, response size and parse time of the requests to SD and the
+    error envelopes returned are recorded as Prometheus metrics (see
+    `sdlon.metrics`), labelled by endpoint and institution, and the requests
+    to SD are counted in the active RunStats (see `sdlon.run_stats`).
+    """
+    payload = _get_sd_payload(settings, params, institution_identifier)
+    key = (
+        get_sd_url(settings.sd_base_url, url),
+        settings.sd_user,
+        json.dumps(payload, sort_keys=True, default=str),
+        dry_run,
+    )
+    return _in_flight_sd_lookups.do(
+        key,
+        _sd_lookup,
+        url,
+        settings,
+        params,
+        request_uuid,
+        dry_run,
+        institution_identifier,
+    )
+
+
+def _sd_lookup(
+    url: str,
+    settings: Settings,
+    params: Optional[Dict[str, Any]],
+    request_uuid: uuid.UUID,
+    dry_run: bool,
+    institution_identifier: str | None,
+) -> OrderedDict:
     # TODO: this could potentially log CPRs - to be fixed
     logger.info("Retrieve: {}".format(url))
     logger.debug("Params: {}".format(params))
 
-    params = params or dict()
-
-    BASE_URL = "https://service.sd.dk/sdws/"
-    full_url = BASE_URL + url
-
-    payload = {
-        "InstitutionIdentifier": institution_identifier
-        if institution_identifier is not None
-        else settings.sd_institution_identifier
-    }
-    payload.update(params)
-    auth = (settings.sd_user, settings.sd_password.get_secret_value())
-    response = requests.get(
-        full_url,
-        params=payload,
-        auth=auth,
+    cache = get_sd_cache(settings)
+    cache_params = _get_sd_payload(settings, params, institution_identifier)
+    response_text = (
+        cache.get(url, settings, cache_params) if cache is not None else None
     )
 
-    if settings.sd_persist_payloads and not dry_run:
-        try:
-            log_payload(
-                request_uuid=request_uuid,
-                full_url=full_url,
-                params=str(payload),
-                response=response.text,
-                status_code=response.status_code,
+    if response_text is not None:
+        dict_response = xmltodict.parse(response_text)
+    else:
+        full_url, payload, response = _get_sd_response(
+            url, settings, params, institution_identifier
+        )
+        response_text = response.text
+
+        if _should_persist(settings, dry_run):
+            _persist_payload(
+                settings, request_uuid, full_url, payload, response, response_text
             )
-        except Exception:
-            logger.exception("could not save SD response to payload database")
 
-    dict_response = xmltodict.parse(response.text)
+        dict_response = _parse_sd_response(
+            url, settings, payload, response, response_text
+        )
+        if cache is not None and url in dict_response:
+            cache.set(url, settings, cache_params, response_text)
 
     if url in dict_response:
         xml_response = dict_response[url]
     else:
-        msg = "SD api error, envelope: {}, response: {}"
-        logger.error(msg.format(dict_response["Envelope"], response.text))
-        # Hack - don't worry about it. Will soon deploy the new SD integration :-)
-        if (
-            "The stated EmploymentIdentifier" in response.text
-            and "does not exist" in response.text
-        ):
-            raise SDEmploymentNotFound()
-        raise Exception(msg.format(dict_response["Envelope"], response.text))
+        _raise_sd_api_error(url, cache_params, dict_response, response_text)
     logger.debug("Done with {}".format(url))
     return xml_response
 
 
+def sd_iter_persons(
+    url: str,
+    settings: Settings,
+    params: Optional[Dict[str, Any]] = None,
+    request_uuid: uuid.UUID = uuid.uuid4(),
+    dry_run: bool = False,
+    institution_identifier: str | None = None,
+) -> Iterator[OrderedDict]:
+    """
+    Fire a request against SD and yield the top level Person elements of the
+    response one at a time as they are parsed.
+
+    The response is downloaded to a temporary file first, so the connection
+    to SD is not held open while the yielded persons are processed, and then
+    parsed incrementally from the file. Contrary to `sd_lookup`, the response
+    is never held in memory as a whole, so the memory usage is proportional
+    to a single Person instead of to the full response, also when the payload
+    is persisted (see `db.payload_body`). The yielded persons are identical
+    to the elements of `ensure_list(sd_lookup(...).get("Person", []))`.
+    """
+    logger.info("Retrieve (streaming): {}".format(url))
+    logger.debug("Params: {}".format(params))
+
+    full_url, payload, response = _get_sd_response(
+        url, settings, params, institution_identifier, stream=True
+    )
+    labels = (url, payload["InstitutionIdentifier"])
+
+    with tempfile.TemporaryFile() as response_file:
+        with response:
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                response_file.write(chunk)
+        sd_response_size.labels(*labels).observe(response_file.tell())
+
+        if _should_persist(settings, dry_run):
+            _persist_payload(
+                settings, request_uuid, full_url, payload, response, response_file
+            )
+
+        # The time spent parsing, i.e. excluding the time spent by the caller
+        # processing the yielded persons
+        parse_seconds = 0.0
+        parsing = True
+        start = time.perf_counter()
+        try:
+            response_file.seek(0)
+            context = etree.iterparse(response_file, events=("start", "end"))
+            _, root = next(context)
+
+            if etree.QName(root).localname != url:
+                # Read the rest of the (small) error envelope before raising
+                for _ in context:
+                    pass
+                response_text = etree.tostring(root, encoding="unicode")
+                _report_sd_health(settings, payload, response, response_text, True)
+                _raise_sd_api_error(
+                    url, payload, xmltodict.parse(response_text), response_text
+                )
+
+            _report_sd_health(settings, payload, response, "", False)
+            for event, elem in context:
+                if event != "end" or elem.getparent() is not root:
+                    continue
+                if etree.QName(elem).localname == "Person":
+                    person = xmltodict.parse(etree.tostring(elem, with_tail=False))
+                    parse_seconds += time.perf_counter() - start
+                    parsing = False
+                    yield person["Person"]
+                    parsing = True
+                    start = time.perf_counter()
+                # Free the memory used by the elements processed so far
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del root[0]
+        except etree.XMLSyntaxError:
+            # SD sometimes responds with an HTML error page when overloaded
+            response_file.seek(0)
+            logger.error(
+                "Could not parse SD response",
+                response=response_file.read(STREAM_CHUNK_SIZE).decode(
+                    "utf-8", errors="replace"
+                ),
+            )
+            _report_sd_health(settings, payload, response, "", True)
+            raise
+        finally:
+            if parsing:
+                parse_seconds += time.perf_counter() - start
+            sd_parse_duration.labels(*labels).observe(parse_seconds)
+    logger.debug("Done with {}".format(url))
+
+
 def calc_employment_id(employment):
     employment_id = employment["EmploymentIdentifier"]
     try:
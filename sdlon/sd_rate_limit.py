@@ -0,0 +1,126 @@
+import threading
+import time
+from functools import lru_cache
+
+from structlog.stdlib import get_logger
+
+from .config import Settings
+from .metrics import sd_rate_limit
+
+logger = get_logger()
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket rate limiter with AIMD (additive increase, multiplicative
+    decrease) adaptation of the rate.
+
+    Every call to SD must `acquire` a token first. The bucket is refilled
+    with `rate` tokens per second and holds at most `burst` tokens. When SD
+    signals that it is overloaded (see `throttled`) the rate is multiplied by
+    `decrease_factor`, and for every healthy response (see `succeeded`) it is
+    increased by `increase`, always staying within `[min_rate, max_rate]`.
+    """
+
+    def __init__(
+        self,
+        max_rate: float,
+        min_rate: float,
+        burst: int,
+        increase: float,
+        decrease_factor: float,
+        name: str = "",
+    ):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.burst = burst
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.name = name
+
+        self.rate = max_rate
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        sd_rate_limit.labels(institution=name).set(self.rate)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.burst), self._tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
+
+    def acquire(self) -> None:
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def _set_rate(self, rate: float) -> None:
+        with self._lock:
+            # Refill with the old rate before changing it
+            self._refill()
+            self.rate = min(self.max_rate, max(self.min_rate, rate))
+        sd_rate_limit.labels(institution=self.name).set(self.rate)
+
+    def succeeded(self) -> None:
+        """Register a healthy response from SD."""
+        if self.rate < self.max_rate:
+            self._set_rate(self.rate + self.increase)
+
+    def throttled(self) -> None:
+        """Register that SD is overloaded, i.e. a 5xx or error response."""
+        self._set_rate(self.rate * self.decrease_factor)
+        logger.warning(
+            "SD is overloaded, lowering the request rate",
+            institution=self.name,
+            rate=self.rate,
+        )
+
+
+@lru_cache(maxsize=None)
+def _create_rate_limiter(
+    institution_identifier: str,
+    max_rate: float,
+    min_rate: float,
+    burst: int,
+    increase: float,
+    decrease_factor: float,
+) -> AdaptiveRateLimiter:
+    return AdaptiveRateLimiter(
+        max_rate, min_rate, burst, increase, decrease_factor, institution_identifier
+    )
+
+
+def get_sd_rate_limiter(
+    settings: Settings, institution_identifier: str
+) -> AdaptiveRateLimiter | None:
+    """
+    Get the process wide rate limiter for the calls to SD for the given
+    institution.
+
+    Args:
+        settings: the application settings
+        institution_identifier: the SD institution identifier
+
+    Returns:
+        The rate limiter or None if rate limiting is disabled
+    """
+    if not settings.sd_rate_limit_enabled:
+        return None
+    return _create_rate_limiter(
+        institution_identifier,
+        settings.sd_rate_limit_per_institution.get(
+            institution_identifier, settings.sd_rate_limit
+        ),
+        settings.sd_rate_limit_min,
+        settings.sd_rate_limit_burst,
+        settings.sd_rate_limit_increase,
+        settings.sd_rate_limit_decrease_factor,
+    )
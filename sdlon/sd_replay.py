@@ -0,0 +1,215 @@
+"""
+Replay of the SD responses persisted in the payload DB.
+
+In replay mode (see the sd_replay_* settings), the SD lookups are served from
+the payloads persisted in a given period instead of calling SD, e.g. for
+re-running a changed-at run against MO with the payloads persisted while it
+was running (see the `replay` command in sd_changed_at). The replay is plugged
+in as the transport adapter of the SD session, so the lookups (including the
+streamed ones) otherwise work as usual.
+"""
+
+import ast
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from datetime import timezone
+from functools import lru_cache
+from io import BytesIO
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from urllib.parse import parse_qsl
+from urllib.parse import urlsplit
+from uuid import UUID
+
+import requests
+from requests.adapters import BaseAdapter
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from structlog.stdlib import get_logger
+
+from db.compression import payload_response
+from db.engine import get_engine
+from db.models import Payload
+from db.payload_body import join_payload_body
+from db.payload_body import payload_response_column
+from db.payload_body import payload_response_compressed_column
+
+from .config import Settings
+
+logger = get_logger()
+
+RequestKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class ReplayMissError(Exception):
+    """No payload was persisted for the SD request being replayed."""
+
+
+def _normalize_value(value: Any) -> str:
+    # Sequences are sent as repeated query parameters, of which only the first
+    # is compared
+    if isinstance(value, (list, tuple)):
+        return str(value[0]) if value else ""
+    return str(value)
+
+
+def request_key(endpoint: str, params: Dict[str, Any]) -> RequestKey:
+    """
+    The key of an SD request, which is the same for the (stringified) params
+    persisted with a payload and the query parameters of the request.
+    """
+    return endpoint, tuple(
+        sorted((key, _normalize_value(value)) for key, value in params.items())
+    )
+
+
+class RecordedPayload(NamedTuple):
+    id: UUID
+    timestamp: datetime
+    status_code: int
+
+
+def _split_period(
+    from_date: datetime, to_date: datetime, parts: int
+) -> List[Tuple[datetime, datetime]]:
+    step = (to_date - from_date) / parts
+    bounds = [from_date + step * i for i in range(parts)] + [to_date]
+    return list(zip(bounds, bounds[1:]))
+
+
+class ReplaySD:
+    """
+    The payloads persisted in the period [from_date, to_date), indexed by the
+    SD request, where later payloads take precedence.
+
+    Only the index of the payloads is preloaded, in bulk by splitting the
+    period into one part per worker thread, each loading its part in a
+    separate DB session. The responses are loaded when requested, so the
+    responses of the period are never all held in memory.
+    """
+
+    def __init__(
+        self, engine: Engine, from_date: datetime, to_date: datetime, workers: int
+    ):
+        self.engine = engine
+        self.payloads: Dict[RequestKey, RecordedPayload] = {}
+
+        periods = _split_period(from_date, to_date, workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for payloads in executor.map(self._load, periods):
+                for key, payload in payloads.items():
+                    current = self.payloads.get(key)
+                    if current is None or current.timestamp <= payload.timestamp:
+                        self.payloads[key] = payload
+        logger.info(
+            "Preloaded SD payloads for replay",
+            count=len(self.payloads),
+            from_date=from_date,
+            to_date=to_date,
+        )
+
+    def _load(
+        self, period: Tuple[datetime, datetime]
+    ) -> Dict[RequestKey, RecordedPayload]:
+        stmt = (
+            select(
+                Payload.id,
+                Payload.timestamp,
+                Payload.full_url,
+                Payload.params,
+                Payload.status_code,
+            )
+            .where(Payload.timestamp >= period[0], Payload.timestamp < period[1])
+            .order_by(Payload.timestamp)
+        )
+        payloads: Dict[RequestKey, RecordedPayload] = {}
+        with Session(self.engine) as session:
+            rows = session.execute(stmt.execution_options(yield_per=1000))
+            for payload_id, timestamp, full_url, params, status_code in rows:
+                try:
+                    parsed_params = ast.literal_eval(params)
+                except (ValueError, SyntaxError):
+                    logger.warning("Could not parse payload params", url=full_url)
+                    continue
+                endpoint = full_url.rsplit("/", 1)[-1]
+                payloads[request_key(endpoint, parsed_params)] = RecordedPayload(
+                    payload_id, timestamp, status_code or 200
+                )
+        return payloads
+
+    def _load_response(self, payload: RecordedPayload) -> Optional[str]:
+        stmt = join_payload_body(
+            select(payload_response_column, payload_response_compressed_column)
+        ).where(
+            Payload.id == payload.id,
+            # Limits the lookup to the partition of the payload
+            Payload.timestamp == payload.timestamp,
+        )
+        with Session(self.engine) as session:
+            response, response_compressed = session.execute(stmt).one()
+        return payload_response(response, response_compressed)
+
+    def respond(self, endpoint: str, params: Dict[str, Any]) -> Tuple[int, str]:
+        payload = self.payloads.get(request_key(endpoint, params))
+        if payload is None:
+            raise ReplayMissError(f"No persisted payload for {endpoint} {params}")
+        return payload.status_code, self._load_response(payload) or ""
+
+
+class ReplayAdapter(BaseAdapter):
+    """Requests transport adapter answering the SD requests from `ReplaySD`."""
+
+    def __init__(self, replay_sd: ReplaySD):
+        super().__init__()
+        self.replay_sd = replay_sd
+
+    def send(self, request, stream=False, timeout=None, **kwargs):
+        url = urlsplit(request.url)
+        endpoint = url.path.rsplit("/", 1)[-1]
+        status_code, content = self.replay_sd.respond(
+            endpoint, dict(parse_qsl(url.query, keep_blank_values=True))
+        )
+
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers["Content-Type"] = "application/xml; charset=utf-8"
+        response.encoding = "utf-8"
+        response.raw = BytesIO(content.encode("utf-8"))
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+# Only the session of the period being replayed is kept, as the replay command
+# replays one run (period) at a time
+@lru_cache(maxsize=1)
+def _create_replay_session(
+    from_date: datetime, to_date: Optional[datetime], workers: int
+) -> requests.Session:
+    to_date = to_date or datetime.now(timezone.utc)
+    adapter = ReplayAdapter(ReplaySD(get_engine(), from_date, to_date, workers))
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_replay_session(settings: Settings) -> requests.Session:
+    """
+    Get the process wide session replaying the payloads persisted in the
+    period given by the settings (up until now if no end is given).
+    """
+    assert settings.sd_replay_from is not None
+    return _create_replay_session(
+        settings.sd_replay_from,
+        settings.sd_replay_to,
+        settings.sd_replay_preload_workers,
+    )
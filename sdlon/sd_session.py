@@ -0,0 +1,81 @@
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .config import Settings
+
+# Transient server errors which are worth retrying. SD returns these when the
+# service is (temporarily) overloaded or restarting. 500 is not retried, since
+# SD returns its error envelopes (SOAP faults), including the expected
+# "employment not found", with that status code.
+RETRY_STATUS_CODES = (502, 503, 504)
+
+
+@lru_cache(maxsize=None)
+def _create_sd_session(
+    pool_connections: int,
+    pool_maxsize: int,
+    retries: int,
+    backoff_factor: float,
+) -> requests.Session:
+    retry = Retry(
+        total=retries,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["GET"]),
+        backoff_factor=backoff_factor,
+        # Return the last response instead of raising, so that sd_lookup can
+        # log (and persist) the SD error envelope
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry,
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    return session
+
+
+def get_sd_session(settings: Settings) -> requests.Session:
+    """
+    Get the process wide HTTP session used for calling SD.
+
+    The session keeps the connections to SD alive between requests, so we
+    only pay for the TCP and TLS handshakes once per pooled connection. It
+    retries transient errors, unless the SD rate limiter is enabled.
+
+    In replay mode, the session answers the requests from the payloads
+    persisted in the payload DB instead (see `sdlon.sd_replay`).
+
+    Args:
+        settings: the application settings
+
+    Returns:
+        The shared SD session
+    """
+    if settings.sd_replay_from is not None:
+        # Imported here, since replaying requires the payload DB
+        from .sd_replay import get_replay_session
+
+        return get_replay_session(settings)
+    return _create_sd_session(
+        settings.sd_http_pool_connections,
+        settings.sd_http_pool_maxsize,
+        # Every attempt must take a token from the rate limiter, so the
+        # retries are left to sd_lookup when rate limiting is enabled
+        0 if settings.sd_rate_limit_enabled else settings.sd_http_retries,
+        settings.sd_http_retry_backoff_factor,
+    )
+
+
+def get_sd_timeout(settings: Settings) -> tuple[int, int]:
+    """
+    Get the (connect, read) timeout tuple to use when calling SD.
+    """
+    return settings.sd_http_connect_timeout, settings.sd_http_read_timeout
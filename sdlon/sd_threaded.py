@@ -0,0 +1,78 @@
+import uuid
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Optional
+from typing import OrderedDict
+from typing import TypeVar
+
+from structlog.stdlib import get_logger
+
+from .config import Settings
+from .sd_common import sd_lookup
+
+logger = get_logger()
+
+T = TypeVar("T")
+
+
+@lru_cache(maxsize=None)
+def _get_sd_executor(max_concurrent_requests: int) -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=max_concurrent_requests, thread_name_prefix="sd-call"
+    )
+
+
+class ThreadedSDClient:
+    """
+    Thread pool facade for the SD calls, which allows independent SD lookups
+    to run concurrently from synchronous code. The calls are submitted to the
+    pool and return futures, e.g.
+
+        sd = ThreadedSDClient(settings)
+        futures = [sd.lookup(url, params=params) for params in batch]
+        responses = [future.result() for future in futures]
+
+    The calls are made by the (blocking) functions in sd_common in the threads
+    of a process wide pool of `settings.sd_max_concurrent_requests` threads, so
+    at most that many calls are in flight at any time, counted across all
+    clients, and the calls share the pooled SD session, its timeouts and
+    retries. The session pool size (`sd_http_pool_maxsize`) should therefore
+    be at least as large as the allowed concurrency. A call running in the pool
+    must not wait for another call submitted to the pool, as that may deadlock.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        institution_identifier: str | None = None,
+        dry_run: bool = False,
+    ):
+        self.settings = settings
+        self.institution_identifier = institution_identifier
+        self.dry_run = dry_run
+        self._executor = _get_sd_executor(settings.sd_max_concurrent_requests)
+
+    def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> Future[T]:
+        """Run a blocking SD call in the process wide SD thread pool."""
+        return self._executor.submit(func, *args, **kwargs)
+
+    def lookup(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        request_uuid: uuid.UUID | None = None,
+    ) -> Future[OrderedDict]:
+        """Run `sd_lookup` in the SD thread pool."""
+        return self.run(
+            sd_lookup,
+            url,
+            settings=self.settings,
+            params=params,
+            request_uuid=request_uuid or uuid.uuid4(),
+            dry_run=self.dry_run,
+            institution_identifier=self.institution_identifier,
+        )
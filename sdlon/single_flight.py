@@ -0,0 +1,95 @@
+import threading
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+from typing import TypeVar
+
+from os2mo_helpers.mora_helpers import MoraHelper
+from structlog.stdlib import get_logger
+
+logger = get_logger()
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.exception: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls.
+
+    While a call for a given key is in flight, other threads calling `do`
+    with the same key wait for it to finish and get the same result (or
+    exception) instead of making the call themselves. Once the call has
+    finished, the next call for the key is made as usual, i.e. nothing is
+    cached.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+
+        if not is_leader:
+            logger.debug("Waiting for identical call in flight", key=key)
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class SingleFlightMoraHelper(MoraHelper):
+    """
+    MoraHelper where identical concurrent MO reads share a single request to
+    MO and a single parsed response.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._in_flight = SingleFlight()
+
+    def _mo_lookup(
+        self,
+        uuid,
+        url,
+        at=None,
+        validity=None,
+        only_primary=False,
+        use_cache=None,
+        calculate_primary=False,
+    ):
+        key = (uuid, url, at, validity, only_primary, use_cache, calculate_primary)
+        return self._in_flight.do(
+            key,
+            super()._mo_lookup,
+            uuid,
+            url,
+            at=at,
+            validity=validity,
+            only_primary=only_primary,
+            use_cache=use_cache,
+            calculate_primary=calculate_primary,
+        )
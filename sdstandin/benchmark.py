@@ -0,0 +1,318 @@
+# SPDX-FileCopyrightText: Magenta ApS
+#
+# SPDX-License-Identifier: MPL-2.0
+"""
+End-to-end benchmark of ChangeAtSD (update_changed_persons followed by
+update_all_employments, i.e. a changed-at run for a single institution)
+against the SD stand-in serving a generated institution and the in-memory MO
+stand-in. Run it with e.g.
+
+    python -m sdstandin.benchmark --persons 1000 --employments 1500 \
+        --output benchmark.json
+
+and compare the JSON results between releases.
+"""
+
+import json
+import math
+import resource
+import time
+from datetime import date
+from datetime import datetime
+from datetime import time as dt_time
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from unittest.mock import patch
+
+import click
+from fastapi.testclient import TestClient
+
+from sdlon.config import Settings
+from sdlon.fix_departments import FixDepartments
+from sdlon.log import LogLevel
+from sdlon.log import setup_logging
+from sdlon.models import JobFunction
+from sdlon.sd_changed_at import ChangeAtSD
+from sdlon.sync_job_id import JobIdSync
+
+from .config import StandInSettings
+from .generator import GeneratorConfig
+from .generator import generate_institution
+from .main import create_app
+from .mo import InMemoryMO
+from .mo import StandInMoraHelper
+from .synthetic import SyntheticSD
+
+SD_BASE_URL = "http://testserver/sdws/"
+
+
+class CountingSession:
+    """Wrap the session used for the SD calls and count the calls."""
+
+    def __init__(self, session: Any):
+        self.session = session
+        self.calls = 0
+
+    def get(self, *args: Any, **kwargs: Any) -> Any:
+        self.calls += 1
+        return self.session.get(*args, **kwargs)
+
+
+class StandInFixDepartments(FixDepartments):
+    def __init__(self, mo: InMemoryMO, *args: Any, **kwargs: Any):
+        self.mo = mo
+        super().__init__(*args, **kwargs)
+
+    def _get_mora_helper(self, settings) -> StandInMoraHelper:
+        return StandInMoraHelper(self.mo)
+
+
+class StandInJobIdSync(JobIdSync):
+    def __init__(self, mo: InMemoryMO, *args: Any, **kwargs: Any):
+        self.mo = mo
+        super().__init__(*args, **kwargs)
+
+    def _read_classes(self):
+        helper = StandInMoraHelper(self.mo)
+        self.engagement_types = helper.read_classes_in_facet("engagement_type")
+        if self.update_job_functions:
+            self.job_function_types = helper.read_classes_in_facet(
+                "engagement_job_function"
+            )
+
+
+class BenchmarkChangeAtSD(ChangeAtSD):
+    """
+    ChangeAtSD calling the MO stand-in and recording the time spent on
+    updating the employments of each person.
+    """
+
+    def __init__(self, mo: InMemoryMO, *args: Any, **kwargs: Any):
+        self.mo = mo
+        self.person_latencies: List[float] = []
+        self.employments_updated = 0
+        super().__init__(*args, **kwargs)
+        self.mo_graphql_client = mo  # type: ignore
+
+    def _get_mora_helper(self, mora_base) -> StandInMoraHelper:
+        return StandInMoraHelper(self.mo)
+
+    def _get_fix_departments(self) -> StandInFixDepartments:
+        return StandInFixDepartments(
+            self.mo, self.settings, self.current_inst_id, self.dry_run
+        )
+
+    def _get_job_sync(self, settings: Settings) -> StandInJobIdSync:
+        return StandInJobIdSync(self.mo, settings, self.current_inst_id, self.mo)
+
+    def _update_user_employments(
+        self, cpr: str, sd_employments, person_uuid: str
+    ) -> None:
+        start = time.perf_counter()
+        super()._update_user_employments(cpr, sd_employments, person_uuid)
+        self.person_latencies.append(time.perf_counter() - start)
+        self.employments_updated += len(sd_employments)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """The q-th (0 < q <= 1) percentile of the values (nearest rank)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_phase(
+    run: Callable[[], None], sd: CountingSession, mo: InMemoryMO
+) -> Dict[str, Any]:
+    sd_calls, mo_calls = sd.calls, mo.total_calls
+    start = time.perf_counter()
+    run()
+    return {
+        "seconds": time.perf_counter() - start,
+        "sd_calls": sd.calls - sd_calls,
+        "mo_calls": mo.total_calls - mo_calls,
+    }
+
+
+def _per_second(count: int, seconds: float) -> Optional[float]:
+    return count / seconds if seconds > 0 else None
+
+
+def _per_person(calls: int, persons: int) -> Optional[float]:
+    return calls / persons if persons > 0 else None
+
+
+def _format_rate(per_second: Optional[float]) -> str:
+    return f"{per_second:.1f}" if per_second is not None else "n/a"
+
+
+def run_benchmark(
+    config: GeneratorConfig,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    streaming: bool = False,
+    standin_settings: Optional[StandInSettings] = None,
+) -> Dict[str, Any]:
+    """
+    Run ChangeAtSD for a generated institution and measure the throughput.
+
+    Args:
+        config: the configuration of the generated institution
+        from_date: the start of the changed-at interval (default: the start
+            of the generated period, i.e. all changes are processed)
+        to_date: the end of the changed-at interval (default: the end of the
+            generated period)
+        streaming: whether to use streaming parsing of the SD responses
+        standin_settings: the settings (e.g. latency) of the SD stand-in
+
+    Returns:
+        The benchmark results (JSON serializable)
+    """
+    from_date = from_date or config.start_date
+    to_date = to_date or config.end_date
+
+    institution = generate_institution(config)
+    mo = InMemoryMO(institution)
+    sd = CountingSession(
+        TestClient(
+            create_app(
+                standin_settings or StandInSettings(), source=SyntheticSD(institution)
+            )
+        )
+    )
+    settings = Settings.parse_obj(
+        {
+            "municipality_name": "Benchmark",
+            "municipality_code": 100,
+            "mora_base": "http://mo-standin",
+            "sd_base_url": SD_BASE_URL,
+            "sd_global_from_date": config.start_date,
+            "sd_institution_identifier": institution.identifier,
+            "sd_user": "benchmark",
+            "sd_password": "benchmark",
+            "sd_job_function": JobFunction.job_position_identifier,
+            "sd_monthly_hourly_divide": config.employments + 1,
+            "sd_import_too_deep": config.levels[-1:],
+            "sd_use_ad_integration": False,
+            "sd_persist_payloads": False,
+            "sd_streaming_parse": streaming,
+            "app_dbpassword": "benchmark",
+        }
+    )
+
+    with patch("sdlon.sd_common.get_sd_session", return_value=sd):
+        sd_updater = BenchmarkChangeAtSD(
+            mo,
+            settings,
+            institution.identifier,
+            datetime.combine(from_date, dt_time.min),
+            datetime.combine(to_date, dt_time(23, 59)),
+        )
+
+        person_lookups = mo.calls["graphql_GetEmployee"]
+        persons = _run_phase(sd_updater.update_changed_persons, sd, mo)
+        persons["count"] = mo.calls["graphql_GetEmployee"] - person_lookups
+        persons["per_second"] = _per_second(persons["count"], persons["seconds"])
+
+        employments = _run_phase(sd_updater.update_all_employments, sd, mo)
+
+    latencies_ms = [latency * 1000 for latency in sd_updater.person_latencies]
+    employments.update(
+        {
+            "persons": len(latencies_ms),
+            "count": sd_updater.employments_updated,
+            "per_second": _per_second(
+                sd_updater.employments_updated, employments["seconds"]
+            ),
+            "person_latency_ms": {
+                "p50": percentile(latencies_ms, 0.5),
+                "p95": percentile(latencies_ms, 0.95),
+                "max": max(latencies_ms, default=None),
+            },
+        }
+    )
+
+    persons_processed = max(persons["count"], employments["persons"])
+    return {
+        "generator": json.loads(config.json()),
+        "from_date": from_date.isoformat(),
+        "to_date": to_date.isoformat(),
+        "streaming": streaming,
+        "update_changed_persons": persons,
+        "update_all_employments": employments,
+        "sd_calls_per_person": _per_person(sd.calls, persons_processed),
+        "mo_calls_per_person": _per_person(mo.total_calls, persons_processed),
+        "mo_calls": dict(sorted(mo.calls.items())),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+@click.command()
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--persons", type=int, default=1_000, show_default=True)
+@click.option("--employments", type=int, default=1_500, show_default=True)
+@click.option("--from-date", type=click.DateTime(formats=["%Y-%m-%d"]))
+@click.option("--to-date", type=click.DateTime(formats=["%Y-%m-%d"]))
+@click.option("--streaming", is_flag=True, help="Use streaming parsing of SD")
+@click.option(
+    "--sd-latency-ms",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Latency injected into every SD response",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    required=True,
+    help="JSON file to write the results to",
+)
+@click.option(
+    "--log-level",
+    type=click.Choice([level.value for level in LogLevel]),
+    default=LogLevel.WARNING.value,
+    show_default=True,
+)
+def main(
+    seed: int,
+    persons: int,
+    employments: int,
+    from_date: Optional[datetime],
+    to_date: Optional[datetime],
+    streaming: bool,
+    sd_latency_ms: int,
+    output: Path,
+    log_level: str,
+):
+    setup_logging(LogLevel(log_level))
+
+    results = run_benchmark(
+        GeneratorConfig(seed=seed, persons=persons, employments=employments),
+        from_date=from_date.date() if from_date else None,
+        to_date=to_date.date() if to_date else None,
+        streaming=streaming,
+        standin_settings=StandInSettings(latency_ms=sd_latency_ms),
+    )
+    output.write_text(json.dumps(results, indent=2))
+
+    click.echo(
+        f"{_format_rate(results['update_changed_persons']['per_second'])} persons/s, "
+        f"{_format_rate(results['update_all_employments']['per_second'])} "
+        "employments/s, "
+        f"peak RSS {results['peak_rss_mb']:.0f} MB"
+    )
+    click.echo(f"Wrote results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# SPDX-FileCopyrightText: Magenta ApS
+#
+# SPDX-License-Identifier: MPL-2.0
+from enum import Enum
+from typing import Optional
+
+from pydantic import BaseSettings
+from pydantic import FilePath
+from pydantic import PositiveInt
+from pydantic import confloat
+from pydantic import conint
+
+
+class DataSource(str, Enum):
+    # Serve data from a (generated) synthetic institution
+    synthetic = "synthetic"
+    # Serve the payloads recorded in the SD payload DB
+    recorded = "recorded"
+
+
+class StandInSettings(BaseSettings):  # type: ignore
+    data_source: DataSource = DataSource.synthetic
+
+    # JSON file with the synthetic institution (see sdstandin.models.Institution).
+    # A small example institution is used if not set
+    data_file: Optional[FilePath] = None
+
+    # Latency injected into every response (in milliseconds). The actual
+    # latency is drawn uniformly from latency_ms +/- latency_jitter_ms
+    latency_ms: conint(ge=0) = 0  # type: ignore
+    latency_jitter_ms: conint(ge=0) = 0  # type: ignore
+
+    # Fraction of the requests answered with a "503 Service Unavailable"
+    error_rate: confloat(ge=0, le=1) = 0.0  # type: ignore
+
+    # Number of threads preloading the index of the recorded payloads (see
+    # sdlon.sd_replay.ReplaySD)
+    recorded_preload_workers: PositiveInt = 4
+
+    class Config:
+        env_prefix = "sd_standin_"
+
+
+def get_settings(**overrides) -> StandInSettings:
+    return StandInSettings(**overrides)
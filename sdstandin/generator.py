@@ -0,0 +1,341 @@
+# SPDX-FileCopyrightText: Magenta ApS
+#
+# SPDX-License-Identifier: MPL-2.0
+"""
+Generator of synthetic SD institutions at configurable scale, e.g. for
+benchmarking ChangeAtSD and the fix scripts against the SD stand-in. The
+generated data is deterministic given the seed.
+"""
+
+import random
+from datetime import date
+from datetime import datetime
+from datetime import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import OrderedDict
+from typing import Tuple
+from uuid import UUID
+
+import click
+import xmltodict
+from pydantic import BaseModel
+from pydantic import PositiveInt
+from pydantic import root_validator
+
+from .models import Department
+from .models import Employment
+from .models import EmploymentStatusPeriod
+from .models import Institution
+from .models import Person
+from .models import Profession
+from .synthetic import SyntheticSD
+
+EMPLOYMENT_CHANGED_AT_DATE = "GetEmploymentChangedAtDate20111201"
+
+GIVEN_NAMES = [
+    "Anne", "Bente", "Camilla", "Dorthe", "Emma", "Freja", "Hanne", "Ida",
+    "Karen", "Lone", "Mette", "Sofie", "Anders", "Bo", "Christian", "Frederik",
+    "Henrik", "Jens", "Lars", "Mads", "Niels", "Ole", "Peter", "Søren",
+]  # fmt: skip
+SURNAMES = [
+    "Andersen", "Christensen", "Hansen", "Jensen", "Johansen", "Jørgensen",
+    "Larsen", "Madsen", "Nielsen", "Olsen", "Pedersen", "Petersen",
+    "Rasmussen", "Sørensen", "Thomsen",
+]  # fmt: skip
+PROFESSIONS = [
+    "Pædagog", "Sygeplejerske", "Social- og sundhedshjælper", "Lærer",
+    "Kontorfuldmægtig", "Specialkonsulent", "Tekniker", "Rengøringsassistent",
+    "Ergoterapeut", "Fysioterapeut", "Dagplejer", "Chef",
+]  # fmt: skip
+
+
+class GeneratorConfig(BaseModel):
+    seed: int = 0
+    institution_identifier: str = "XX"
+    persons: PositiveInt = 60_000
+    employments: PositiveInt = 90_000
+    professions: PositiveInt = 300
+    # The department levels from the top to the bottom of the tree and the
+    # number of children of each department on the level above
+    levels: List[str] = [
+        "NY5-niveau",
+        "NY4-niveau",
+        "NY3-niveau",
+        "NY2-niveau",
+        "NY1-niveau",
+        "Afdelings-niveau",
+    ]
+    fanout: List[PositiveInt] = [1, 4, 4, 4, 5, 6]
+    # The employments are registered, and their statuses change, in this period
+    start_date: date = date(2020, 1, 1)
+    end_date: date = date(2024, 12, 31)
+
+    # Probabilities of the status transitions 0 -> 1 -> 3 -> 8 -> S. The
+    # transition to 8 can happen from both 1 and 3
+    p_status_0: float = 0.5
+    p_leave: float = 0.15
+    p_terminate: float = 0.3
+    p_delete: float = 0.2
+
+    @root_validator
+    def check_config(cls, values):
+        if values["employments"] < values["persons"]:
+            raise ValueError("Every person must have at least one employment")
+        if len(values["levels"]) != len(values["fanout"]):
+            raise ValueError("levels and fanout must have the same length")
+        if values["start_date"] >= values["end_date"]:
+            raise ValueError("start_date must be before end_date")
+        return values
+
+
+class _Generator:
+    def __init__(self, config: GeneratorConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+
+    def uuid(self) -> UUID:
+        return UUID(int=self.rng.getrandbits(128), version=4)
+
+    def date_between(self, from_date: date, to_date: date) -> date:
+        return from_date + timedelta(
+            days=self.rng.randint(0, (to_date - from_date).days)
+        )
+
+    def registration_time(self, registered: date) -> datetime:
+        return datetime.combine(
+            registered, time(self.rng.randint(6, 18), self.rng.randint(0, 59))
+        )
+
+    def departments(self) -> List[Department]:
+        departments: List[Department] = []
+        parents: List[Optional[Department]] = [None]
+        for level, fanout in zip(self.config.levels, self.config.fanout):
+            children: List[Optional[Department]] = []
+            for parent in parents:
+                for _ in range(fanout):
+                    number = len(departments) + 1
+                    department = Department(
+                        identifier=f"D{number:05d}",
+                        uuid=self.uuid(),
+                        level=level,
+                        name=f"{level.split('-')[0]} enhed {number}",
+                        parent_uuid=parent.uuid if parent is not None else None,
+                        activation_date=date(2000, 1, 1),
+                    )
+                    departments.append(department)
+                    children.append(department)
+            parents = children
+        return departments
+
+    def professions(self) -> List[Profession]:
+        return [
+            Profession(
+                job_position_identifier=str(number),
+                name=f"{self.rng.choice(PROFESSIONS)} ({number})",
+            )
+            for number in range(1, self.config.professions + 1)
+        ]
+
+    def cprs(self) -> Iterator[str]:
+        seen: set[str] = set()
+        while len(seen) < self.config.persons:
+            birthdate = self.date_between(date(1950, 1, 1), date(2005, 12, 31))
+            cpr = birthdate.strftime("%d%m%y") + f"{self.rng.randint(0, 9999):04d}"
+            if cpr not in seen:
+                seen.add(cpr)
+                yield cpr
+
+    def statuses(self, activation_date: date) -> List[EmploymentStatusPeriod]:
+        """
+        Generate the status periods of an employment starting on the
+        activation date, following the transitions 0 -> 1 -> 3 -> 8 -> S.
+        Transitions after the end date are not generated.
+        """
+        config = self.config
+        transitions: List[Tuple[str, date]] = []
+        current = activation_date
+        if self.rng.random() < config.p_status_0:
+            transitions.append(("0", current))
+            current += timedelta(days=self.rng.randint(1, 60))
+        transitions.append(("1", current))
+        if self.rng.random() < config.p_leave:
+            current += timedelta(days=self.rng.randint(30, 720))
+            transitions.append(("3", current))
+        if self.rng.random() < config.p_terminate:
+            current += timedelta(days=self.rng.randint(30, 1500))
+            transitions.append(("8", current))
+            if self.rng.random() < config.p_delete:
+                current += timedelta(days=self.rng.randint(365, 1500))
+                transitions.append(("S", current))
+
+        # The first status is registered with the employment
+        transitions = transitions[:1] + [
+            (code, day) for code, day in transitions[1:] if day <= config.end_date
+        ]
+        statuses = []
+        for i, (code, day) in enumerate(transitions):
+            # Changes are registered up to two weeks in advance
+            registered = max(activation_date, day) - timedelta(
+                days=self.rng.randint(0, 14)
+            )
+            statuses.append(
+                EmploymentStatusPeriod(
+                    status_code=code,
+                    activation_date=day,
+                    deactivation_date=(
+                        transitions[i + 1][1] - timedelta(days=1)
+                        if i + 1 < len(transitions)
+                        else date(9999, 12, 31)
+                    ),
+                    changed_at=self.registration_time(registered),
+                )
+            )
+        # Registrations must not precede the registration of the employment
+        first_registration = statuses[0].changed_at
+        for status in statuses[1:]:
+            status.changed_at = max(status.changed_at, first_registration)
+        return statuses
+
+    def institution(self) -> Institution:
+        config = self.config
+        departments = self.departments()
+        leaves = [d for d in departments if d.level == config.levels[-1]]
+        professions = self.professions()
+
+        persons = [
+            Person(
+                cpr=cpr,
+                given_name=self.rng.choice(GIVEN_NAMES),
+                surname=self.rng.choice(SURNAMES),
+                changed_at=datetime.max,
+            )
+            for cpr in self.cprs()
+        ]
+        for number in range(config.employments):
+            person = (
+                persons[number] if number < len(persons) else self.rng.choice(persons)
+            )
+            profession = self.rng.choice(professions)
+            registered = self.date_between(
+                config.start_date, config.end_date - timedelta(days=1)
+            )
+            activation_date = registered + timedelta(days=self.rng.randint(0, 30))
+            statuses = self.statuses(activation_date)
+            employment = Employment(
+                identifier=f"{number + 1:05d}",
+                department_uuid=self.rng.choice(leaves).uuid,
+                job_position_identifier=profession.job_position_identifier,
+                employment_name=profession.name,
+                employment_date=activation_date,
+                activation_date=activation_date,
+                changed_at=statuses[0].changed_at,
+                statuses=statuses,
+            )
+            person.employments.append(employment)
+            person.changed_at = min(person.changed_at, employment.changed_at)
+
+        return Institution(
+            identifier=config.institution_identifier,
+            uuid=self.uuid(),
+            name=f"Synthetic institution {config.institution_identifier}",
+            region_identifier="RG",
+            region_uuid=self.uuid(),
+            departments=departments,
+            persons=persons,
+            professions=professions,
+        )
+
+
+def generate_institution(config: GeneratorConfig) -> Institution:
+    """Generate a synthetic SD institution."""
+    return _Generator(config).institution()
+
+
+def daily_change_feeds(
+    institution: Institution, from_date: date, to_date: date
+) -> Iterator[Tuple[date, str]]:
+    """
+    Generate the raw XML responses of GetEmploymentChangedAtDate20111201
+    for each day from from_date to to_date (both included), i.e. the
+    responses read by a daily run of ChangeAtSD.
+    """
+    sd = SyntheticSD(institution)
+    day = from_date
+    while day <= to_date:
+        params = {
+            "InstitutionIdentifier": institution.identifier,
+            "ActivationDate": day.strftime("%d.%m.%Y"),
+            "ActivationTime": "00:00",
+            "DeactivationDate": day.strftime("%d.%m.%Y"),
+            "DeactivationTime": "23:59",
+            "DepartmentIndicator": "true",
+            "EmploymentStatusIndicator": "true",
+            "ProfessionIndicator": "true",
+            "WorkingTimeIndicator": "true",
+            "UUIDIndicator": "true",
+        }
+        _, response = sd.respond(EMPLOYMENT_CHANGED_AT_DATE, params)
+        yield day, response
+        day += timedelta(days=1)
+
+
+def parse_response(endpoint: str, response: str) -> OrderedDict:
+    """
+    Parse a raw XML response into the OrderedDict returned by `sd_lookup`.
+    """
+    return xmltodict.parse(response)[endpoint]
+
+
+@click.command()
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--persons", type=int, default=60_000, show_default=True)
+@click.option("--employments", type=int, default=90_000, show_default=True)
+@click.option("--institution-identifier", default="XX", show_default=True)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    required=True,
+    help="JSON file to write the institution to (see SD_STANDIN_DATA_FILE)",
+)
+@click.option(
+    "--feeds-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    help="Also write the daily GetEmploymentChangedAtDate responses here",
+)
+@click.option("--feeds-from", type=click.DateTime(formats=["%Y-%m-%d"]))
+@click.option("--feeds-to", type=click.DateTime(formats=["%Y-%m-%d"]))
+def main(
+    seed: int,
+    persons: int,
+    employments: int,
+    institution_identifier: str,
+    output: Path,
+    feeds_dir: Optional[Path],
+    feeds_from: Optional[datetime],
+    feeds_to: Optional[datetime],
+):
+    config = GeneratorConfig(
+        seed=seed,
+        persons=persons,
+        employments=employments,
+        institution_identifier=institution_identifier,
+    )
+    institution = generate_institution(config)
+    output.write_text(institution.json())
+    click.echo(f"Wrote institution to {output}")
+
+    if feeds_dir is not None:
+        feeds_dir.mkdir(parents=True, exist_ok=True)
+        from_date = feeds_from.date() if feeds_from else config.start_date
+        to_date = feeds_to.date() if feeds_to else config.end_date
+        for day, response in daily_change_feeds(institution, from_date, to_date):
+            (feeds_dir / f"{day.isoformat()}.xml").write_text(response)
+        click.echo(f"Wrote daily change feeds to {feeds_dir}")
+
+
+if __name__ == "__main__":
+    main()
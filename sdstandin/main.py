@@ -0,0 +1,78 @@
+# SPDX-FileCopyrightText: Magenta ApS
+#
+# SPDX-License-Identifier: MPL-2.0
+"""
+Local stand-in for the SD web services used by sdlon, for offline (load)
+testing. Run it with e.g.
+
+    uvicorn --factory sdstandin.main:create_app --port 8080
+
+and point sdlon at it by setting SD_BASE_URL=http://localhost:8080/sdws/
+"""
+
+import asyncio
+import random
+from typing import Protocol
+from typing import Tuple
+
+from fastapi import FastAPI
+from fastapi import Request
+from fastapi import Response
+
+from .config import DataSource
+from .config import StandInSettings
+from .config import get_settings
+from .models import Institution
+from .synthetic import SyntheticSD
+from .synthetic import example_institution
+
+
+class SDSource(Protocol):
+    def respond(self, endpoint: str, params: dict[str, str]) -> Tuple[int, str]: ...
+
+
+def get_source(settings: StandInSettings) -> SDSource:
+    if settings.data_source == DataSource.recorded:
+        # Imported here, since the DB settings are only needed for this source
+        from db.engine import get_engine
+
+        from .recorded import RecordedSD
+
+        return RecordedSD(get_engine(), settings.recorded_preload_workers)
+
+    if settings.data_file is not None:
+        institution = Institution.parse_file(settings.data_file)
+    else:
+        institution = example_institution()
+    return SyntheticSD(institution)
+
+
+def create_app(
+    settings: StandInSettings | None = None, source: SDSource | None = None
+) -> FastAPI:
+    settings = settings or get_settings()
+    sd_source = source or get_source(settings)
+
+    app = FastAPI(title="SD stand-in", description="Local stand-in for SD")
+
+    @app.get("/sdws/{endpoint}")
+    async def sd_endpoint(endpoint: str, request: Request) -> Response:
+        latency_ms = settings.latency_ms + random.uniform(
+            -settings.latency_jitter_ms, settings.latency_jitter_ms
+        )
+        if latency_ms > 0:
+            await asyncio.sleep(latency_ms / 1000)
+
+        if random.random() < settings.error_rate:
+            return Response(
+                content="<html><body>Service Unavailable</body></html>",
+                status_code=503,
+                media_type="text/html",
+            )
+
+        status_code, content = sd_source.respond(endpoint, dict(request.query_params))
+        return Response(
+            content=content, status_code=status_code, media_type="application/xml"
+        )
+
+    return app
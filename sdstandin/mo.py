@@ -0,0 +1,339 @@
+# SPDX-FileCopyrightText: Magenta ApS
+#
+# SPDX-License-Identifier: MPL-2.0
+"""
+In-memory stand-in for the parts of MO used by ChangeAtSD, for offline
+benchmarking. It serves the service API calls made via MoraHelper (see
+StandInMoraHelper) and the GraphQL operations made via the GraphQL client,
+and counts every call made to it.
+
+The stand-in is seeded with the departments and professions of a synthetic
+SD institution, i.e. it mimics an MO into which the organisation has already
+been imported. Only the (latest) state of each object is kept - there is no
+bitemporality.
+"""
+
+import json
+import re
+from collections import Counter
+from datetime import date
+from datetime import timedelta
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from uuid import NAMESPACE_URL
+from uuid import uuid4
+from uuid import uuid5
+
+import requests
+from os2mo_helpers.mora_helpers import MoraHelper
+
+from .models import Institution
+
+ORG_UNIT_LEVEL_FACET = "org_unit_level"
+ORG_UNIT_TYPE_FACET = "org_unit_type"
+
+LOOKUP_ROUTES = [
+    ("read_organisation", re.compile(r"^o/$")),
+    ("read_classes_in_facet", re.compile(r"^o/[^/]+/f/(?P<facet>[^/]+)/$")),
+    ("find_user_by_cpr", re.compile(r"^o/[^/]+/e/\?query=(?P<cpr>[0-9]+)$")),
+    ("read_it_systems", re.compile(r"^o/[^/]+/it/$")),
+    ("read_user", re.compile(r"^e/(?P<uuid>[^/]+)/$")),
+    (
+        "read_user_details",
+        re.compile(r"^e/(?P<uuid>[^/]+)/details/(?P<type>engagement|association)$"),
+    ),
+    ("read_ou", re.compile(r"^ou/(?P<uuid>[^/]+)/$")),
+]
+
+
+class StandInResponse:
+    """The subset of `requests.Response` used by MoraHelper and sdlon."""
+
+    def __init__(self, status_code: int, data: Any = None):
+        self.status_code = status_code
+        self.data = data
+
+    @property
+    def text(self) -> str:
+        return json.dumps(self.data)
+
+    def json(self) -> Any:
+        return self.data
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(self.text)
+
+
+def _class_uuid(facet: str, user_key: str) -> str:
+    return str(uuid5(NAMESPACE_URL, f"{facet}/{user_key}"))
+
+
+def _is_later(first: Optional[str], second: Optional[str]) -> bool:
+    """Whether the MO "to" date `first` is later than `second` (None is infinity)"""
+    if first is None:
+        return second is not None
+    return second is not None and first > second
+
+
+class InMemoryMO:
+    def __init__(self, institution: Institution):
+        self.calls: Counter[str] = Counter()
+
+        self.organisation_uuid = str(institution.uuid)
+        # Facet user key -> the facet as returned by MO
+        self.facets: Dict[str, Dict[str, Any]] = {}
+        self.employees: Dict[str, Dict[str, Any]] = {}
+        self.employee_by_cpr: Dict[str, str] = {}
+        self.org_units: Dict[str, Dict[str, Any]] = {}
+        # Details (engagements, associations, leaves and IT users) by UUID and
+        # the engagements and associations by the UUID of the person
+        self.details: Dict[str, Dict[str, Any]] = {}
+        self.person_details: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+
+        levels = list(dict.fromkeys(d.level for d in institution.departments))
+        self._add_facet(ORG_UNIT_LEVEL_FACET, [(level, level) for level in levels])
+        self._add_facet(ORG_UNIT_TYPE_FACET, [("Enhed", "Enhed")])
+        self._add_facet(
+            "engagement_job_function",
+            [
+                (profession.job_position_identifier, profession.name)
+                for profession in institution.professions
+            ],
+        )
+        self._add_facet(
+            "engagement_type", [("månedsløn", "Månedsløn"), ("timeløn", "Timeløn")]
+        )
+        self._add_facet("leave_type", [("Orlov", "Orlov")])
+        self._add_facet("association_type", [("SD-Medarbejder", "SD-Medarbejder")])
+
+        departments = {str(d.uuid): d for d in institution.departments}
+
+        def add_org_unit(uuid: str) -> Dict[str, Any]:
+            if uuid not in self.org_units:
+                department = departments[uuid]
+                parent_uuid = department.parent_uuid
+                self.org_units[uuid] = {
+                    "uuid": uuid,
+                    "user_key": department.identifier,
+                    "name": department.name,
+                    "org_unit_level": self._class(
+                        ORG_UNIT_LEVEL_FACET, department.level
+                    ),
+                    "parent": (
+                        add_org_unit(str(parent_uuid))
+                        if parent_uuid is not None
+                        else None
+                    ),
+                    "validity": {
+                        "from": department.activation_date.isoformat(),
+                        "to": None,
+                    },
+                }
+            return self.org_units[uuid]
+
+        for uuid in departments:
+            add_org_unit(uuid)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def _add_facet(self, facet: str, classes: List[tuple[str, str]]) -> None:
+        self.facets[facet] = {
+            "uuid": _class_uuid("facet", facet),
+            "user_key": facet,
+            "data": {
+                "items": [
+                    {
+                        "uuid": _class_uuid(facet, user_key),
+                        "user_key": user_key,
+                        "name": name,
+                    }
+                    for user_key, name in classes
+                ]
+            },
+        }
+
+    def _class(self, facet: str, user_key: str) -> Dict[str, Any]:
+        return next(
+            c for c in self.facets[facet]["data"]["items"] if c["user_key"] == user_key
+        )
+
+    def _create_class(self, facet_uuid: str, user_key: str, name: str) -> Optional[str]:
+        for facet in self.facets.values():
+            if facet["uuid"] == facet_uuid or facet["user_key"] == facet_uuid:
+                uuid = _class_uuid(facet["user_key"], user_key)
+                facet["data"]["items"].append(
+                    {"uuid": uuid, "user_key": user_key, "name": name}
+                )
+                return uuid
+        return None
+
+    def lookup(self, url: str, validity: Optional[str] = None) -> Any:
+        """Serve a GET request to the MO service API (relative to /service/)."""
+        for name, pattern in LOOKUP_ROUTES:
+            match = pattern.match(url)
+            if match is not None:
+                self.calls[name] += 1
+                return getattr(self, f"_{name}")(validity=validity, **match.groupdict())
+        raise NotImplementedError(f"MO stand-in does not serve GET {url}")
+
+    def _read_organisation(self, validity: Optional[str]) -> List[Dict[str, Any]]:
+        return [{"uuid": self.organisation_uuid}]
+
+    def _read_classes_in_facet(
+        self, facet: str, validity: Optional[str]
+    ) -> Dict[str, Any]:
+        return self.facets.get(facet, {"uuid": None, "data": {"items": []}})
+
+    def _find_user_by_cpr(self, cpr: str, validity: Optional[str]) -> Dict[str, Any]:
+        uuid = self.employee_by_cpr.get(cpr)
+        items = [] if uuid is None else [{"uuid": uuid}]
+        return {"total": len(items), "items": items}
+
+    def _read_it_systems(self, validity: Optional[str]) -> List[Dict[str, Any]]:
+        return []
+
+    def _read_user(self, uuid: str, validity: Optional[str]) -> Any:
+        return self.employees.get(uuid, {"status": 404})
+
+    def _read_user_details(
+        self, uuid: str, type: str, validity: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        # Only the latest state is kept, so everything is in the present
+        if validity not in (None, "present"):
+            return []
+        return list(self.person_details.get(uuid, {}).get(type, []))
+
+    def _read_ou(self, uuid: str, validity: Optional[str]) -> Dict[str, Any]:
+        return self.org_units.get(uuid, {"status": 404, "description": "Not found"})
+
+    def post(self, url: str, payload: Dict[str, Any]) -> StandInResponse:
+        """Serve a POST request to the MO service API (relative to /service/)."""
+        if url == "e/create":
+            self.calls["create_employee"] += 1
+            return self._create_employee(payload)
+        if url.startswith("details/"):
+            action = url.removeprefix("details/")
+            self.calls[f"{action}_details"] += 1
+            if action == "create":
+                return self._create_details(payload)
+            if action == "edit":
+                return self._edit_details(payload)
+            if action == "terminate":
+                return self._terminate_details(payload)
+        if url.startswith("f/"):
+            self.calls["create_class"] += 1
+            facet = url.split("/")[1]
+            uuid = self._create_class(facet, payload["user_key"], payload["name"])
+            return StandInResponse(201 if uuid else 404, uuid)
+        raise NotImplementedError(f"MO stand-in does not serve POST {url}")
+
+    def _create_employee(self, payload: Dict[str, Any]) -> StandInResponse:
+        uuid = payload.get("uuid") or str(uuid4())
+        given_name = payload.get("givenname") or ""
+        surname = payload.get("surname") or ""
+        self.employees[uuid] = {
+            "uuid": uuid,
+            "cpr_no": payload["cpr_no"],
+            "givenname": given_name,
+            "surname": surname,
+            "name": f"{given_name} {surname}",
+        }
+        self.employee_by_cpr[payload["cpr_no"]] = uuid
+        return StandInResponse(201, uuid)
+
+    def _create_details(self, payload: Dict[str, Any]) -> StandInResponse:
+        uuid = str(uuid4())
+        details = {**payload, "uuid": uuid}
+        self.details[uuid] = details
+        if payload["type"] in ("engagement", "association"):
+            self.person_details.setdefault(payload["person"]["uuid"], {}).setdefault(
+                payload["type"], []
+            ).append(details)
+        return StandInResponse(201, uuid)
+
+    def _edit_details(self, payload: Dict[str, Any]) -> StandInResponse:
+        details = self.details.get(payload["uuid"])
+        if details is None:
+            return StandInResponse(404, {"description": "Not found"})
+        data = dict(payload["data"])
+        validity = data.pop("validity", {})
+        details.update(data)
+        if _is_later(validity.get("to"), details["validity"].get("to")):
+            details["validity"] = {**details["validity"], "to": validity["to"]}
+        return StandInResponse(200, payload["uuid"])
+
+    def _terminate_details(self, payload: Dict[str, Any]) -> StandInResponse:
+        details = self.details.get(payload["uuid"])
+        if details is None:
+            return StandInResponse(404, {"description": "Not found"})
+        validity = payload["validity"]
+        to_date = validity.get("to")
+        if to_date is None:
+            # The termination starts at "from", i.e. the last day is the day before
+            last_day = date.fromisoformat(validity["from"]) - timedelta(days=1)
+            to_date = last_day.isoformat()
+        details["validity"] = {**details["validity"], "to": to_date}
+        return StandInResponse(200, payload["uuid"])
+
+    def execute(
+        self, document: Any, variable_values: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Serve a GraphQL operation (the GraphQLClient interface)."""
+        operation = document.definitions[0].name.value
+        variables = variable_values or {}
+        self.calls[f"graphql_{operation}"] += 1
+
+        if operation == "GetEmployee":
+            uuid = self.employee_by_cpr.get(variables["cpr"])
+            if uuid is None:
+                return {"employees": {"objects": []}}
+            employee = self.employees[uuid]
+            return {
+                "employees": {
+                    "objects": [
+                        {
+                            "current": {
+                                "uuid": uuid,
+                                "name": employee["name"],
+                                "given_name": employee["givenname"],
+                                "surname": employee["surname"],
+                            }
+                        }
+                    ]
+                }
+            }
+        if operation == "CreateClass":
+            class_input = variables["input"]
+            uuid = self._create_class(
+                class_input["facet_uuid"], class_input["user_key"], class_input["name"]
+            )
+            return {"class_create": {"uuid": uuid}}
+        raise NotImplementedError(f"MO stand-in does not serve {operation}")
+
+
+class StandInMoraHelper(MoraHelper):
+    """MoraHelper calling the in-memory MO stand-in instead of MO."""
+
+    def __init__(self, mo: InMemoryMO):
+        super().__init__(hostname="http://mo-standin", use_cache=False)
+        self.mo = mo
+
+    def _mo_lookup(
+        self,
+        uuid,
+        url,
+        at=None,
+        validity=None,
+        only_primary=False,
+        use_cache=None,
+        calculate_primary=False,
+    ):
+        return self.mo.lookup(url.format(uuid), validity)
+
+    def _mo_post(self, url, payload, force=True):
+        return self.mo.post(url, payload)
@@ -0,0 +1,71 @@
+# SPDX-FileCopyrightText: Magenta ApS
+#
+# SPDX-License-Identifier: MPL-2.0
+from datetime import date
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from pydantic import BaseModel
+
+INFINITY = date(9999, 12, 31)
+
+
+class Profession(BaseModel):
+    job_position_identifier: str
+    name: str
+
+
+class Department(BaseModel):
+    identifier: str
+    uuid: UUID
+    level: str
+    name: str
+    # None for the top level departments (the parent is the institution)
+    parent_uuid: Optional[UUID] = None
+    activation_date: date = date(2000, 1, 1)
+    deactivation_date: date = INFINITY
+
+
+class EmploymentStatusPeriod(BaseModel):
+    # The SD EmploymentStatusCode (see sdlon.sd_common.EmploymentStatus)
+    status_code: str
+    activation_date: date
+    deactivation_date: date = INFINITY
+    # When the status change was registered in SD
+    changed_at: datetime
+
+
+class Employment(BaseModel):
+    identifier: str
+    department_uuid: UUID
+    job_position_identifier: str
+    employment_name: str
+    occupation_rate: str = "1.0000"
+    employment_date: date
+    activation_date: date
+    deactivation_date: date = INFINITY
+    # When the employment was registered in SD
+    changed_at: datetime
+    # The consecutive status periods of the employment, e.g. 0 -> 1 -> 8
+    statuses: list[EmploymentStatusPeriod]
+
+
+class Person(BaseModel):
+    cpr: str
+    given_name: str
+    surname: str
+    employments: list[Employment] = []
+    # When the person was (last) registered in SD
+    changed_at: datetime
+
+
+class Institution(BaseModel):
+    identifier: str
+    uuid: UUID
+    name: str
+    region_identifier: str
+    region_uuid: UUID
+    departments: list[Department] = []
+    persons: list[Person] = []
+    professions: list[Profession] = []
@@ -0,0 +1,52 @@
+# SPDX-FileCopyrightText: Magenta ApS
+#
+# SPDX-License-Identifier: MPL-2.0
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from typing import Any
+from typing import Dict
+from typing import Tuple
+
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from db.models import Payload
+from sdlon.sd_replay import ReplayMissError
+from sdlon.sd_replay import ReplaySD
+
+from .responses import error_envelope
+
+
+class RecordedSD(ReplaySD):
+    """
+    Answers SD requests with the payloads recorded in the SD payload DB.
+
+    The payloads are replayed as in replay mode (see `sdlon.sd_replay`), over
+    all the recorded payloads, so a request is answered with the most recently
+    recorded payload for the same endpoint and (normalized) request
+    parameters. Requests without a recorded payload are answered with an SD
+    error envelope instead of failing.
+    """
+
+    def __init__(self, engine: Engine, workers: int):
+        with Session(engine) as session:
+            first, last = session.execute(
+                select(func.min(Payload.timestamp), func.max(Payload.timestamp))
+            ).one()
+        now = datetime.now(timezone.utc)
+        # The period is half-open, so it must end after the last payload
+        super().__init__(
+            engine,
+            first or now,
+            last + timedelta(microseconds=1) if last is not None else now,
+            workers,
+        )
+
+    def respond(self, endpoint: str, params: Dict[str, Any]) -> Tuple[int, str]:
+        try:
+            return super().respond(endpoint, params)
+        except ReplayMissError:
+            return 500, error_envelope(f"No recorded payload for {endpoint}")
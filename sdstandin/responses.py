@@ -0,0 +1,62 @@
+# SPDX-FileCopyrightText: Magenta ApS
+#
+# SPDX-License-Identifier: MPL-2.0
+"""
+Helpers for rendering responses in the XML format used by SD.
+"""
+
+from datetime import date
+from datetime import datetime
+from typing import Dict
+from typing import Iterable
+
+from lxml import etree
+from lxml.builder import E
+
+
+def sd_date(value: date) -> str:
+    return value.strftime("%Y-%m-%d")
+
+
+def parse_sd_date(value: str) -> date:
+    """Parse a date in the format used in the SD request parameters."""
+    return datetime.strptime(value, "%d.%m.%Y").date()
+
+
+def parse_sd_datetime(date_value: str, time_value: str | None) -> datetime:
+    """Parse a date and an optional time (HH:MM) from the SD request parameters."""
+    parsed = datetime.strptime(date_value, "%d.%m.%Y")
+    if time_value:
+        time = datetime.strptime(time_value[:5], "%H:%M")
+        parsed = parsed.replace(hour=time.hour, minute=time.minute)
+    return parsed
+
+
+def sd_response(
+    endpoint: str, params: Dict[str, str], elements: Iterable[etree._Element]
+) -> str:
+    """
+    Render an SD response for the endpoint, i.e. the request structure
+    echoing the request parameters followed by the given elements.
+    """
+    root = E(
+        endpoint,
+        E.RequestStructure(*(E(key, value) for key, value in params.items())),
+        creationDateTime=datetime.now().isoformat(timespec="seconds"),
+    )
+    root.extend(elements)
+    return etree.tostring(root, encoding="unicode", pretty_print=True)
+
+
+def error_envelope(message: str) -> str:
+    """Render an SD error envelope (a SOAP fault)."""
+    envelope = E.Envelope(
+        E.Body(
+            E.Fault(
+                E.faultcode("soap:Client"),
+                E.faultstring(message),
+                E.detail(E.message(message)),
+            )
+        )
+    )
+    return etree.tostring(envelope, encoding="unicode", pretty_print=True)
@@ -0,0 +1,528 @@
+# SPDX-FileCopyrightText: Magenta ApS
+#
+# SPDX-License-Identifier: MPL-2.0
+from collections import defaultdict
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Set
+from typing import Tuple
+from uuid import UUID
+
+from lxml import etree
+from lxml.builder import E
+
+from .models import Department
+from .models import Employment
+from .models import EmploymentStatusPeriod
+from .models import Institution
+from .models import Person
+from .models import Profession
+from .responses import error_envelope
+from .responses import parse_sd_date
+from .responses import parse_sd_datetime
+from .responses import sd_date
+from .responses import sd_response
+
+Params = Dict[str, str]
+
+# Employment status codes selected by the StatusActiveIndicator and the
+# StatusPassiveIndicator respectively
+ACTIVE_STATUS_CODES = {"0", "1", "3"}
+PASSIVE_STATUS_CODES = {"7", "8", "9", "S"}
+
+# ChangedAtDate requests for longer periods scan all persons instead of
+# using the registration index
+MAX_INDEXED_PERIOD_DAYS = 366
+
+
+class SDRequestError(Exception):
+    """The request cannot be answered, i.e. SD responds with an error envelope."""
+
+
+def example_institution() -> Institution:
+    """A small institution used when no data file is given."""
+    changed_at = datetime(2024, 1, 1, 12, 0)
+    root_uuid = UUID("8d0f9a3e-43f4-4ff3-9b7c-3f4a0e0e2d55")
+    leaf_uuid = UUID("6a1b8d6e-2c4f-4d07-8a5f-1f0e1d6c7b10")
+    return Institution(
+        identifier="XX",
+        uuid=UUID("2b3b9e4f-2e2f-4f47-8d49-6a1c6f0b0c01"),
+        name="Example institution",
+        region_identifier="XY",
+        region_uuid=UUID("0b7e3d0f-1d9f-4d8a-9a5d-6e2b6f7c8d02"),
+        departments=[
+            Department(
+                identifier="ROOT", uuid=root_uuid, level="NY1-niveau", name="Root"
+            ),
+            Department(
+                identifier="LEAF",
+                uuid=leaf_uuid,
+                level="Afdelings-niveau",
+                name="Leaf",
+                parent_uuid=root_uuid,
+            ),
+        ],
+        persons=[
+            Person(
+                cpr="0101011234",
+                given_name="Bruce",
+                surname="Lee",
+                changed_at=changed_at,
+                employments=[
+                    Employment(
+                        identifier="12345",
+                        department_uuid=leaf_uuid,
+                        job_position_identifier="1",
+                        employment_name="Employee",
+                        employment_date=date(2020, 1, 1),
+                        activation_date=date(2020, 1, 1),
+                        changed_at=changed_at,
+                        statuses=[
+                            EmploymentStatusPeriod(
+                                status_code="1",
+                                activation_date=date(2020, 1, 1),
+                                changed_at=changed_at,
+                            )
+                        ],
+                    )
+                ],
+            )
+        ],
+        professions=[Profession(job_position_identifier="1", name="Employee")],
+    )
+
+
+def _is_true(params: Params, key: str, default: bool = True) -> bool:
+    value = params.get(key)
+    if value is None:
+        return default
+    return value.lower() == "true"
+
+
+def _overlaps(
+    activation_date: date, deactivation_date: date, from_date: date, to_date: date
+) -> bool:
+    return activation_date <= to_date and from_date <= deactivation_date
+
+
+class SyntheticSD:
+    """
+    Answers the SD requests used by sdlon from a synthetic institution.
+
+    Only the features of the SD web services used by sdlon are implemented,
+    e.g. every employment has a single department, profession and status
+    period.
+    """
+
+    def __init__(self, institution: Institution):
+        self.institution = institution
+        self.departments: Dict[UUID, Department] = {
+            department.uuid: department for department in institution.departments
+        }
+        self.persons: Dict[str, Person] = {
+            person.cpr: person for person in institution.persons
+        }
+        self.employments: Dict[str, Tuple[Person, Employment]] = {
+            employment.identifier: (person, employment)
+            for person in institution.persons
+            for employment in person.employments
+        }
+        # Index of the persons by the dates of their registrations in SD, used
+        # to answer the ChangedAtDate requests without scanning all persons
+        self.registrations: Dict[date, List[int]] = defaultdict(list)
+        for i, person in enumerate(institution.persons):
+            registration_dates = {person.changed_at.date()}
+            for employment in person.employments:
+                registration_dates.add(employment.changed_at.date())
+                registration_dates.update(
+                    status.changed_at.date() for status in employment.statuses
+                )
+            for registration_date in registration_dates:
+                self.registrations[registration_date].append(i)
+        self.professions: Dict[str, Profession] = {
+            profession.job_position_identifier: profession
+            for profession in institution.professions
+        }
+        self.endpoints: Dict[str, Callable[[Params], Iterable[etree._Element]]] = {
+            "GetInstitution20111201": self.get_institution,
+            "GetDepartment20111201": self.get_department,
+            "GetDepartmentParent20190701": self.get_department_parent,
+            "GetProfession20080201": self.get_profession,
+            "GetPerson20111201": self.get_person,
+            "GetPersonChangedAtDate20111201": self.get_person_changed_at_date,
+            "GetEmployment20111201": self.get_employment,
+            "GetEmploymentChanged20111201": self.get_employment_changed,
+            "GetEmploymentChangedAtDate20111201": self.get_employment_changed_at_date,
+        }
+
+    def respond(self, endpoint: str, params: Params) -> Tuple[int, str]:
+        """
+        Answer a request.
+
+        Returns:
+            Tuple with the HTTP status code and the XML response
+        """
+        handler = self.endpoints.get(endpoint)
+        if handler is None:
+            return 500, error_envelope(f"Unknown service: {endpoint}")
+        institution_identifier = params.get("InstitutionIdentifier")
+        if institution_identifier != self.institution.identifier:
+            return 500, error_envelope(
+                f"The stated InstitutionIdentifier ({institution_identifier}) "
+                "does not exist"
+            )
+        try:
+            elements = list(handler(params))
+        except SDRequestError as e:
+            return 500, error_envelope(str(e))
+        return 200, sd_response(endpoint, params, elements)
+
+    # Institution and departments
+
+    def _institution_header(self) -> Iterator[etree._Element]:
+        yield E.RegionIdentifier(self.institution.region_identifier)
+        yield E.RegionUUIDIdentifier(str(self.institution.region_uuid))
+        yield E.InstitutionIdentifier(self.institution.identifier)
+        yield E.InstitutionUUIDIdentifier(str(self.institution.uuid))
+
+    def get_institution(self, params: Params) -> Iterator[etree._Element]:
+        yield E.Region(
+            E.RegionIdentifier(self.institution.region_identifier),
+            E.RegionUUIDIdentifier(str(self.institution.region_uuid)),
+            E.Institution(
+                E.InstitutionIdentifier(self.institution.identifier),
+                E.InstitutionUUIDIdentifier(str(self.institution.uuid)),
+                E.InstitutionName(self.institution.name),
+            ),
+        )
+
+    def get_department(self, params: Params) -> Iterator[etree._Element]:
+        from_date = parse_sd_date(params.get("ActivationDate", "01.01.0001"))
+        to_date = parse_sd_date(params.get("DeactivationDate", "31.12.9999"))
+        uuid = params.get("DepartmentUUIDIdentifier")
+        identifier = params.get("DepartmentIdentifier")
+        level = params.get("DepartmentLevelIdentifier")
+
+        yield from self._institution_header()
+        for department in self.institution.departments:
+            if uuid is not None and str(department.uuid) != uuid:
+                continue
+            if identifier is not None and department.identifier != identifier:
+                continue
+            if level is not None and department.level != level:
+                continue
+            if not _overlaps(
+                department.activation_date,
+                department.deactivation_date,
+                from_date,
+                to_date,
+            ):
+                continue
+            yield E.Department(
+                E.ActivationDate(sd_date(department.activation_date)),
+                E.DeactivationDate(sd_date(department.deactivation_date)),
+                E.DepartmentIdentifier(department.identifier),
+                E.DepartmentUUIDIdentifier(str(department.uuid)),
+                E.DepartmentLevelIdentifier(department.level),
+                E.DepartmentName(department.name),
+            )
+
+    def get_department_parent(self, params: Params) -> Iterator[etree._Element]:
+        effective_date = parse_sd_date(params["EffectiveDate"])
+        department = self.departments.get(UUID(params["DepartmentUUIDIdentifier"]))
+        if department is None or not _overlaps(
+            department.activation_date,
+            department.deactivation_date,
+            effective_date,
+            effective_date,
+        ):
+            return
+        parent_uuid = department.parent_uuid or self.institution.uuid
+        yield E.DepartmentParent(E.DepartmentUUIDIdentifier(str(parent_uuid)))
+
+    def get_profession(self, params: Params) -> Iterator[etree._Element]:
+        job_position_identifier = params.get("JobPositionIdentifier")
+        for profession in self.institution.professions:
+            if (
+                job_position_identifier is not None
+                and profession.job_position_identifier != job_position_identifier
+            ):
+                continue
+            yield E.Profession(
+                E.JobPositionIdentifier(profession.job_position_identifier),
+                E.JobPositionName(profession.name),
+                E.JobPositionLevelCode("0"),
+            )
+
+    # Persons and employments
+
+    def _filter_persons(self, params: Params) -> Iterable[Person]:
+        cpr = params.get("PersonCivilRegistrationIdentifier")
+        if cpr is None:
+            return self.institution.persons
+        person = self.persons.get(cpr)
+        return [] if person is None else [person]
+
+    def _filter_registered_persons(
+        self, params: Params, from_datetime: datetime, to_datetime: datetime
+    ) -> Iterable[Person]:
+        """
+        Get the persons (optionally filtered by CPR) with registrations between
+        from_datetime and to_datetime.
+        """
+        if "PersonCivilRegistrationIdentifier" in params:
+            return self._filter_persons(params)
+        if (to_datetime - from_datetime).days > MAX_INDEXED_PERIOD_DAYS:
+            return self.institution.persons
+        indices: Set[int] = set()
+        day = from_datetime.date()
+        while day <= to_datetime.date():
+            indices.update(self.registrations.get(day, []))
+            day += timedelta(days=1)
+        return [self.institution.persons[i] for i in sorted(indices)]
+
+    def _person(
+        self, person: Person, employments: Iterable[etree._Element]
+    ) -> etree._Element:
+        return E.Person(
+            E.PersonCivilRegistrationIdentifier(person.cpr),
+            E.PersonGivenName(person.given_name),
+            E.PersonSurnameName(person.surname),
+            *employments,
+        )
+
+    def _employment(
+        self,
+        employment: Employment,
+        params: Params,
+        changed: bool,
+        include_details: bool,
+        include_status: Callable[[EmploymentStatusPeriod], bool],
+    ) -> etree._Element:
+        """
+        Render an employment. The elements of the GetEmploymentChanged(AtDate)
+        responses carry a changedAtDate attribute.
+
+        Args:
+            employment: the employment to render
+            params: the request parameters
+            changed: whether to add the changedAtDate attributes
+            include_details: whether to include the department, profession
+                and working time of the employment
+            include_status: predicate selecting the status periods to include
+        """
+        attrib = {"changedAtDate": sd_date(employment.changed_at)} if changed else {}
+
+        def period(*children: etree._Element) -> list[etree._Element]:
+            return [
+                E.ActivationDate(sd_date(employment.activation_date)),
+                E.DeactivationDate(sd_date(employment.deactivation_date)),
+                *children,
+            ]
+
+        element = E.Employment(
+            E.EmploymentIdentifier(employment.identifier),
+            E.EmploymentDate(sd_date(employment.employment_date)),
+            E.AnniversaryDate(sd_date(employment.employment_date)),
+        )
+        if include_details and _is_true(params, "DepartmentIndicator"):
+            department = self.departments[employment.department_uuid]
+            element.append(
+                E.EmploymentDepartment(
+                    *period(
+                        E.DepartmentIdentifier(department.identifier),
+                        E.DepartmentUUIDIdentifier(str(department.uuid)),
+                    ),
+                    **attrib,
+                )
+            )
+        if include_details and _is_true(params, "ProfessionIndicator"):
+            element.append(
+                E.Profession(
+                    *period(
+                        E.JobPositionIdentifier(employment.job_position_identifier),
+                        E.EmploymentName(employment.employment_name),
+                        E.AppointmentCode("0"),
+                    ),
+                    **attrib,
+                )
+            )
+        if include_details and _is_true(params, "WorkingTimeIndicator", default=False):
+            element.append(
+                E.WorkingTime(
+                    *period(
+                        E.OccupationRate(employment.occupation_rate),
+                        E.SalaryRate(employment.occupation_rate),
+                        E.SalariedIndicator("true"),
+                        E.FullTimeIndicator("true"),
+                    ),
+                    **attrib,
+                )
+            )
+        if _is_true(params, "EmploymentStatusIndicator"):
+            for status in filter(include_status, employment.statuses):
+                status_attrib = (
+                    {"changedAtDate": sd_date(status.changed_at)} if changed else {}
+                )
+                element.append(
+                    E.EmploymentStatus(
+                        E.ActivationDate(sd_date(status.activation_date)),
+                        E.DeactivationDate(sd_date(status.deactivation_date)),
+                        E.EmploymentStatusCode(status.status_code),
+                        **status_attrib,
+                    )
+                )
+        return element
+
+    def _employments(
+        self,
+        params: Params,
+        include: Callable[[Employment], bool],
+        render: Callable[[Employment], etree._Element],
+        persons: Iterable[Person] | None = None,
+    ) -> Iterator[etree._Element]:
+        employment_identifier = params.get("EmploymentIdentifier")
+        department_identifier = params.get("DepartmentIdentifier")
+
+        found = False
+        if persons is None:
+            persons = self._filter_persons(params)
+        for person in persons:
+            employments = [
+                render(employment)
+                for employment in person.employments
+                if (
+                    employment_identifier is None
+                    or employment.identifier == employment_identifier
+                )
+                and (
+                    department_identifier is None
+                    or self.departments[employment.department_uuid].identifier
+                    == department_identifier
+                )
+                and include(employment)
+            ]
+            if employments:
+                found = True
+                yield self._person(person, employments)
+
+        if employment_identifier is not None and not found:
+            raise SDRequestError(
+                f"The stated EmploymentIdentifier ({employment_identifier}) "
+                "does not exist"
+            )
+
+    def _changed_window(self, params: Params) -> Tuple[datetime, datetime]:
+        from_datetime = parse_sd_datetime(
+            params["ActivationDate"], params.get("ActivationTime")
+        )
+        to_datetime = parse_sd_datetime(
+            params.get("DeactivationDate", "31.12.9999"),
+            params.get("DeactivationTime", "23:59"),
+        )
+        return from_datetime, to_datetime
+
+    def get_person(self, params: Params) -> Iterator[etree._Element]:
+        effective_date = parse_sd_date(params["EffectiveDate"])
+        for person in self._filter_persons(params):
+            yield self._person(
+                person,
+                (
+                    E.Employment(E.EmploymentIdentifier(employment.identifier))
+                    for employment in person.employments
+                    if _overlaps(
+                        employment.activation_date,
+                        employment.deactivation_date,
+                        effective_date,
+                        effective_date,
+                    )
+                ),
+            )
+
+    def get_person_changed_at_date(self, params: Params) -> Iterator[etree._Element]:
+        from_datetime, to_datetime = self._changed_window(params)
+        persons = self._filter_registered_persons(params, from_datetime, to_datetime)
+        for person in persons:
+            if from_datetime <= person.changed_at <= to_datetime:
+                yield self._person(
+                    person,
+                    (
+                        E.Employment(E.EmploymentIdentifier(employment.identifier))
+                        for employment in person.employments
+                    ),
+                )
+
+    def get_employment(self, params: Params) -> Iterator[etree._Element]:
+        effective_date = parse_sd_date(params["EffectiveDate"])
+        status_codes = set()
+        if _is_true(params, "StatusActiveIndicator"):
+            status_codes |= ACTIVE_STATUS_CODES
+        if _is_true(params, "StatusPassiveIndicator"):
+            status_codes |= PASSIVE_STATUS_CODES
+
+        def is_current(status: EmploymentStatusPeriod) -> bool:
+            return _overlaps(
+                status.activation_date,
+                status.deactivation_date,
+                effective_date,
+                effective_date,
+            )
+
+        def include(employment: Employment) -> bool:
+            return any(
+                is_current(status) and status.status_code in status_codes
+                for status in employment.statuses
+            )
+
+        yield from self._employments(
+            params,
+            include,
+            lambda employment: self._employment(
+                employment, params, False, True, is_current
+            ),
+        )
+
+    def get_employment_changed(self, params: Params) -> Iterator[etree._Element]:
+        from_date = parse_sd_date(params["ActivationDate"])
+        to_date = parse_sd_date(params.get("DeactivationDate", "31.12.9999"))
+
+        def in_period(status: EmploymentStatusPeriod) -> bool:
+            return _overlaps(
+                status.activation_date, status.deactivation_date, from_date, to_date
+            )
+
+        yield from self._employments(
+            params,
+            lambda employment: any(map(in_period, employment.statuses)),
+            lambda employment: self._employment(
+                employment, params, True, True, in_period
+            ),
+        )
+
+    def get_employment_changed_at_date(
+        self, params: Params
+    ) -> Iterator[etree._Element]:
+        """
+        Only the parts of the employments registered within the requested
+        period are included.
+        """
+        from_datetime, to_datetime = self._changed_window(params)
+
+        def registered(item: Employment | EmploymentStatusPeriod) -> bool:
+            return from_datetime <= item.changed_at <= to_datetime
+
+        yield from self._employments(
+            params,
+            lambda employment: registered(employment)
+            or any(map(registered, employment.statuses)),
+            lambda employment: self._employment(
+                employment, params, True, registered(employment), registered
+            ),
+            self._filter_registered_persons(params, from_datetime, to_datetime),
+        )
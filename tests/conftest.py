@@ -1,8 +1,29 @@
+from typing import Any
+from typing import Callable
 from unittest.mock import MagicMock
 
 import pytest
 
+from sdlon.config import Settings
+
+from .test_config import DEFAULT_CHANGED_AT_SETTINGS
+
 
 @pytest.fixture
 def mock_graphql_client():
     return MagicMock()
+
+
+@pytest.fixture
+def make_settings() -> Callable[..., Settings]:
+    """
+    Make Settings with the required settings set and the payload persistence
+    disabled, overridden by the given settings.
+    """
+
+    def make(**kwargs: Any) -> Settings:
+        return Settings.parse_obj(
+            {**DEFAULT_CHANGED_AT_SETTINGS, "sd_persist_payloads": False, **kwargs}
+        )
+
+    return make
@@ -0,0 +1,35 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+from db.compression import compress_response
+from db.compression import decompress_response
+from db.compression import payload_response
+from db.models import Payload
+from db.models import PayloadBody
+
+
+def test_compression_roundtrip():
+    response = "<GetPerson20111201>æøå</GetPerson20111201>" * 100
+    compressed = compress_response(response)
+    assert len(compressed) < len(response.encode("utf-8"))
+    assert decompress_response(compressed) == response
+    # psycopg2 returns bytea columns as memoryviews
+    assert decompress_response(memoryview(compressed)) == response  # type: ignore
+
+
+def test_payload_response():
+    assert payload_response("response", None) == "response"
+    assert payload_response(None, compress_response("response")) == "response"
+    assert payload_response(None, None) is None
+
+
+def test_payload_response_text():
+    assert Payload(response="response").response_text == "response"
+    assert (
+        Payload(response_compressed=compress_response("response")).response_text
+        == "response"
+    )
+
+
+def test_payload_response_text_from_body():
+    body = PayloadBody(response_compressed=compress_response("response"))
+    assert Payload(body=body).response_text == "response"
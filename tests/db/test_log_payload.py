@@ -1,20 +1,44 @@
 # SPDX-FileCopyrightText: Magenta ApS
 # SPDX-License-Identifier: MPL-2.0
 import uuid
+from io import BytesIO
+from unittest.mock import MagicMock
 from unittest.mock import Mock
 
+import pytest
 from pytest import MonkeyPatch
 
 import db.models
 import db.queries
+from db.compression import decompress_response
+from db.payload_body import response_hash
+
+RESPONSE = """
+<GetEmploymentChangedAtDate20111201>
+  <Person>
+    <PersonCivilRegistrationIdentifier>1212121000</PersonCivilRegistrationIdentifier>
+    <Employment>
+      <EmploymentIdentifier>12345</EmploymentIdentifier>
+    </Employment>
+  </Person>
+</GetEmploymentChangedAtDate20111201>
+"""
+
+
+def _mock_session() -> MagicMock:
+    mock_session = MagicMock()
+    mock_session.__enter__.return_value = mock_session
+    return mock_session
 
 
 def test_log_payload(monkeypatch: MonkeyPatch) -> None:
     # Arrange
     request_uuid: uuid.UUID = uuid.uuid4()
-    mock_session: Mock = Mock()
+    mock_session: MagicMock = _mock_session()
     mock_session_maker: Mock = Mock(return_value=mock_session)
-    monkeypatch.setattr(db.queries, "get_engine", lambda: None)
+    mock_ensure_partitions: Mock = Mock()
+    monkeypatch.setattr(db.queries, "ensure_partitions", mock_ensure_partitions)
+    monkeypatch.setattr(db.queries, "get_engine", MagicMock())
     monkeypatch.setattr(db.queries, "Session", mock_session_maker)
     # Act
     db.queries.log_payload(
@@ -26,10 +50,110 @@ def test_log_payload(monkeypatch: MonkeyPatch) -> None:
     )
     # Assert
     mock_session.add.assert_called_once()
+    assert list(mock_session.add_all.call_args.args[0]) == []
     mock_session.commit.assert_called_once()
     payload: db.models.Payload = mock_session.add.call_args.args[0]
     assert payload.id == request_uuid
     assert payload.full_url == "full_url"
     assert payload.params == "params"
-    assert payload.response == "response"
+    assert payload.response is None
+    assert payload.response_hash == response_hash("response")
     assert payload.status_code == 200
+    body = mock_session.execute.call_args.args[0].compile().params
+    assert body["hash"] == response_hash("response")
+    assert body["response"] == "response"
+    mock_ensure_partitions.assert_called_once_with(
+        db.queries.get_engine.return_value,
+        payload.timestamp,  # type: ignore
+    )
+
+
+def test_log_payload_compressed(monkeypatch: MonkeyPatch) -> None:
+    # Arrange
+    mock_session: MagicMock = _mock_session()
+    monkeypatch.setattr(db.queries, "get_engine", MagicMock())
+    monkeypatch.setattr(db.queries, "Session", Mock(return_value=mock_session))
+    # Act
+    db.queries.log_payload(
+        request_uuid=uuid.uuid4(),
+        full_url="full_url",
+        params="params",
+        response="response",
+        status_code=200,
+        compress=True,
+    )
+    # Assert
+    body = mock_session.execute.call_args.args[0].compile().params
+    assert body["response"] is None
+    assert decompress_response(body["response_compressed"]) == "response"
+
+
+def test_log_payload_indexes_persons(monkeypatch: MonkeyPatch) -> None:
+    # Arrange
+    request_uuid: uuid.UUID = uuid.uuid4()
+    mock_session: MagicMock = _mock_session()
+    monkeypatch.setattr(db.queries, "get_engine", MagicMock())
+    monkeypatch.setattr(db.queries, "Session", Mock(return_value=mock_session))
+    # Act
+    db.queries.log_payload(
+        request_uuid=request_uuid,
+        full_url="full_url",
+        params="params",
+        response=RESPONSE,
+        status_code=200,
+    )
+    # Assert
+    payload: db.models.Payload = mock_session.add.call_args.args[0]
+    (index,) = list(mock_session.add_all.call_args.args[0])
+    assert index.payload_id == request_uuid
+    assert index.cpr == "1212121000"
+    assert index.employment_identifier == "12345"
+    assert index.timestamp == payload.timestamp
+
+
+def test_log_payload_from_file(monkeypatch: MonkeyPatch) -> None:
+    # Arrange
+    mock_session: MagicMock = _mock_session()
+    monkeypatch.setattr(db.queries, "get_engine", MagicMock())
+    monkeypatch.setattr(db.queries, "Session", Mock(return_value=mock_session))
+    response_file = BytesIO(RESPONSE.encode("utf-8"))
+    # Act
+    db.queries.log_payload(
+        request_uuid=uuid.uuid4(),
+        full_url="full_url",
+        params="params",
+        response=response_file,
+        status_code=200,
+    )
+    # Assert
+    body = mock_session.execute.call_args.args[0].compile().params
+    assert body["hash"] == response_hash(RESPONSE)
+    # Responses in files are always stored compressed
+    assert body["response"] is None
+    assert decompress_response(body["response_compressed"]) == RESPONSE
+    (index,) = list(mock_session.add_all.call_args.args[0])
+    assert index.cpr == "1212121000"
+
+
+def test_log_payload_closes_session_when_insert_fails(
+    monkeypatch: MonkeyPatch,
+) -> None:
+    # Arrange
+    mock_session: MagicMock = _mock_session()
+    mock_session.execute.side_effect = RuntimeError("insert failed")
+    monkeypatch.setattr(db.queries, "get_engine", MagicMock())
+    monkeypatch.setattr(db.queries, "Session", Mock(return_value=mock_session))
+    # Act
+    with pytest.raises(RuntimeError):
+        db.queries.log_payload(
+            request_uuid=uuid.uuid4(),
+            full_url="full_url",
+            params="params",
+            response="response",
+            status_code=200,
+        )
+    # Assert
+    # Closing the session rolls back the transaction, which releases the
+    # payload body lock and returns the connection to the pool
+    mock_session.__exit__.assert_called_once()
+    mock_session.commit.assert_not_called()
@@ -0,0 +1,159 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from db.partitions import add_months
+from db.partitions import create_partitions
+from db.partitions import ensure_partitions
+from db.partitions import get_partition_months
+from db.partitions import month_start
+from db.partitions import prune_partitions
+
+
+def _statements(connection: MagicMock) -> list[str]:
+    return [str(call.args[0]) for call in connection.execute.call_args_list]
+
+
+@pytest.mark.parametrize(
+    "month,months,expected",
+    [
+        (date(2024, 1, 1), 1, date(2024, 2, 1)),
+        (date(2024, 12, 1), 1, date(2025, 1, 1)),
+        (date(2024, 1, 1), -1, date(2023, 12, 1)),
+        (date(2024, 3, 1), -14, date(2023, 1, 1)),
+    ],
+)
+def test_add_months(month: date, months: int, expected: date):
+    assert add_months(month, months) == expected
+
+
+def test_month_start_uses_utc():
+    timestamp = datetime(2024, 2, 1, 0, 30, tzinfo=timezone(timedelta(hours=1)))
+    assert month_start(timestamp) == date(2024, 1, 1)
+
+
+def test_create_partitions():
+    # Arrange
+    connection = MagicMock()
+
+    # Act
+    create_partitions(connection, date(2024, 12, 1))
+
+    # Assert
+    assert _statements(connection) == [
+        "CREATE TABLE IF NOT EXISTS payload_2024_12 PARTITION OF payload "
+        "FOR VALUES FROM ('2024-12-01 00:00:00+00') TO ('2025-01-01 00:00:00+00')",
+        "CREATE TABLE IF NOT EXISTS payload_index_2024_12 PARTITION OF "
+        "payload_index FOR VALUES FROM ('2024-12-01 00:00:00+00') "
+        "TO ('2025-01-01 00:00:00+00')",
+    ]
+
+
+@patch("db.partitions._ensured_months", set())
+def test_ensure_partitions_creates_partitions_once_per_month():
+    # Arrange
+    engine = MagicMock()
+    connection = engine.begin.return_value.__enter__.return_value
+
+    # Act
+    ensure_partitions(engine, datetime(2024, 1, 1, tzinfo=timezone.utc))
+    ensure_partitions(engine, datetime(2024, 1, 31, tzinfo=timezone.utc))
+    ensure_partitions(engine, datetime(2024, 2, 1, tzinfo=timezone.utc))
+
+    # Assert
+    # Each month is created in a transaction of its own
+    assert engine.begin.call_count == 2
+    statements = _statements(connection)
+    assert len(statements) == 4
+    assert "payload_2024_01" in statements[0]
+    assert "payload_2024_02" in statements[2]
+
+
+@patch("db.partitions._ensured_months", set())
+@patch("db.partitions.create_partitions")
+def test_ensure_partitions_survives_rollback_of_the_payload_transaction(
+    mock_create_partitions: MagicMock, tmp_path
+):
+    # Arrange
+    engine = create_engine(f"sqlite:///{tmp_path / 'payload.db'}")
+    timestamp = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def create_partition(connection: Connection, month: date) -> None:
+        # Stands in for the Postgres partition of the month
+        connection.execute(text("CREATE TABLE payload_2024_01 (id INTEGER)"))
+
+    mock_create_partitions.side_effect = create_partition
+
+    def write_payload(payload_id: int, fail: bool = False) -> None:
+        with engine.begin() as connection:
+            ensure_partitions(engine, timestamp)
+            connection.execute(
+                text("INSERT INTO payload_2024_01 VALUES (:id)"), {"id": payload_id}
+            )
+            if fail:
+                raise ValueError("Duplicate payload")
+
+    # Act
+    with pytest.raises(ValueError):
+        write_payload(1, fail=True)
+    write_payload(2)
+
+    # Assert
+    mock_create_partitions.assert_called_once()
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT id FROM payload_2024_01")).all()
+    assert rows == [(2,)]
+
+
+def test_get_partition_months():
+    # Arrange
+    connection = MagicMock()
+    connection.execute.return_value = [
+        ("payload_2024_02",),
+        ("payload_2023_12",),
+        ("payload_default",),
+    ]
+
+    # Act
+    months = get_partition_months(connection, "payload")
+
+    # Assert
+    assert months == [date(2023, 12, 1), date(2024, 2, 1)]
+    assert connection.execute.call_args.args[1] == {"table": "payload"}
+
+
+@patch("db.partitions.get_partition_months")
+def test_prune_partitions(mock_get_partition_months: MagicMock):
+    # Arrange
+    connection = MagicMock()
+    mock_get_partition_months.return_value = [
+        date(2023, 12, 1),
+        date(2024, 1, 1),
+        date(2024, 2, 1),
+    ]
+
+    # Act
+    dropped = prune_partitions(connection, 1, today=date(2024, 2, 15))
+
+    # Assert
+    assert dropped == ["payload_2023_12", "payload_index_2023_12"]
+    statements = _statements(connection)
+    assert statements[:2] == [
+        "DROP TABLE payload_2023_12",
+        "DROP TABLE payload_index_2023_12",
+    ]
+    # The payload bodies are deleted afterwards, outside this transaction
+    assert not any(s.startswith("DELETE") for s in statements)
+    # The current and the next month are created ahead of time
+    assert "payload_2024_02" in statements[2]
+    assert "payload_index_2024_03" in statements[5]
@@ -0,0 +1,98 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+from io import BytesIO
+from unittest.mock import MagicMock
+
+from db.compression import decompress_response
+from db.payload_body import PAYLOAD_BODY_LOCK_KEY
+from db.payload_body import delete_unreferenced_payload_bodies
+from db.payload_body import normalise_response
+from db.payload_body import payload_body_row
+from db.payload_body import response_hash
+
+
+def _response(creation_date_time: str) -> str:
+    return (
+        '<?xml version="1.0" encoding="UTF-8" ?>\n'
+        "<GetDepartment20111201 "
+        f'creationDateTime="{creation_date_time}" xmlns:sd="urn:sd">\n'
+        '  <Department creationDateTime="2023-11-23T17:01:42">ABCD</Department>\n'
+        "</GetDepartment20111201>\n"
+    )
+
+
+def test_normalise_response_removes_creation_date_time_of_root():
+    # Act
+    normalised = normalise_response(_response("2023-11-23T17:01:42"))
+
+    # Assert
+    assert normalised == (
+        '<?xml version="1.0" encoding="UTF-8" ?>\n'
+        '<GetDepartment20111201 xmlns:sd="urn:sd">\n'
+        '  <Department creationDateTime="2023-11-23T17:01:42">ABCD</Department>\n'
+        "</GetDepartment20111201>\n"
+    )
+    assert normalise_response("<Envelope/>") == "<Envelope/>"
+
+
+def test_responses_created_at_different_times_have_the_same_body():
+    # Arrange
+    first = _response("2023-11-23T17:01:42")
+    second = _response("2023-11-24T08:12:00")
+
+    # Act
+    first_row = payload_body_row(first)
+    second_row = payload_body_row(second, compress=True)
+
+    # Assert
+    assert response_hash(first) == response_hash(second)
+    assert first_row["hash"] == second_row["hash"] == response_hash(first)
+    assert first_row["response"] == normalise_response(first)
+    assert decompress_response(second_row["response_compressed"]) == (
+        normalise_response(first)
+    )
+
+
+def test_payload_body_row_from_file():
+    # Arrange
+    response = _response("2023-11-23T17:01:42")
+
+    # Act
+    row = payload_body_row(BytesIO(response.encode("utf-8")))
+
+    # Assert
+    assert row["hash"] == response_hash(response)
+    assert row["response"] is None
+    assert decompress_response(row["response_compressed"]) == (
+        normalise_response(response)
+    )
+
+
+def test_delete_unreferenced_payload_bodies_in_locked_batches():
+    # Arrange
+    engine = MagicMock()
+    connection = engine.begin.return_value.__enter__.return_value
+    connection.execute.return_value.one.side_effect = [
+        ("hash-2", 1),
+        ("hash-4", 2),
+        (None, 0),
+    ]
+
+    # Act
+    deleted = delete_unreferenced_payload_bodies(engine, batch_size=2)
+
+    # Assert
+    assert deleted == 3
+    # One transaction per batch
+    assert engine.begin.call_count == 3
+    calls = connection.execute.call_args_list
+    # Each batch takes the payload body lock exclusively before deleting
+    assert [str(call.args[0]) for call in calls[::2]] == [
+        "SELECT pg_advisory_xact_lock(:key)"
+    ] * 3
+    assert all(call.args[1] == {"key": PAYLOAD_BODY_LOCK_KEY} for call in calls[::2])
+    assert [call.args[1] for call in calls[1::2]] == [
+        {"last_hash": "", "batch_size": 2},
+        {"last_hash": "hash-2", "batch_size": 2},
+        {"last_hash": "hash-4", "batch_size": 2},
+    ]
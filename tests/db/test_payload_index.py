@@ -0,0 +1,69 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+from datetime import datetime
+from uuid import UUID
+from uuid import uuid4
+
+from db.payload_index import IndexEntry
+from db.payload_index import extract_index_entries
+from db.payload_index import payload_index_rows
+
+DEPARTMENT_UUID = UUID("eb25d197-d278-41ac-abc1-cc7802093130")
+
+RESPONSE = f"""<?xml version="1.0" encoding="UTF-8" ?>
+<GetEmploymentChangedAtDate20111201 creationDateTime="2023-11-23T17:01:42">
+  <RequestStructure>
+    <InstitutionIdentifier>XY</InstitutionIdentifier>
+  </RequestStructure>
+  <Person>
+    <PersonCivilRegistrationIdentifier>1212121000</PersonCivilRegistrationIdentifier>
+    <Employment>
+      <EmploymentIdentifier>12345</EmploymentIdentifier>
+      <EmploymentDepartment changedAtDate="2023-11-23">
+        <DepartmentIdentifier>ABCD</DepartmentIdentifier>
+        <DepartmentUUIDIdentifier>{DEPARTMENT_UUID}</DepartmentUUIDIdentifier>
+      </EmploymentDepartment>
+      <EmploymentDepartment changedAtDate="2023-11-24">
+        <DepartmentIdentifier>ABCD</DepartmentIdentifier>
+        <DepartmentUUIDIdentifier>{DEPARTMENT_UUID}</DepartmentUUIDIdentifier>
+      </EmploymentDepartment>
+    </Employment>
+    <Employment>
+      <EmploymentIdentifier>54321</EmploymentIdentifier>
+    </Employment>
+  </Person>
+  <Person>
+    <PersonCivilRegistrationIdentifier>2212221000</PersonCivilRegistrationIdentifier>
+  </Person>
+</GetEmploymentChangedAtDate20111201>
+"""
+
+
+def test_extract_index_entries():
+    assert extract_index_entries(RESPONSE) == [
+        IndexEntry("1212121000", "12345", DEPARTMENT_UUID),
+        IndexEntry("1212121000", "54321", None),
+        IndexEntry("2212221000", None, None),
+    ]
+
+
+def test_extract_index_entries_without_persons():
+    assert extract_index_entries("<GetOrganization20111201/>") == []
+    assert extract_index_entries("not XML") == []
+    assert extract_index_entries("") == []
+
+
+def test_payload_index_rows():
+    payload_id = uuid4()
+    timestamp = datetime(2024, 1, 1)
+
+    rows = payload_index_rows(payload_id, RESPONSE, timestamp)
+
+    assert len(rows) == 3
+    assert rows[0] == {
+        "payload_id": payload_id,
+        "cpr": "1212121000",
+        "employment_identifier": "12345",
+        "department_uuid": DEPARTMENT_UUID,
+        "timestamp": timestamp,
+    }
@@ -0,0 +1,319 @@
+# SPDX-FileCopyrightText: Magenta ApS
+# SPDX-License-Identifier: MPL-2.0
+import tempfile
+import threading
+import uuid
+from typing import Any
+from unittest.mock import MagicMock
+from unittest.mock import call
+from unittest.mock import patch
+
+import pytest
+from prometheus_client import REGISTRY
+
+from db.compression import decompress_response
+from db.payload_body import response_hash
+from db.payload_writer import PayloadWriter
+from db.payload_writer import get_payload_writer
+from sdlon.config import Settings
+from tests.test_config import DEFAULT_CHANGED_AT_SETTINGS
+
+
+@pytest.fixture(autouse=True)
+def mock_ensure_partitions():
+    with patch("db.payload_writer.ensure_partitions") as mock:
+        yield mock
+
+
+def _put(writer: PayloadWriter, n: int = 1, compress: bool = False) -> list[bool]:
+    return [
+        writer.put(
+            request_uuid=uuid.uuid4(),
+            full_url="full_url",
+            params="params",
+            response="response",
+            status_code=200,
+            compress=compress,
+        )
+        for _ in range(n)
+    ]
+
+
+def _insert_calls(engine: MagicMock, table: str) -> list[Any]:
+    connection = engine.begin.return_value.__enter__.return_value
+    return [
+        call
+        for call in connection.execute.call_args_list
+        if getattr(getattr(call.args[0], "table", None), "name", None) == table
+    ]
+
+
+def _written_rows(engine: MagicMock, table: str = "payload") -> list[dict[str, Any]]:
+    return [row for call in _insert_calls(engine, table) for row in call.args[1]]
+
+
+def _dropped(reason: str) -> float:
+    value = REGISTRY.get_sample_value(
+        "sd_payload_rows_dropped_total", {"reason": reason}
+    )
+    return value or 0.0
+
+
+def test_payload_writer_writes_queued_payloads_in_batches():
+    # Arrange
+    engine = MagicMock()
+    writer = PayloadWriter(engine, queue_size=10, batch_size=3)
+
+    # Act
+    assert _put(writer, 7) == [True] * 7
+    writer.flush()
+
+    # Assert
+    payload_calls = _insert_calls(engine, "payload")
+    assert all(len(call.args[1]) <= 3 for call in payload_calls)
+    rows = _written_rows(engine)
+    assert len(rows) == 7
+    assert rows[0]["full_url"] == "full_url"
+    assert rows[0]["response_hash"] == response_hash("response")
+    assert rows[0]["status_code"] == 200
+    assert "response" not in rows[0]
+    assert "compress" not in rows[0]
+    writer.close()
+
+
+def test_payload_writer_writes_identical_responses_once_per_batch():
+    # Arrange
+    write_started = threading.Event()
+    release = threading.Event()
+    connection = MagicMock()
+
+    def blocking_begin():
+        write_started.set()
+        release.wait()
+        return connection
+
+    engine = MagicMock()
+    engine.begin.side_effect = blocking_begin
+    writer = PayloadWriter(engine, queue_size=10, batch_size=10)
+
+    # Act
+    _put(writer)
+    write_started.wait()
+    # Queued while the first payload is written, i.e. written in one batch
+    _put(writer, 3)
+    release.set()
+    writer.close()
+
+    # Assert
+    *_, body_call, payload_call = [
+        call
+        for call in connection.__enter__.return_value.execute.call_args_list
+        if getattr(getattr(call.args[0], "table", None), "name", None)
+        in ("payload", "payload_body")
+    ]
+    assert len(payload_call.args[1]) == 3
+    assert body_call.args[1] == [
+        {
+            "hash": response_hash("response"),
+            "response": "response",
+            "response_compressed": None,
+        }
+    ]
+
+
+def test_payload_writer_compresses_responses():
+    # Arrange
+    engine = MagicMock()
+    writer = PayloadWriter(engine, queue_size=10, batch_size=10)
+
+    # Act
+    _put(writer, compress=True)
+    writer.close()
+
+    # Assert
+    (body,) = _written_rows(engine, "payload_body")
+    assert body["hash"] == response_hash("response")
+    assert body["response"] is None
+    assert decompress_response(body["response_compressed"]) == "response"
+
+
+def test_payload_writer_writes_payload_from_file():
+    # Arrange
+    engine = MagicMock()
+    writer = PayloadWriter(engine, queue_size=10, batch_size=10)
+    response = (
+        "<GetPerson20111201><Person>"
+        "<PersonCivilRegistrationIdentifier>1212121000</PersonCivilRegistrationIdentifier>"
+        "</Person></GetPerson20111201>"
+    )
+    request_uuid = uuid.uuid4()
+
+    # Act
+    with tempfile.TemporaryFile() as response_file:
+        response_file.write(response.encode("utf-8"))
+        writer.put(request_uuid, "full_url", "params", response_file, 200)
+    writer.close()
+
+    # Assert
+    (payload_row,) = _written_rows(engine)
+    (body,) = _written_rows(engine, "payload_body")
+    (index_row,) = _written_rows(engine, "payload_index")
+    assert payload_row["response_hash"] == response_hash(response)
+    assert decompress_response(body["response_compressed"]) == response
+    assert index_row["payload_id"] == request_uuid
+    assert index_row["cpr"] == "1212121000"
+
+
+def test_payload_writer_writes_payload_index_rows():
+    # Arrange
+    engine = MagicMock()
+    writer = PayloadWriter(engine, queue_size=10, batch_size=10)
+    response = (
+        "<GetPerson20111201><Person>"
+        "<PersonCivilRegistrationIdentifier>1212121000</PersonCivilRegistrationIdentifier>"
+        "</Person></GetPerson20111201>"
+    )
+
+    # Act
+    request_uuid = uuid.uuid4()
+    writer.put(request_uuid, "full_url", "params", response, 200, compress=True)
+    writer.close()
+
+    # Assert
+    (payload_row,) = _written_rows(engine)
+    (index_row,) = _written_rows(engine, "payload_index")
+    assert index_row["payload_id"] == request_uuid
+    assert index_row["cpr"] == "1212121000"
+    assert index_row["timestamp"] == payload_row["timestamp"]
+
+
+def test_payload_writer_ensures_partitions(mock_ensure_partitions: MagicMock):
+    # Arrange
+    engine = MagicMock()
+    writer = PayloadWriter(engine, queue_size=10, batch_size=10)
+
+    # Act
+    _put(writer, 2)
+    writer.close()
+
+    # Assert
+    timestamps = [row["timestamp"] for row in _written_rows(engine)]
+    assert mock_ensure_partitions.call_args_list == [
+        call(engine, timestamp) for timestamp in timestamps
+    ]
+
+
+def test_payload_writer_drops_payloads_when_queue_is_full():
+    # Arrange
+    write_started = threading.Event()
+    release = threading.Event()
+
+    def blocking_begin():
+        write_started.set()
+        release.wait()
+        return MagicMock()
+
+    engine = MagicMock()
+    engine.begin.side_effect = blocking_begin
+    writer = PayloadWriter(engine, queue_size=1, batch_size=1)
+    dropped = _dropped("queue_full")
+
+    # Act
+    _put(writer)
+    write_started.wait()
+    result = _put(writer, 2)
+    release.set()
+    writer.close()
+
+    # Assert
+    assert result == [True, False]
+    assert _dropped("queue_full") == dropped + 1
+    assert engine.begin.call_count == 2
+
+
+def test_payload_writer_flushes_on_close_and_drops_later_payloads():
+    # Arrange
+    engine = MagicMock()
+    writer = PayloadWriter(engine, queue_size=10, batch_size=10)
+    dropped = _dropped("closed")
+
+    # Act
+    _put(writer, 5)
+    writer.close()
+    result = _put(writer)
+
+    # Assert
+    assert len(_written_rows(engine)) == 5
+    assert result == [False]
+    assert _dropped("closed") == dropped + 1
+
+
+def test_payload_writer_counts_failed_writes_as_dropped():
+    # Arrange
+    engine = MagicMock()
+    engine.begin.side_effect = Exception("DB down")
+    writer = PayloadWriter(engine, queue_size=10, batch_size=10)
+    dropped = _dropped("error")
+
+    # Act
+    _put(writer, 2)
+    writer.flush()
+    writer.close()
+
+    # Assert
+    assert _dropped("error") >= dropped + 1
+
+
+def test_payload_writer_drops_only_the_failing_payloads_of_a_batch():
+    # Arrange
+    write_started = threading.Event()
+    release = threading.Event()
+    connection = MagicMock()
+
+    def blocking_begin():
+        write_started.set()
+        release.wait()
+        return connection
+
+    def execute(stmt, rows):
+        if getattr(getattr(stmt, "table", None), "name", None) == "payload" and any(
+            row["params"] == "bad" for row in rows
+        ):
+            raise ValueError("A string literal cannot contain NUL characters")
+
+    engine = MagicMock()
+    engine.begin.side_effect = blocking_begin
+    connection.__enter__.return_value.execute.side_effect = execute
+    writer = PayloadWriter(engine, queue_size=10, batch_size=10)
+    dropped = _dropped("error")
+
+    # Act
+    _put(writer)
+    write_started.wait()
+    # Queued while the first payload is written, i.e. written in one batch
+    for params in ("good", "bad", "good"):
+        writer.put(uuid.uuid4(), "full_url", params, "response", 200)
+    release.set()
+    writer.close()
+
+    # Assert
+    payload_calls = [
+        call
+        for call in connection.__enter__.return_value.execute.call_args_list
+        if getattr(getattr(call.args[0], "table", None), "name", None) == "payload"
+    ]
+    # The first payload, the failed batch and the three payloads one at a time
+    assert [len(call.args[1]) for call in payload_calls] == [1, 3, 1, 1, 1]
+    assert _dropped("error") == dropped + 1
+
+
+def test_get_payload_writer_returns_none_when_disabled():
+    settings = Settings.parse_obj(
+        {**DEFAULT_CHANGED_AT_SETTINGS, "sd_persist_payloads_in_background": False}
+    )
+    assert get_payload_writer(settings) is None
+
+    settings = Settings.parse_obj(
+        {**DEFAULT_CHANGED_AT_SETTINGS, "sd_persist_payloads": False}
+    )
+    assert get_payload_writer(settings) is None
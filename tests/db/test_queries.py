@@ -1,4 +1,5 @@
 from datetime import datetime
+from datetime import timedelta
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
@@ -9,11 +10,22 @@ from sqlalchemy.orm import Session
 
 from db.models import Base
 from db.models import Runs
+from db.queries import CompletedRun
 from db.queries import delete_last_run
+from db.queries import get_checkpoints
+from db.queries import get_completed_runs
+from db.queries import get_resume_to_date
 from db.queries import get_run_db_from_date
+from db.queries import get_run_elapsed_seconds
+from db.queries import get_run_stats
 from db.queries import get_status
+from db.queries import persist_checkpoint
+from db.queries import persist_run_stats
 from db.queries import persist_status
 from sdlon.metrics import RunDBState
+from sdlon.run_stats import RunStats
+from sdlon.run_stats import count
+from sdlon.run_stats import count_sd_call
 
 
 @patch("db.queries.get_engine")
@@ -23,6 +35,7 @@ def test_persist_and_get_status(mock_get_engine: MagicMock):
     mock_get_engine.return_value = engine
 
     Base.metadata.tables["runs"].create(bind=engine)
+    Base.metadata.tables["run_checkpoints"].create(bind=engine)
     from_date = datetime(2000, 1, 1, 12, 0, 0)
     to_date = datetime(2001, 1, 1, 12, 0, 0)
 
@@ -50,6 +63,7 @@ def test_get_status_is_unknown_for_unknown_run_state(mock_get_engine: MagicMock)
     mock_get_engine.return_value = engine
 
     Base.metadata.tables["runs"].create(bind=engine)
+    Base.metadata.tables["run_checkpoints"].create(bind=engine)
 
     # Act
     with Session(engine) as session:
@@ -67,6 +81,7 @@ def test_get_status_is_completed_for_empty_table(mock_get_engine: MagicMock):
     # Arrange
     engine = mock_get_engine()
     Base.metadata.tables["runs"].create(bind=engine)
+    Base.metadata.tables["run_checkpoints"].create(bind=engine)
 
     # Act
     status = get_status()
@@ -94,6 +109,7 @@ def test_get_run_db_from_date(mock_get_engine: MagicMock):
     mock_get_engine.return_value = engine
 
     Base.metadata.tables["runs"].create(bind=engine)
+    Base.metadata.tables["run_checkpoints"].create(bind=engine)
     from_date = datetime(2000, 1, 1, 12, 0, 0)
     to_date = datetime(2001, 1, 1, 12, 0, 0)
 
@@ -113,6 +129,7 @@ def test_delete_last_run(mock_get_engine: MagicMock) -> None:
     mock_get_engine.return_value = engine
 
     Base.metadata.tables["runs"].create(bind=engine)
+    Base.metadata.tables["run_checkpoints"].create(bind=engine)
     from_date = datetime(2000, 1, 1, 12, 0, 0)
     to_date = datetime(2001, 1, 1, 12, 0, 0)
 
@@ -136,6 +153,7 @@ def test_delete_last_run_no_op(
     mock_get_engine.return_value = engine
 
     Base.metadata.tables["runs"].create(bind=engine)
+    Base.metadata.tables["run_checkpoints"].create(bind=engine)
     from_date = datetime(2000, 1, 1, 12, 0, 0)
     to_date = datetime(2001, 1, 1, 12, 0, 0)
 
@@ -147,3 +165,218 @@ def test_delete_last_run_no_op(
     # Assert
     status = get_status()
     assert status == RunDBState.COMPLETED
+
+
+@patch("db.queries.get_engine")
+def test_checkpoints_are_deleted_when_interval_is_completed(
+    mock_get_engine: MagicMock,
+) -> None:
+    # Arrange
+    engine = create_engine("sqlite:///:memory:")
+    mock_get_engine.return_value = engine
+
+    Base.metadata.tables["runs"].create(bind=engine)
+    Base.metadata.tables["run_checkpoints"].create(bind=engine)
+    from_date = datetime(2000, 1, 1, 12, 0, 0)
+    to_date = datetime(2000, 1, 2, 12, 0, 0)
+    next_to_date = datetime(2000, 1, 3, 12, 0, 0)
+
+    run_id = persist_status(from_date, to_date, RunDBState.RUNNING)
+    persist_checkpoint(run_id, from_date, to_date, "XY", "0101709999", ["1", "2"])
+    persist_checkpoint(run_id, from_date, to_date, "ZZ", "0101709999", ["3"])
+    persist_checkpoint(run_id, to_date, next_to_date, "XY", "0101709999", ["4"])
+
+    # Act
+    checkpoints = get_checkpoints(from_date, "XY")
+    persist_status(from_date, to_date, RunDBState.COMPLETED)
+
+    # Assert
+    assert checkpoints == {
+        ("0101709999", "1"): to_date,
+        ("0101709999", "2"): to_date,
+    }
+    assert get_checkpoints(from_date, "XY") == {}
+    assert get_checkpoints(to_date, "XY") == {("0101709999", "4"): next_to_date}
+
+
+@patch("db.queries.get_engine")
+def test_restarted_run_with_later_to_date_resumes_and_removes_checkpoints(
+    mock_get_engine: MagicMock,
+) -> None:
+    # Arrange
+    engine = create_engine("sqlite:///:memory:")
+    mock_get_engine.return_value = engine
+
+    Base.metadata.tables["runs"].create(bind=engine)
+    Base.metadata.tables["run_checkpoints"].create(bind=engine)
+    from_date = datetime(2000, 1, 1, 12, 0, 0)
+    # The interrupted run ended the interval at the time it was started
+    to_date = datetime(2000, 1, 1, 15, 0, 0)
+    restart_to_date = datetime(2000, 1, 1, 18, 0, 0)
+
+    run_id = persist_status(from_date, to_date, RunDBState.RUNNING)
+    persist_checkpoint(run_id, from_date, to_date, "XY", "0101709999", ["1"])
+    delete_last_run()
+
+    # Act
+    resume_to_date = get_resume_to_date(from_date)
+    checkpoints = get_checkpoints(from_date, "XY")
+    # The rest of the restarted run
+    persist_status(from_date, resume_to_date, RunDBState.COMPLETED)
+    persist_status(resume_to_date, restart_to_date, RunDBState.RUNNING)
+    persist_status(resume_to_date, restart_to_date, RunDBState.COMPLETED)
+
+    # Assert
+    assert resume_to_date == to_date
+    assert checkpoints == {("0101709999", "1"): to_date}
+    assert get_resume_to_date(from_date) is None
+    assert get_checkpoints(from_date, "XY") == {}
+
+
+@patch("db.queries.get_engine")
+def test_completed_interval_removes_stale_checkpoints(
+    mock_get_engine: MagicMock,
+) -> None:
+    # Arrange
+    engine = create_engine("sqlite:///:memory:")
+    mock_get_engine.return_value = engine
+
+    Base.metadata.tables["runs"].create(bind=engine)
+    Base.metadata.tables["run_checkpoints"].create(bind=engine)
+    from_date = datetime(2000, 1, 1, 12, 0, 0)
+    to_date = datetime(2000, 1, 1, 15, 0, 0)
+    restart_to_date = datetime(2000, 1, 1, 18, 0, 0)
+
+    # An interrupted run not resumed with its to_date
+    persist_checkpoint(1, from_date, to_date, "XY", "0101709999", ["1"])
+    run_id = persist_status(from_date, restart_to_date, RunDBState.RUNNING)
+    persist_checkpoint(run_id, from_date, restart_to_date, "XY", "0101709999", ["2"])
+
+    # Act
+    checkpoints = get_checkpoints(from_date, "XY")
+    persist_status(from_date, restart_to_date, RunDBState.COMPLETED)
+
+    # Assert
+    assert checkpoints == {
+        ("0101709999", "1"): to_date,
+        ("0101709999", "2"): restart_to_date,
+    }
+    assert get_checkpoints(from_date, "XY") == {}
+
+
+@patch("db.queries.get_engine")
+def test_persist_and_get_run_stats(mock_get_engine: MagicMock) -> None:
+    # Arrange
+    engine = create_engine("sqlite:///:memory:")
+    mock_get_engine.return_value = engine
+
+    Base.metadata.tables["runs"].create(bind=engine)
+    Base.metadata.tables["run_stats"].create(bind=engine)
+    from_date = datetime(2000, 1, 1, 12, 0, 0)
+    to_date = datetime(2000, 1, 2, 12, 0, 0)
+    stats = RunStats()
+    with stats.activate():
+        count("persons_processed", 2)
+        count_sd_call("GetPersonChangedAtDate20111201")
+
+    # Act
+    persist_run_stats(42, "XY", from_date, to_date, stats.as_dict())
+    persist_run_stats(43, "XY", from_date, to_date, RunStats().as_dict())
+    run_stats = get_run_stats(42)
+
+    # Assert
+    (institution_stats,) = run_stats
+    assert institution_stats["run_id"] == 42
+    assert institution_stats["institution_identifier"] == "XY"
+    assert institution_stats["from_date"] == from_date
+    assert institution_stats["persons_processed"] == 2
+    assert institution_stats["sd_calls"] == {"GetPersonChangedAtDate20111201": 1}
+
+
+@patch("db.queries.get_engine")
+def test_get_run_stats_and_elapsed_seconds_by_either_run_id(
+    mock_get_engine: MagicMock,
+) -> None:
+    # Arrange
+    engine = create_engine("sqlite:///:memory:")
+    mock_get_engine.return_value = engine
+
+    Base.metadata.tables["runs"].create(bind=engine)
+    Base.metadata.tables["run_stats"].create(bind=engine)
+    from_date = datetime(2000, 1, 1, 12, 0, 0)
+    to_date = datetime(2000, 1, 2, 12, 0, 0)
+    with Session(engine) as session:
+        running = Runs(
+            from_date=from_date,
+            to_date=to_date,
+            status=RunDBState.RUNNING.value,
+            timestamp=datetime(2000, 1, 2, 12, 1, 0),
+        )
+        completed = Runs(
+            from_date=from_date,
+            to_date=to_date,
+            status=RunDBState.COMPLETED.value,
+            timestamp=datetime(2000, 1, 2, 12, 3, 30),
+        )
+        session.add_all([running, completed])
+        session.commit()
+        running_id, completed_id = running.id, completed.id
+    # The statistics are persisted with the id of the RUNNING row
+    persist_run_stats(running_id, "XY", from_date, to_date, RunStats().as_dict())
+
+    # Act
+    stats_by_id = {
+        run_id: get_run_stats(run_id) for run_id in (running_id, completed_id)
+    }
+    elapsed_by_id = {
+        run_id: get_run_elapsed_seconds(run_id) for run_id in (running_id, completed_id)
+    }
+
+    # Assert
+    assert stats_by_id[running_id] == stats_by_id[completed_id]
+    assert [stats["run_id"] for stats in stats_by_id[completed_id]] == [running_id]
+    assert elapsed_by_id == {running_id: 150.0, completed_id: 150.0}
+    assert get_run_elapsed_seconds(completed_id + 1) is None
+
+
+@patch("db.queries.get_engine")
+def test_get_completed_runs_with_execution_window(mock_get_engine: MagicMock):
+    # Arrange
+    engine = create_engine("sqlite:///:memory:")
+    mock_get_engine.return_value = engine
+
+    Base.metadata.tables["runs"].create(bind=engine)
+    day1, day2, day3 = (datetime(2000, 1, day) for day in (1, 2, 3))
+
+    def run(from_date: datetime, to_date: datetime, state: RunDBState, minute: int):
+        return Runs(
+            from_date=from_date,
+            to_date=to_date,
+            status=state.value,
+            timestamp=datetime(2000, 1, 3, 0, minute),
+        )
+
+    with Session(engine) as session:
+        session.add_all(
+            [
+                run(day1, day2, RunDBState.RUNNING, 1),
+                run(day1, day2, RunDBState.COMPLETED, 2),
+                run(day2, day3, RunDBState.RUNNING, 3),
+                run(day2, day3, RunDBState.COMPLETED, 4),
+            ]
+        )
+        session.commit()
+
+    # Act
+    runs = get_completed_runs(day1, day3 + timedelta(days=1))
+
+    # Assert
+    assert runs == [
+        CompletedRun(
+            day1, day2, datetime(2000, 1, 3, 0, 1), datetime(2000, 1, 3, 0, 2)
+        ),
+        # The run may have been prefetched while the previous interval was running
+        CompletedRun(
+            day2, day3, datetime(2000, 1, 3, 0, 1), datetime(2000, 1, 3, 0, 4)
+        ),
+    ]
@@ -0,0 +1,82 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+from unittest.mock import patch
+from uuid import uuid4
+
+from db.compression import decompress_response
+from sdlon.scripts.compress_payloads import compress_payload_bodies
+from sdlon.scripts.compress_payloads import compress_payloads
+
+
+@patch("sdlon.scripts.compress_payloads.Session")
+def test_compress_payloads_in_batches(mock_session: MagicMock):
+    # Arrange
+    ids = [uuid4() for _ in range(3)]
+    timestamp = datetime(2024, 1, 1)
+    session = mock_session.return_value.__enter__.return_value
+    session.execute.return_value.all.side_effect = [
+        [(ids[0], timestamp, "response0"), (ids[1], timestamp, "response1")],
+        [(ids[2], timestamp, "response2")],
+        [],
+    ]
+
+    # Act
+    compressed = compress_payloads(MagicMock(), batch_size=2)
+
+    # Assert
+    assert compressed == 3
+    assert session.commit.call_count == 2
+    mappings = [
+        mapping
+        for call in session.bulk_update_mappings.call_args_list
+        for mapping in call.args[1]
+    ]
+    assert [mapping["id"] for mapping in mappings] == ids
+    assert all(mapping["timestamp"] == timestamp for mapping in mappings)
+    assert all(mapping["response"] is None for mapping in mappings)
+    assert [decompress_response(m["response_compressed"]) for m in mappings] == [
+        "response0",
+        "response1",
+        "response2",
+    ]
+
+
+@patch("sdlon.scripts.compress_payloads.Session")
+def test_compress_payloads_stops_after_max_batches(mock_session: MagicMock):
+    # Arrange
+    session = mock_session.return_value.__enter__.return_value
+    session.execute.return_value.all.return_value = [
+        (uuid4(), datetime(2024, 1, 1), "response")
+    ]
+
+    # Act
+    compressed = compress_payloads(MagicMock(), batch_size=1, max_batches=2)
+
+    # Assert
+    assert compressed == 2
+    assert session.commit.call_count == 2
+
+
+@patch("sdlon.scripts.compress_payloads.Session")
+def test_compress_payload_bodies(mock_session: MagicMock):
+    # Arrange
+    session = mock_session.return_value.__enter__.return_value
+    session.execute.return_value.all.side_effect = [
+        [("hash0", "response0"), ("hash1", "response1")],
+        [],
+    ]
+
+    # Act
+    compressed = compress_payload_bodies(MagicMock(), batch_size=2)
+
+    # Assert
+    assert compressed == 2
+    session.commit.assert_called_once()
+    model, mappings = session.bulk_update_mappings.call_args.args
+    assert model.__tablename__ == "payload_body"
+    assert [mapping["hash"] for mapping in mappings] == ["hash0", "hash1"]
+    assert all(mapping["response"] is None for mapping in mappings)
+    assert [decompress_response(m["response_compressed"]) for m in mappings] == [
+        "response0",
+        "response1",
+    ]
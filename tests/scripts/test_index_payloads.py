@@ -0,0 +1,48 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+from unittest.mock import patch
+from uuid import uuid4
+
+from db.compression import compress_response
+from sdlon.scripts.index_payloads import index_payloads
+
+
+def _person(cpr: str) -> str:
+    return (
+        "<GetEmploymentChangedAtDate20111201><Person>"
+        f"<PersonCivilRegistrationIdentifier>{cpr}</PersonCivilRegistrationIdentifier>"
+        "</Person></GetEmploymentChangedAtDate20111201>"
+    )
+
+
+@patch("sdlon.scripts.index_payloads.Session")
+def test_index_payloads_in_batches(mock_session: MagicMock):
+    # Arrange
+    ids = [uuid4() for _ in range(3)]
+    timestamp = datetime(2024, 1, 1)
+    session = mock_session.return_value.__enter__.return_value
+    session.execute.return_value.all.side_effect = [
+        [
+            (ids[0], timestamp, _person("1212121000"), None),
+            (ids[1], timestamp, "<GetOrganization20111201/>", None),
+        ],
+        [(ids[2], timestamp, None, compress_response(_person("2212221000")))],
+        [],
+    ]
+
+    # Act
+    indexed = index_payloads(MagicMock(), batch_size=2)
+
+    # Assert
+    assert indexed == 3
+    assert session.commit.call_count == 2
+    index_rows = [
+        row
+        for call in session.execute.call_args_list
+        if len(call.args) == 2
+        for row in call.args[1]
+    ]
+    assert [(row["payload_id"], row["cpr"]) for row in index_rows] == [
+        (ids[0], "1212121000"),
+        (ids[2], "2212221000"),
+    ]
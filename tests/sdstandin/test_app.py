@@ -0,0 +1,196 @@
+# SPDX-FileCopyrightText: Magenta ApS
+#
+# SPDX-License-Identifier: MPL-2.0
+from datetime import date
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from sdlon.config import Settings
+from sdlon.models import JobFunction
+from sdlon.sd_common import ensure_list
+from sdlon.sd_common import read_employment_at
+from sdlon.sd_common import sd_iter_persons
+from sdlon.sd_common import sd_lookup
+from sdlon.sd_replay import request_key
+from sdstandin.config import StandInSettings
+from sdstandin.main import create_app
+from sdstandin.synthetic import SyntheticSD
+from sdstandin.synthetic import example_institution
+
+INSTITUTION = example_institution()
+ROOT, LEAF = INSTITUTION.departments
+
+
+@pytest.fixture()
+def settings() -> Settings:
+    return Settings(
+        municipality_name="name",
+        municipality_code=100,
+        sd_global_from_date=date(2000, 1, 1),
+        sd_institution_identifier=INSTITUTION.identifier,
+        sd_user="user",
+        sd_password="password",
+        sd_job_function=JobFunction.employment_name,
+        sd_monthly_hourly_divide=1,
+        app_dbpassword="secret",
+        sd_persist_payloads=False,
+        sd_base_url="http://testserver/sdws/",
+    )
+
+
+@pytest.fixture()
+def standin():
+    """Route the SD calls from sdlon to the stand-in."""
+    client = TestClient(create_app(StandInSettings(), source=SyntheticSD(INSTITUTION)))
+    with patch("sdlon.sd_common.get_sd_session", return_value=client):
+        yield client
+
+
+def test_get_institution(standin: TestClient, settings: Settings):
+    # Act
+    response = sd_lookup(
+        "GetInstitution20111201", settings, params={"UUIDIndicator": "true"}
+    )
+
+    # Assert
+    institution = response["Region"]["Institution"]
+    assert institution["InstitutionUUIDIdentifier"] == str(INSTITUTION.uuid)
+
+
+def test_get_department_and_parent(standin: TestClient, settings: Settings):
+    # Act
+    department = sd_lookup(
+        "GetDepartment20111201",
+        settings,
+        params={
+            "ActivationDate": "01.01.2024",
+            "DeactivationDate": "01.01.2024",
+            "DepartmentUUIDIdentifier": str(LEAF.uuid),
+        },
+    )
+    leaf_parent = sd_lookup(
+        "GetDepartmentParent20190701",
+        settings,
+        params={"EffectiveDate": "01.01.2024", "DepartmentUUIDIdentifier": LEAF.uuid},
+    )
+    root_parent = sd_lookup(
+        "GetDepartmentParent20190701",
+        settings,
+        params={"EffectiveDate": "01.01.2024", "DepartmentUUIDIdentifier": ROOT.uuid},
+    )
+
+    # Assert
+    assert department["Department"]["DepartmentIdentifier"] == LEAF.identifier
+    assert department["Department"]["DepartmentLevelIdentifier"] == LEAF.level
+    assert leaf_parent["DepartmentParent"]["DepartmentUUIDIdentifier"] == str(ROOT.uuid)
+    assert root_parent["DepartmentParent"]["DepartmentUUIDIdentifier"] == str(
+        INSTITUTION.uuid
+    )
+
+
+def test_read_employment_at(standin: TestClient, settings: Settings):
+    # Act
+    person = read_employment_at(
+        date(2024, 1, 1), settings, INSTITUTION.identifier, employment_id="12345"
+    )
+    unknown = read_employment_at(
+        date(2024, 1, 1), settings, INSTITUTION.identifier, employment_id="99999"
+    )
+
+    # Assert
+    assert person is not None
+    employment = person["Employment"]  # type: ignore
+    assert employment["EmploymentIdentifier"] == "12345"
+    assert employment["EmploymentDepartment"]["DepartmentUUIDIdentifier"] == str(
+        LEAF.uuid
+    )
+    assert employment["EmploymentStatus"]["EmploymentStatusCode"] == "1"
+    assert unknown is None
+
+
+@pytest.mark.parametrize(
+    "activation_date,expected_cprs",
+    [("01.12.2023", ["0101011234"]), ("02.01.2024", [])],
+)
+def test_get_employment_changed_at_date(
+    standin: TestClient, settings: Settings, activation_date: str, expected_cprs
+):
+    # Arrange
+    params = {
+        "ActivationDate": activation_date,
+        "ActivationTime": "00:00",
+        "DeactivationDate": "31.12.2024",
+        "DeactivationTime": "23:59",
+        "DepartmentIndicator": "true",
+        "EmploymentStatusIndicator": "true",
+        "ProfessionIndicator": "true",
+    }
+
+    # Act
+    response = sd_lookup("GetEmploymentChangedAtDate20111201", settings, params=params)
+    persons = list(
+        sd_iter_persons("GetEmploymentChangedAtDate20111201", settings, params=params)
+    )
+
+    # Assert
+    assert persons == ensure_list(response.get("Person", []))
+    assert [p["PersonCivilRegistrationIdentifier"] for p in persons] == expected_cprs
+    if persons:
+        employment = persons[0]["Employment"]
+        assert employment["Profession"]["@changedAtDate"] == "2024-01-01"
+
+
+def test_unknown_institution():
+    # Arrange
+    client = TestClient(create_app(StandInSettings(), SyntheticSD(INSTITUTION)))
+
+    # Act
+    response = client.get(
+        "/sdws/GetInstitution20111201", params={"InstitutionIdentifier": "ZZ"}
+    )
+
+    # Assert
+    assert response.status_code == 500
+    assert "<Envelope>" in response.text
+
+
+@patch("sdstandin.main.asyncio.sleep")
+def test_latency_and_error_injection(mock_sleep: MagicMock):
+    # Arrange
+    client = TestClient(
+        create_app(
+            StandInSettings(latency_ms=200, error_rate=1),
+            SyntheticSD(INSTITUTION),
+        )
+    )
+
+    # Act
+    response = client.get(
+        "/sdws/GetInstitution20111201", params={"InstitutionIdentifier": "XX"}
+    )
+
+    # Assert
+    assert response.status_code == 503
+    mock_sleep.assert_awaited_once_with(0.2)
+
+
+def test_request_key_normalizes_recorded_params():
+    # The recorded params are the str() of the dict sent by sd_lookup, while
+    # the stand-in receives the params from the query string
+    recorded = {
+        "InstitutionIdentifier": "XX",
+        "StatusActiveIndicator": True,
+        "EffectiveDate": ("01.01.2024",),
+    }
+    received = {
+        "EffectiveDate": "01.01.2024",
+        "InstitutionIdentifier": "XX",
+        "StatusActiveIndicator": "True",
+    }
+
+    assert request_key("GetEmployment20111201", recorded) == request_key(
+        "GetEmployment20111201", received
+    )
@@ -0,0 +1,126 @@
+# SPDX-FileCopyrightText: Magenta ApS
+#
+# SPDX-License-Identifier: MPL-2.0
+import json
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+from click.testing import CliRunner
+
+from sdlon.employees import get_employee
+from sdstandin.benchmark import main
+from sdstandin.benchmark import percentile
+from sdstandin.benchmark import run_benchmark
+from sdstandin.generator import GeneratorConfig
+from sdstandin.mo import InMemoryMO
+from sdstandin.mo import StandInMoraHelper
+from sdstandin.synthetic import example_institution
+
+
+@pytest.mark.parametrize(
+    "values,q,expected",
+    [
+        ([], 0.5, None),
+        ([3.0], 0.95, 3.0),
+        ([4.0, 1.0, 3.0, 2.0], 0.5, 2.0),
+        ([float(v) for v in range(1, 101)], 0.95, 95.0),
+    ],
+)
+def test_percentile(values: list[float], q: float, expected: float | None):
+    assert percentile(values, q) == expected
+
+
+def test_mo_standin_employee_roundtrip():
+    # Arrange
+    mo = InMemoryMO(example_institution())
+    helper = StandInMoraHelper(mo)
+
+    # Act
+    response = helper._mo_post(
+        "e/create",
+        {"givenname": "Bruce", "surname": "Lee", "cpr_no": "0101709999"},
+    )
+    employee = get_employee(mo, "0101709999")  # type: ignore
+
+    # Assert
+    assert response.status_code == 201
+    assert employee is not None
+    assert str(employee.uuid) == response.json()
+    assert employee.name == "Bruce Lee"
+    assert helper.read_user(user_cpr="0101709999")["uuid"] == response.json()
+    assert mo.calls["create_employee"] == 1
+    assert mo.calls["graphql_GetEmployee"] == 1
+
+
+def test_mo_standin_org_unit_parents():
+    # Arrange
+    institution = example_institution()
+    root, leaf = institution.departments
+    helper = StandInMoraHelper(InMemoryMO(institution))
+
+    # Act
+    ou = helper.read_ou(str(leaf.uuid))
+
+    # Assert
+    assert ou["org_unit_level"]["user_key"] == leaf.level
+    assert ou["parent"]["uuid"] == str(root.uuid)
+    assert "status" in helper.read_ou("00000000-0000-0000-0000-000000000000")
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_run_benchmark(streaming: bool):
+    # Act
+    results = run_benchmark(
+        GeneratorConfig(persons=20, employments=30), streaming=streaming
+    )
+
+    # Assert
+    persons = results["update_changed_persons"]
+    employments = results["update_all_employments"]
+    assert persons["count"] == 20
+    assert employments["persons"] == 20
+    assert employments["count"] == 30
+    assert persons["sd_calls"] >= 1
+    assert employments["mo_calls"] > 0
+    assert (
+        employments["person_latency_ms"]["p50"]
+        <= employments["person_latency_ms"]["p95"]
+    )
+    assert results["sd_calls_per_person"] > 0
+    assert results["mo_calls_per_person"] > 0
+    assert results["peak_rss_mb"] > 0
+    json.dumps(results)
+
+
+def test_main_writes_json(tmp_path):
+    # Arrange
+    output = tmp_path / "benchmark.json"
+
+    # Act
+    result = CliRunner().invoke(
+        main, ["--persons", "5", "--employments", "8", "--output", str(output)]
+    )
+
+    # Assert
+    assert result.exit_code == 0, result.output
+    results = json.loads(output.read_text())
+    assert results["update_all_employments"]["count"] == 8
+
+
+@patch("sdstandin.benchmark.run_benchmark")
+def test_main_without_rates(mock_run_benchmark: MagicMock, tmp_path):
+    # Arrange
+    output = tmp_path / "benchmark.json"
+    mock_run_benchmark.return_value = {
+        "update_changed_persons": {"per_second": None},
+        "update_all_employments": {"per_second": 12.34},
+        "peak_rss_mb": 100.0,
+    }
+
+    # Act
+    result = CliRunner().invoke(main, ["--output", str(output)])
+
+    # Assert
+    assert result.exit_code == 0, result.output
+    assert "n/a persons/s, 12.3 employments/s" in result.output
@@ -0,0 +1,120 @@
+# SPDX-FileCopyrightText: Magenta ApS
+#
+# SPDX-License-Identifier: MPL-2.0
+from datetime import timedelta
+
+import pytest
+from pydantic import ValidationError
+
+from sdlon.sd_common import ensure_list
+from sdstandin.generator import EMPLOYMENT_CHANGED_AT_DATE
+from sdstandin.generator import GeneratorConfig
+from sdstandin.generator import daily_change_feeds
+from sdstandin.generator import generate_institution
+from sdstandin.generator import parse_response
+from sdstandin.models import Institution
+
+STATUS_ORDER = ["0", "1", "3", "8", "S"]
+
+
+@pytest.fixture(scope="module")
+def config() -> GeneratorConfig:
+    return GeneratorConfig(seed=42, persons=200, employments=300, professions=10)
+
+
+@pytest.fixture(scope="module")
+def institution(config: GeneratorConfig) -> Institution:
+    return generate_institution(config)
+
+
+def test_generator_is_deterministic(config: GeneratorConfig, institution):
+    assert generate_institution(config) == institution
+    assert generate_institution(config.copy(update={"seed": 43})) != institution
+
+
+def test_scale(institution: Institution):
+    assert len(institution.persons) == 200
+    assert len({p.cpr for p in institution.persons}) == 200
+    employments = [e for p in institution.persons for e in p.employments]
+    assert len(employments) == 300
+    assert len({e.identifier for e in employments}) == 300
+    assert all(p.employments for p in institution.persons)
+
+
+def test_department_tree(config: GeneratorConfig, institution: Institution):
+    # Arrange
+    departments = {d.uuid: d for d in institution.departments}
+    leaves = {d.uuid for d in institution.departments if d.level == "Afdelings-niveau"}
+
+    # Assert
+    assert len(institution.departments) == 1 + 4 + 16 + 64 + 320 + 1920
+    assert len(leaves) == 1920
+    for department in institution.departments:
+        depth = 0
+        current = department
+        while current.parent_uuid is not None:
+            current = departments[current.parent_uuid]
+            depth += 1
+        assert department.level == config.levels[depth]
+    assert all(
+        e.department_uuid in leaves for p in institution.persons for e in p.employments
+    )
+
+
+def test_status_transitions(institution: Institution):
+    codes = set()
+    for person in institution.persons:
+        for employment in person.employments:
+            statuses = employment.statuses
+            codes.update(s.status_code for s in statuses)
+
+            # The statuses follow 0 -> 1 -> 3 -> 8 -> S
+            positions = [STATUS_ORDER.index(s.status_code) for s in statuses]
+            assert positions == sorted(set(positions))
+            assert statuses[0].activation_date == employment.activation_date
+            # The periods are consecutive
+            for current, following in zip(statuses, statuses[1:]):
+                assert current.deactivation_date + timedelta(days=1) == (
+                    following.activation_date
+                )
+            assert statuses[-1].deactivation_date.year == 9999
+            assert all(s.changed_at >= employment.changed_at for s in statuses)
+    assert codes == set(STATUS_ORDER)
+
+
+def test_daily_change_feeds(institution: Institution):
+    # Arrange
+    employment = institution.persons[0].employments[0]
+    day = employment.changed_at.date()
+
+    # Act
+    feeds = list(daily_change_feeds(institution, day - timedelta(days=1), day))
+
+    # Assert
+    assert [feed_day for feed_day, _ in feeds] == [day - timedelta(days=1), day]
+    persons = ensure_list(
+        parse_response(EMPLOYMENT_CHANGED_AT_DATE, feeds[1][1]).get("Person", [])
+    )
+    changed = {
+        e["EmploymentIdentifier"]: e
+        for person in persons
+        for e in ensure_list(person["Employment"])
+    }
+    assert changed[employment.identifier]["EmploymentDepartment"][
+        "@changedAtDate"
+    ] == day.strftime("%Y-%m-%d")
+    expected = {
+        e.identifier
+        for p in institution.persons
+        for e in p.employments
+        if e.changed_at.date() == day
+        or any(s.changed_at.date() == day for s in e.statuses)
+    }
+    assert set(changed) == expected
+
+
+def test_config_validation():
+    with pytest.raises(ValidationError):
+        GeneratorConfig(persons=10, employments=5)
+    with pytest.raises(ValidationError):
+        GeneratorConfig(levels=["NY1-niveau"], fanout=[1, 2])
@@ -0,0 +1,52 @@
+# SPDX-FileCopyrightText: Magenta ApS
+#
+# SPDX-License-Identifier: MPL-2.0
+from datetime import datetime
+from datetime import timedelta
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from sdlon.sd_replay import ReplayMissError
+from sdstandin.recorded import RecordedSD
+
+
+@patch("sdstandin.recorded.ReplaySD.__init__", return_value=None)
+@patch("sdstandin.recorded.Session")
+def test_recorded_sd_replays_all_recorded_payloads(
+    mock_session: MagicMock, mock_replay_sd_init: MagicMock
+):
+    # Arrange
+    engine = MagicMock()
+    first, last = datetime(2024, 1, 1), datetime(2024, 2, 1)
+    session = mock_session.return_value.__enter__.return_value
+    session.execute.return_value.one.return_value = (first, last)
+
+    # Act
+    RecordedSD(engine, workers=2)
+
+    # Assert
+    mock_replay_sd_init.assert_called_once_with(
+        engine, first, last + timedelta(microseconds=1), 2
+    )
+
+
+@patch("sdstandin.recorded.ReplaySD.respond")
+@patch("sdstandin.recorded.ReplaySD.__init__", return_value=None)
+@patch("sdstandin.recorded.Session")
+def test_recorded_sd_answers_unrecorded_requests_with_error_envelope(
+    mock_session: MagicMock,
+    mock_replay_sd_init: MagicMock,
+    mock_respond: MagicMock,
+):
+    # Arrange
+    session = mock_session.return_value.__enter__.return_value
+    session.execute.return_value.one.return_value = (None, None)
+    mock_respond.side_effect = ReplayMissError()
+    recorded_sd = RecordedSD(MagicMock(), workers=1)
+
+    # Act
+    status_code, response = recorded_sd.respond("GetPerson20111201", {})
+
+    # Assert
+    assert status_code == 500
+    assert "No recorded payload for GetPerson20111201" in response
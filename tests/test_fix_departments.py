@@ -794,3 +794,78 @@ class TestFixDepartment(TestCase):
                 },
             ),
         ]
+
+
+def test_get_all_parents():
+    # Arrange
+    instance = _TestableFixDepartments.get_instance()
+    leaf_uuid, middle_uuid, root_uuid = str(uuid4()), str(uuid4()), str(uuid4())
+    parents = {leaf_uuid: middle_uuid, middle_uuid: root_uuid, root_uuid: None}
+    shortnames = {leaf_uuid: "LEAF", middle_uuid: "MIDDLE", root_uuid: "ROOT"}
+
+    instance.get_parent = MagicMock(
+        side_effect=lambda uuid, validity_date: parents[uuid]
+    )
+    instance.get_department = MagicMock(
+        side_effect=lambda validity, uuid: [
+            {
+                "DepartmentIdentifier": shortnames[uuid],
+                "DepartmentLevelIdentifier": "Afdelings-niveau",
+            }
+        ]
+    )
+
+    # Act
+    branch = instance.get_all_parents(leaf_uuid, date(2024, 1, 1))
+
+    # Assert
+    assert branch == [
+        ("LEAF", leaf_uuid),
+        ("MIDDLE", middle_uuid),
+        ("ROOT", root_uuid),
+    ]
+    assert instance.get_department.call_count == 3
+    assert instance.get_parent.call_count == 3
+
+
+@mock.patch("sdlon.sd_threaded.sd_lookup")
+def test_read_department_engagements(mock_sd_lookup: MagicMock):
+    # Arrange
+    instance = _TestableFixDepartments.get_instance(
+        {"sd_import_too_deep": ["Afdelings-niveau"]}
+    )
+    instance.get_department = MagicMock(
+        return_value=[
+            {
+                "DepartmentIdentifier": "AFD",
+                "DepartmentLevelIdentifier": "Afdelings-niveau",
+            }
+        ]
+    )
+
+    responses = {
+        "01.01.2024": {
+            "Person": {"PersonCivilRegistrationIdentifier": "0101011234", "i": 0}
+        },
+        "31.03.2024": {
+            "Person": [
+                {"PersonCivilRegistrationIdentifier": "0101011234", "i": 90},
+                {"PersonCivilRegistrationIdentifier": "0202021234", "i": 90},
+            ]
+        },
+        "31.12.2024": {},
+    }
+    mock_sd_lookup.side_effect = lambda url, params, **kwargs: responses[
+        params["EffectiveDate"][0]
+    ]
+
+    # Act
+    all_people = instance._read_department_engagements(uuid4(), date(2024, 1, 1))
+
+    # Assert
+    assert mock_sd_lookup.call_count == 3
+    # The earliest effective date takes precedence
+    assert all_people == {
+        "0101011234": {"PersonCivilRegistrationIdentifier": "0101011234", "i": 0},
+        "0202021234": {"PersonCivilRegistrationIdentifier": "0202021234", "i": 90},
+    }
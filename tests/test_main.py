@@ -128,3 +128,126 @@ def test_trigger_fix_departments_on_error(
     # Assert
     assert r.status_code == 500
     assert r.json() == {"msg": str(error)}
+
+
+@patch("sdlon.main.get_settings")
+def test_metrics_exposes_sd_metrics(mock_get_settings: MagicMock):
+    # Arrange
+    client = TestClient(create_app())
+
+    # Act
+    r = client.get("/metrics")
+
+    # Assert
+    assert r.status_code == 200
+    for metric in [
+        "sd_request_duration_seconds",
+        "sd_response_size_bytes",
+        "sd_parse_duration_seconds",
+        "sd_error_envelopes",
+        "sd_employment_not_found",
+    ]:
+        assert f"# TYPE {metric}" in r.text
+
+
+@patch("sdlon.main.get_settings")
+@patch("sdlon.main.prune_payloads")
+def test_payloads_prune(mock_prune_payloads: MagicMock, mock_get_settings: MagicMock):
+    # Arrange
+    mock_get_settings.return_value.sd_payload_retention_months = 6
+    mock_prune_payloads.return_value = ["payload_2024_01", "payload_index_2024_01"]
+    client = TestClient(create_app())
+
+    # Act
+    r = client.post("/payloads/prune")
+
+    # Assert
+    assert r.status_code == 200
+    assert r.json()["dropped_partitions"] == [
+        "payload_2024_01",
+        "payload_index_2024_01",
+    ]
+    mock_prune_payloads.assert_called_once_with(6)
+
+
+@patch("sdlon.main.get_settings")
+@patch("sdlon.main.prune_payloads")
+def test_payloads_prune_without_retention(
+    mock_prune_payloads: MagicMock, mock_get_settings: MagicMock
+):
+    # Arrange
+    mock_get_settings.return_value.sd_payload_retention_months = None
+    client = TestClient(create_app())
+
+    # Act
+    r = client.post("/payloads/prune")
+
+    # Assert
+    assert r.status_code == 200
+    mock_prune_payloads.assert_not_called()
+
+
+@patch("sdlon.main.get_settings")
+@patch("sdlon.main.get_run_elapsed_seconds", return_value=3.5)
+@patch("sdlon.main.get_run_stats")
+def test_run_stats(
+    mock_get_run_stats: MagicMock,
+    mock_get_run_elapsed_seconds: MagicMock,
+    mock_get_settings: MagicMock,
+):
+    # Arrange
+    institution_stats = {
+        "persons_seconds": 1.5,
+        "employments_seconds": 2.5,
+        "sd_calls": {"GetPersonChangedAtDate20111201": 1},
+        "mo_reads": 10,
+        "mo_writes": 2,
+        "persons_processed": 3,
+        "employments_processed": 4,
+        "engagements_created": 1,
+        "engagements_edited": 1,
+        "engagements_terminated": 0,
+        "noop_edits": 2,
+    }
+    mock_get_run_stats.return_value = [
+        {"institution_identifier": "XY", **institution_stats},
+        {"institution_identifier": "ZZ", **institution_stats},
+    ]
+    client = TestClient(create_app())
+
+    # Act
+    r = client.get("/runs/42/stats")
+
+    # Assert
+    assert r.status_code == 200
+    mock_get_run_stats.assert_called_once_with(42)
+    mock_get_run_elapsed_seconds.assert_called_once_with(42)
+    # The institutions were updated concurrently, so their times do not add up
+    assert r.json()["total"] == {
+        "elapsed_seconds": 3.5,
+        "sd_calls": {"GetPersonChangedAtDate20111201": 2},
+        "mo_reads": 20,
+        "mo_writes": 4,
+        "persons_processed": 6,
+        "employments_processed": 8,
+        "engagements_created": 2,
+        "engagements_edited": 2,
+        "engagements_terminated": 0,
+        "noop_edits": 4,
+    }
+    assert len(r.json()["institutions"]) == 2
+
+
+@patch("sdlon.main.get_settings")
+@patch("sdlon.main.get_run_stats", return_value=[])
+def test_run_stats_not_found(
+    mock_get_run_stats: MagicMock, mock_get_settings: MagicMock
+):
+    # Arrange
+    client = TestClient(create_app())
+
+    # Act
+    r = client.get("/runs/42/stats")
+
+    # Assert
+    assert r.status_code == 404
@@ -1,4 +1,37 @@
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+from click.testing import CliRunner
+
+from db.compression import compress_response
+from sdlon.payload import OutputFormat
+from sdlon.payload import _map_bounded
+from sdlon.payload import export_payloads
+from sdlon.payload import format_payload
+from sdlon.payload import get_payloads
 from sdlon.payload import get_sd_persons
+from sdlon.payload import main
+
+SD_BASE_URL = "http://sd-standin/sdws/"
+
+PAYLOAD = """
+<GetEmploymentChangedAtDate20111201>
+  <Person>
+    <PersonCivilRegistrationIdentifier>1212121000</PersonCivilRegistrationIdentifier>
+    <Employment>
+      <EmploymentIdentifier>12345</EmploymentIdentifier>
+    </Employment>
+  </Person>
+  <Person>
+    <PersonCivilRegistrationIdentifier>2212221000</PersonCivilRegistrationIdentifier>
+  </Person>
+</GetEmploymentChangedAtDate20111201>
+"""
 
 
 def test_get_sd_persons():
@@ -51,3 +84,159 @@ def test_get_sd_persons():
     # Assert
     assert len(persons) == 1
     assert persons[0].find("Employment").find("EmploymentIdentifier").text == "12345"
+
+
+@patch("sdlon.payload.Session")
+def test_get_payloads_looks_up_payloads_in_index(mock_session: MagicMock):
+    # Arrange
+    timestamps = [datetime(2024, 1, day) for day in (1, 2)]
+    session = mock_session.return_value.__enter__.return_value
+    session.execute.return_value = [
+        (timestamps[0], "<Person>1212121000</Person>", None),
+        (timestamps[1], None, compress_response("<Person>1212121000</Person>")),
+    ]
+
+    # Act
+    payloads = get_payloads(MagicMock(), SD_BASE_URL, "1212121000", "12345")
+
+    # Assert
+    assert payloads == [
+        (timestamps[0], "<Person>1212121000</Person>"),
+        (timestamps[1], "<Person>1212121000</Person>"),
+    ]
+    stmt = session.execute.call_args.args[0]
+    params = stmt.compile().params
+    assert "payload_index.cpr" in str(stmt)
+    assert "payload.response LIKE" not in str(stmt)
+    assert "1212121000" in params.values()
+    assert "12345" in params.values()
+    assert f"{SD_BASE_URL}GetEmploymentChangedAtDate20111201" in params.values()
+
+
+@patch("sdlon.payload.Session")
+def test_get_payloads_limits_period(mock_session: MagicMock):
+    # Arrange
+    session = mock_session.return_value.__enter__.return_value
+    session.execute.return_value = []
+    from_date = datetime(2024, 1, 1)
+    to_date = datetime(2024, 2, 1)
+
+    # Act
+    get_payloads(
+        MagicMock(), SD_BASE_URL, "1212121000", from_date=from_date, to_date=to_date
+    )
+
+    # Assert
+    stmt = session.execute.call_args.args[0]
+    where = str(stmt).split("WHERE", 1)[1]
+    assert "payload.timestamp >=" in where
+    assert "payload.timestamp <" in where
+    assert "payload_index.timestamp >=" in where
+    assert "payload_index.timestamp <" in where
+    assert list(stmt.compile().params.values()).count(from_date) == 2
+
+
+def test_format_payload_xml():
+    # Act
+    output = format_payload(
+        datetime(2024, 1, 2),
+        None,
+        compress_response(PAYLOAD),
+        "1212121000",
+        OutputFormat.xml,
+    )
+
+    # Assert
+    assert output.startswith("---------- 2024-01-02 ----------\n<Person>")
+    assert "12345" in output
+    assert "2212221000" not in output
+
+
+def test_format_payload_jsonl():
+    # Act
+    output = format_payload(
+        datetime(2024, 1, 2), PAYLOAD, None, "1212121000", OutputFormat.jsonl
+    )
+
+    # Assert
+    (line,) = output.splitlines()
+    assert json.loads(line) == {
+        "timestamp": "2024-01-02T00:00:00",
+        "person": {
+            "PersonCivilRegistrationIdentifier": "1212121000",
+            "Employment": {"EmploymentIdentifier": "12345"},
+        },
+    }
+
+
+def test_map_bounded_consumes_items_lazily():
+    # Arrange
+    consumed = []
+
+    def items():
+        for i in range(10):
+            consumed.append(i)
+            yield i
+
+    # Act
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = _map_bounded(executor, str, items(), limit=3)
+        first = next(results)
+        consumed_before_rest = len(consumed)
+        rest = list(results)
+
+    # Assert
+    assert first == "0"
+    assert consumed_before_rest == 3
+    assert rest == [str(i) for i in range(1, 10)]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_export_payloads_keeps_order(workers: int):
+    # Arrange
+    payloads = [(datetime(2024, 1, day), PAYLOAD, None) for day in range(1, 6)]
+    output = io.StringIO()
+
+    # Act
+    export_payloads(payloads, "1212121000", OutputFormat.jsonl, output, workers)
+
+    # Assert
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [line["timestamp"][:10] for line in lines] == [
+        f"2024-01-0{day}" for day in range(1, 6)
+    ]
+
+
+@patch("sdlon.payload.get_settings")
+@patch("sdlon.payload.get_engine")
+@patch("sdlon.payload.iter_payloads")
+def test_main_streams_payloads(
+    mock_iter_payloads: MagicMock,
+    mock_get_engine: MagicMock,
+    mock_get_settings: MagicMock,
+):
+    # Arrange
+    mock_get_settings.return_value.sd_base_url = SD_BASE_URL
+    mock_iter_payloads.return_value = iter([(datetime(2024, 1, 1), PAYLOAD, None)])
+
+    # Act
+    result = CliRunner().invoke(
+        main,
+        [
+            "--cpr",
+            "1212121000",
+            "--format",
+            "jsonl",
+            "--workers",
+            "1",
+            "--batch-size",
+            "10",
+        ],
+    )
+
+    # Assert
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output)["timestamp"] == "2024-01-01T00:00:00"
+    mock_iter_payloads.assert_called_once_with(
+        mock_get_engine.return_value, SD_BASE_URL, "1212121000", None, None, None, 10
+    )
@@ -0,0 +1,17 @@
+from unittest.mock import MagicMock
+
+from sdlon.run_context import RunContext
+
+
+def test_run_context_loads_objects_once():
+    # Arrange
+    run_context = RunContext()
+    load = MagicMock(return_value="helper")
+
+    # Act
+    first = run_context.get("helper", load)
+    second = run_context.get("helper", load)
+
+    # Assert
+    assert first == second == "helper"
+    load.assert_called_once()
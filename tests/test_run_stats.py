@@ -0,0 +1,130 @@
+import threading
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from os2mo_helpers.mora_helpers import MoraHelper
+
+from sdlon.run_stats import CountingMoraHelper
+from sdlon.run_stats import RunStats
+from sdlon.run_stats import count
+from sdlon.run_stats import count_sd_call
+from sdlon.run_stats import mo_writes_in_thread
+
+
+def test_run_stats_counts_in_the_active_stats_only():
+    # Arrange
+    stats = RunStats()
+    other_stats = RunStats()
+
+    # Act
+    with stats.activate():
+        count("persons_processed")
+        count("employments_processed", 3)
+        count_sd_call("GetPerson20111201")
+        count_sd_call("GetPerson20111201")
+        with other_stats.activate():
+            count("persons_processed")
+    # Not counted anywhere
+    count("persons_processed")
+
+    # Assert
+    result = stats.as_dict()
+    assert result["persons_processed"] == 1
+    assert result["employments_processed"] == 3
+    assert result["engagements_created"] == 0
+    assert result["sd_calls"] == {"GetPerson20111201": 2}
+    assert other_stats.as_dict()["persons_processed"] == 1
+
+
+def test_run_stats_times_phases():
+    # Arrange
+    stats = RunStats()
+
+    # Act
+    with stats.timed("persons"):
+        pass
+
+    # Assert
+    result = stats.as_dict()
+    assert result["persons_seconds"] > 0
+    assert result["employments_seconds"] == 0
+
+
+@patch.object(MoraHelper, "_mo_post")
+@patch.object(MoraHelper, "_mo_lookup")
+def test_counting_mora_helper_counts_reads_and_writes(mock_lookup, mock_post):
+    # Arrange
+    helper = CountingMoraHelper(hostname="http://mo", use_cache=False)
+    stats = RunStats()
+    mo_writes = mo_writes_in_thread()
+
+    # Act
+    with stats.activate():
+        helper._mo_lookup("uuid", "o/{}/e/")
+        helper._mo_post("details/edit", {})
+        helper._mo_post("details/edit", {})
+
+    # Assert
+    assert stats.as_dict()["mo_reads"] == 1
+    assert stats.as_dict()["mo_writes"] == 2
+    assert mo_writes_in_thread() == mo_writes + 2
+
+
+@patch.object(MoraHelper, "_mo_lookup")
+def test_counting_mora_helper_does_not_count_shared_reads(mock_lookup):
+    # Arrange
+    helper = CountingMoraHelper(hostname="http://mo", use_cache=False)
+    # An identical read in flight, whose result is shared
+    helper._in_flight = MagicMock()
+    helper._in_flight.do.return_value = {"uuid": "uuid"}
+    stats = RunStats()
+
+    # Act
+    with stats.activate():
+        result = helper._mo_lookup("uuid", "o/{}/e/")
+
+    # Assert
+    assert result == {"uuid": "uuid"}
+    assert stats.as_dict()["mo_reads"] == 0
+    mock_lookup.assert_not_called()
+
+
+@patch("os2mo_helpers.mora_helpers.TokenSettings")
+@patch("os2mo_helpers.mora_helpers.requests.get")
+def test_counting_mora_helper_does_not_count_cache_hits(mock_get, mock_token_settings):
+    # Arrange
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.json.return_value = {"uuid": "uuid"}
+    helper = CountingMoraHelper(hostname="http://mo", use_cache=True)
+    stats = RunStats()
+
+    # Act
+    with stats.activate():
+        helper._mo_lookup("uuid", "o/{}/e/")
+        helper._mo_lookup("uuid", "o/{}/e/")
+        helper._mo_lookup("other", "o/{}/e/")
+        helper._mo_lookup("uuid", "o/{}/e/", use_cache=False)
+
+    # Assert
+    assert mock_get.call_count == 3
+    assert stats.as_dict()["mo_reads"] == 3
+
+
+def test_mo_writes_are_counted_per_thread():
+    # Arrange
+    mo_writes = mo_writes_in_thread()
+    other_thread_writes = []
+
+    def write():
+        with patch.object(MoraHelper, "_mo_post"):
+            CountingMoraHelper(hostname="http://mo")._mo_post("details/edit", {})
+        other_thread_writes.append(mo_writes_in_thread())
+
+    # Act
+    thread = threading.Thread(target=write)
+    thread.start()
+    thread.join()
+
+    # Assert
+    assert other_thread_writes == [1]
+    assert mo_writes_in_thread() == mo_writes
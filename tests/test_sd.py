@@ -0,0 +1,80 @@
+from datetime import date
+from typing import Callable
+from unittest.mock import MagicMock
+from unittest.mock import patch
+from uuid import UUID
+
+from sdclient.requests import GetDepartmentParentRequest
+from sdclient.requests import GetDepartmentRequest
+
+from sdlon.config import Settings
+from sdlon.sd import SDLookupClient
+
+DEPARTMENT_UUID = UUID("eb25d197-d278-41ac-abc1-cc7802093130")
+
+
+@patch("sdlon.sd.sd_lookup")
+def test_sd_lookup_client_calls_sd_lookup(
+    mock_sd_lookup: MagicMock, make_settings: Callable[..., Settings]
+):
+    # Arrange
+    settings = make_settings(sd_base_url="http://sd-standin/sdws/")
+    response = {
+        "RegionIdentifier": "RI",
+        "InstitutionIdentifier": "II",
+        "Department": {
+            "ActivationDate": "2020-11-10",
+            "DeactivationDate": "9999-12-31",
+            "DepartmentIdentifier": "ABCD",
+            "DepartmentLevelIdentifier": "NY1-niveau",
+            "DepartmentUUIDIdentifier": str(DEPARTMENT_UUID),
+        },
+    }
+    mock_sd_lookup.return_value = response
+    client = SDLookupClient(settings, "II", dry_run=True)
+
+    # Act
+    result = client.get_department(
+        GetDepartmentRequest(
+            InstitutionIdentifier="II",
+            DepartmentUUIDIdentifier=DEPARTMENT_UUID,
+            ActivationDate=date(2024, 1, 1),
+            DeactivationDate=date(2024, 1, 1),
+            UUIDIndicator=True,
+        )
+    )
+
+    # Assert
+    assert result.Department[0].DepartmentIdentifier == "ABCD"
+    # The (possibly shared) response is not modified
+    assert isinstance(response["Department"], dict)
+    mock_sd_lookup.assert_called_once()
+    assert mock_sd_lookup.call_args.args == ("GetDepartment20111201",)
+    kwargs = mock_sd_lookup.call_args.kwargs
+    assert kwargs["settings"] is settings
+    assert kwargs["params"]["DepartmentUUIDIdentifier"] == str(DEPARTMENT_UUID)
+    assert kwargs["institution_identifier"] == "II"
+    assert kwargs["dry_run"] is True
+
+
+@patch("sdlon.sd.sd_lookup")
+def test_sd_lookup_client_uses_institution_of_client(
+    mock_sd_lookup: MagicMock, make_settings: Callable[..., Settings]
+):
+    # Arrange
+    mock_sd_lookup.return_value = {
+        "DepartmentParent": {"DepartmentUUIDIdentifier": str(DEPARTMENT_UUID)}
+    }
+    client = SDLookupClient(make_settings(), "XY")
+
+    # Act
+    result = client.get_department_parent(
+        GetDepartmentParentRequest(
+            EffectiveDate=date(2024, 1, 1),
+            DepartmentUUIDIdentifier=UUID("00000000-0000-0000-0000-000000000000"),
+        )
+    )
+
+    # Assert
+    assert result.DepartmentParent.DepartmentUUIDIdentifier == DEPARTMENT_UUID
+    assert mock_sd_lookup.call_args.kwargs["institution_identifier"] == "XY"
@@ -0,0 +1,163 @@
+from typing import Callable
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+
+from sdlon.config import Settings
+from sdlon.metrics import sd_cache_hits
+from sdlon.metrics import sd_cache_misses
+from sdlon.models import SDCacheBackend
+from sdlon.run_stats import RunStats
+from sdlon.sd_cache import SDCache
+from sdlon.sd_cache import _MemoryBackend
+from sdlon.sd_cache import _SQLiteBackend
+from sdlon.sd_cache import get_sd_cache
+from sdlon.sd_common import sd_lookup
+
+URL = "GetDepartment20111201"
+RESPONSE = f"<{URL}><Department><DepartmentIdentifier>ABC</DepartmentIdentifier></Department></{URL}>"
+
+
+def _get_sample_value(counter, endpoint: str) -> float:
+    return counter.labels(endpoint=endpoint)._value.get()
+
+
+@patch("sdlon.sd_cache.time")
+def test_memory_backend_expires_entries(mock_time: MagicMock):
+    # Arrange
+    backend = _MemoryBackend()
+    mock_time.monotonic.return_value = 1000.0
+    backend.set("key", "value", ttl=60)
+
+    # Act + Assert
+    mock_time.monotonic.return_value = 1059.0
+    assert backend.get("key") == "value"
+    mock_time.monotonic.return_value = 1060.0
+    assert backend.get("key") is None
+
+
+def test_sqlite_backend_is_shared_between_instances(tmp_path):
+    # Arrange
+    path = str(tmp_path / "sd_cache.sqlite")
+    _SQLiteBackend(path).set("key", "value", ttl=60)
+
+    # Act
+    value = _SQLiteBackend(path).get("key")
+
+    # Assert
+    assert value == "value"
+    assert _SQLiteBackend(path).get("unknown") is None
+
+
+def test_sd_cache_only_caches_endpoints_with_ttl(
+    make_settings: Callable[..., Settings],
+):
+    # Arrange
+    cache = SDCache(_MemoryBackend(), {URL: 60})
+    settings = make_settings()
+    params = {"InstitutionIdentifier": "II", "DepartmentUUIDIdentifier": "uuid"}
+
+    # Act
+    cache.set(URL, settings, params, RESPONSE)
+    cache.set("GetEmployment20111201", settings, params, "<GetEmployment20111201/>")
+
+    # Assert
+    # The key is independent of the order of the params
+    assert cache.get(URL, settings, dict(reversed(params.items()))) == RESPONSE
+    assert (
+        cache.get(URL, settings, {**params, "DepartmentUUIDIdentifier": "other"})
+        is None
+    )
+    assert cache.get("GetEmployment20111201", settings, params) is None
+
+
+@pytest.mark.parametrize(
+    "other",
+    [
+        {"sd_base_url": "https://other.example.com/"},
+        {"sd_user": "other"},
+    ],
+)
+def test_sd_cache_key_includes_sd_base_url_and_user(
+    other: dict, make_settings: Callable[..., Settings]
+):
+    # Arrange
+    cache = SDCache(_MemoryBackend(), {URL: 60})
+    params = {"InstitutionIdentifier": "II", "DepartmentUUIDIdentifier": "uuid"}
+    cache.set(URL, make_settings(), params, RESPONSE)
+
+    # Act
+    value = cache.get(URL, make_settings(**other), params)
+
+    # Assert
+    assert value is None
+
+
+def test_get_sd_cache_disabled(make_settings: Callable[..., Settings]):
+    assert get_sd_cache(make_settings()) is None
+
+
+@pytest.mark.parametrize("backend", [SDCacheBackend.memory, SDCacheBackend.sqlite])
+@patch("sdlon.sd_common.get_sd_session")
+def test_sd_lookup_uses_cache(
+    mock_get_sd_session: MagicMock,
+    backend,
+    tmp_path,
+    make_settings: Callable[..., Settings],
+):
+    # Arrange
+    settings = make_settings(
+        sd_cache_enabled=True,
+        sd_cache_backend=backend,
+        sd_cache_sqlite_path=str(tmp_path / "sd_cache.sqlite"),
+    )
+    mock_get_sd_session.return_value.get.return_value = MagicMock(
+        text=RESPONSE, status_code=200
+    )
+    hits = _get_sample_value(sd_cache_hits, URL)
+    misses = _get_sample_value(sd_cache_misses, URL)
+    stats = RunStats()
+
+    # Act
+    with stats.activate():
+        first = sd_lookup(URL, settings, params={"DepartmentUUIDIdentifier": "uuid"})
+        second = sd_lookup(URL, settings, params={"DepartmentUUIDIdentifier": "uuid"})
+        other = sd_lookup(
+            URL,
+            settings,
+            params={"DepartmentUUIDIdentifier": "uuid"},
+            institution_identifier="other",
+        )
+
+    # Assert
+    assert first == second == other
+    assert first is not second
+    assert mock_get_sd_session.return_value.get.call_count == 2
+    # The cache hits are not counted as SD calls
+    assert stats.as_dict()["sd_calls"] == {URL: 2}
+    assert _get_sample_value(sd_cache_hits, URL) == hits + 1
+    assert _get_sample_value(sd_cache_misses, URL) == misses + 2
+
+
+@patch("sdlon.sd_common.get_sd_session")
+def test_sd_lookup_does_not_cache_errors(
+    mock_get_sd_session: MagicMock, tmp_path, make_settings: Callable[..., Settings]
+):
+    # Arrange
+    settings = make_settings(
+        sd_cache_enabled=True,
+        sd_cache_backend=SDCacheBackend.sqlite,
+        sd_cache_sqlite_path=str(tmp_path / "sd_cache.sqlite"),
+    )
+    mock_get_sd_session.return_value.get.return_value = MagicMock(
+        text="<Envelope><Fault>error</Fault></Envelope>", status_code=500
+    )
+
+    # Act
+    for _ in range(2):
+        with pytest.raises(Exception):
+            sd_lookup(URL, settings, params={"DepartmentUUIDIdentifier": "uuid"})
+
+    # Assert
+    assert mock_get_sd_session.return_value.get.call_count == 2
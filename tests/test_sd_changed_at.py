@@ -1,13 +1,16 @@
 import datetime
+import threading
 import unittest
 import uuid
 from collections import OrderedDict
 from datetime import date
 from datetime import timedelta
 from unittest import mock
+from unittest.mock import ANY
 from unittest.mock import MagicMock
 from unittest.mock import call
 from unittest.mock import patch
+from zoneinfo import ZoneInfo
 
 import hypothesis.strategies as st
 import pytest
@@ -29,7 +32,11 @@ from sdlon.metrics import RunDBState
 from sdlon.models import ITUserSystem
 from sdlon.models import JobFunction
 from sdlon.models import MOBasePerson
+from sdlon.run_stats import RunStats
+from sdlon.run_stats import count
 from sdlon.sd_changed_at import ChangeAtSD
+from sdlon.sd_changed_at import _update_institutions
+from sdlon.sd_changed_at import _update_persons_concurrently
 from sdlon.sd_changed_at import changed_at
 
 from .fixtures import get_employment_fixture
@@ -38,6 +45,12 @@ from .fixtures import get_sd_person_fixture
 from .fixtures import read_employment_fixture
 
 
+@pytest.fixture(autouse=True)
+def mock_persist_run_stats():
+    with patch("sdlon.sd_changed_at.persist_run_stats") as mock:
+        yield mock
+
+
 class ChangeAtSDTest(ChangeAtSD):
     def __init__(self, mock_create_class: bool = True, *args, **kwargs):
         self.morahelper_mock = MagicMock()
@@ -109,15 +122,15 @@ def setup_sd_changed_at(updates=None, hours=24, dry_run=False, mock_create_class
 
 
 class Test_sd_changed_at(unittest.TestCase):
-    @patch("sdlon.sd_common.requests.get")
-    def test_get_sd_person(self, requests_get):
+    @patch("sdlon.sd_common.get_sd_session")
+    def test_get_sd_person(self, mock_get_sd_session):
         """Test that read_person does the expected transformation."""
         cpr = "0101709999"
         sd_reply, expected_read_person_result = get_sd_person_fixture(
             cpr=cpr, first_name="John", last_name="Deere", employment_id="01337"
         )
 
-        requests_get.return_value = sd_reply
+        mock_get_sd_session.return_value.get.return_value = sd_reply
 
         sd_updater = setup_sd_changed_at()
         result = sd_updater.get_sd_person(cpr=cpr)
@@ -178,6 +191,40 @@ class Test_sd_changed_at(unittest.TestCase):
             },
         )
 
+    @patch("sdlon.sd_changed_at.get_employee")
+    def test_update_changed_persons_streaming(self, mock_get_employee: MagicMock):
+        # Arrange
+        cpr = "0101709999"
+        _, read_person_result = get_sd_person_fixture(
+            cpr=cpr,
+            first_name="John",
+            last_name="Deere",
+            employment_id="01337",
+        )
+
+        sd_updater = setup_sd_changed_at({"sd_streaming_parse": True})
+        sd_updater.get_sd_persons_changed = MagicMock()
+        sd_updater.iter_sd_persons_changed = MagicMock(
+            return_value=iter(read_person_result)
+        )
+
+        user_uuid = str(uuid_generator("test")("user_uuid"))
+        mock_get_employee.return_value = None
+
+        morahelper = sd_updater.morahelper_mock
+        morahelper._mo_post.return_value = attrdict(
+            {"status_code": 201, "json": lambda: user_uuid}
+        )
+
+        # Act
+        sd_updater.update_changed_persons()
+
+        # Assert
+        sd_updater.get_sd_persons_changed.assert_not_called()
+        morahelper._mo_post.assert_called_once()
+        assert morahelper._mo_post.call_args.args[0] == "e/create"
+        assert morahelper._mo_post.call_args.args[1]["cpr_no"] == cpr
+
     @parameterized.expand(
         [
             (True,),
@@ -531,10 +578,10 @@ class Test_sd_changed_at(unittest.TestCase):
         mock_execute.assert_not_called()
 
     @given(status=st.sampled_from(["1", "S"]))
-    @patch("sdlon.sd_common.requests.get")
+    @patch("sdlon.sd_common.get_sd_session")
     def test_read_employment_changed(
         self,
-        requests_get,
+        mock_get_sd_session,
         status,
     ):
         sd_reply, expected_read_employment_result = read_employment_fixture(
@@ -545,16 +592,261 @@ class Test_sd_changed_at(unittest.TestCase):
             status=status,
         )
 
-        requests_get.return_value = sd_reply
+        mock_get_sd_session.return_value.get.return_value = sd_reply
         sd_updater = setup_sd_changed_at()
         result = sd_updater.read_employment_changed()
         self.assertEqual(result, expected_read_employment_result)
 
+    @patch("sdlon.sd_common.get_sd_session")
+    def test_iter_employment_changed(self, mock_get_sd_session: MagicMock):
+        # Arrange
+        sd_reply, expected_read_employment_result = read_employment_fixture(
+            cpr="0101709999",
+            employment_id="01337",
+            job_id="1234",
+            job_title="EDB-Mand",
+            status="1",
+        )
+        response = MagicMock()
+        response.iter_content.return_value = iter([sd_reply.text.encode("utf-8")])
+        mock_get_sd_session.return_value.get.return_value = response
+
+        sd_updater = setup_sd_changed_at(dry_run=True)
+
+        # Act
+        result = list(sd_updater.iter_employment_changed())
+
+        # Assert
+        self.assertEqual(result, expected_read_employment_result)
+
+    def test_update_all_employments_streaming(self):
+        # Arrange
+        cpr = "0101709999"
+        _, read_employment_result = read_employment_fixture(
+            cpr=cpr,
+            employment_id="01337",
+            job_id="1234",
+            job_title="EDB-Mand",
+            status="1",
+        )
+
+        sd_updater = setup_sd_changed_at({"sd_streaming_parse": True})
+        sd_updater.read_employment_changed = MagicMock()
+        sd_updater.iter_employment_changed = MagicMock(
+            return_value=iter(read_employment_result)
+        )
+        sd_updater._update_user_employments = MagicMock()
+
+        morahelper = sd_updater.morahelper_mock
+        morahelper.read_user.return_value = {"uuid": "user_uuid"}
+
+        # Act
+        sd_updater.update_all_employments()
+
+        # Assert
+        sd_updater.read_employment_changed.assert_not_called()
+        sd_updater._update_user_employments.assert_called_once_with(
+            cpr, [read_employment_result[0]["Employment"]], "user_uuid"
+        )
+
+    def test_update_all_employments_prefetched(self):
+        # Arrange
+        cpr = "0101709999"
+        _, read_employment_result = read_employment_fixture(
+            cpr=cpr,
+            employment_id="01337",
+            job_id="1234",
+            job_title="EDB-Mand",
+            status="1",
+        )
+
+        sd_updater = setup_sd_changed_at({"sd_streaming_parse": True})
+        sd_updater.get_sd_persons_changed = MagicMock(return_value=[])
+        sd_updater.read_employment_changed = MagicMock(
+            return_value=read_employment_result
+        )
+        sd_updater.iter_employment_changed = MagicMock()
+        sd_updater._update_user_employments = MagicMock()
+
+        morahelper = sd_updater.morahelper_mock
+        morahelper.read_user.return_value = {"uuid": "user_uuid"}
+
+        # Act
+        sd_updater.prefetch_changes()
+        sd_updater.update_changed_persons()
+        sd_updater.update_all_employments()
+
+        # Assert
+        sd_updater.get_sd_persons_changed.assert_called_once_with(
+            sd_updater.from_date, sd_updater.to_date
+        )
+        sd_updater.read_employment_changed.assert_called_once_with()
+        sd_updater.iter_employment_changed.assert_not_called()
+        sd_updater._update_user_employments.assert_called_once_with(
+            cpr, [read_employment_result[0]["Employment"]], "user_uuid"
+        )
+
+    @patch("sdlon.sd_changed_at.persist_checkpoint")
+    @patch("sdlon.sd_changed_at.get_checkpoints")
+    def test_update_all_employments_updates_persons_checkpointed_in_shorter_interval(
+        self, mock_get_checkpoints: MagicMock, mock_persist_checkpoint: MagicMock
+    ):
+        # Arrange
+        employments = [
+            read_employment_fixture(
+                cpr="0101709999",
+                employment_id="01337",
+                job_id="1234",
+                job_title="EDB-Mand",
+                status="1",
+            )[1][0]
+        ]
+
+        sd_updater = setup_sd_changed_at()
+        sd_updater.read_employment_changed = MagicMock(return_value=employments)
+        sd_updater._update_user_employments = MagicMock()
+        # Checkpointed by an interrupted run of the interval, which ended the
+        # interval earlier than the restarted run
+        mock_get_checkpoints.return_value = {
+            ("0101709999", "01337"): sd_updater.to_date - datetime.timedelta(days=1)
+        }
+
+        morahelper = sd_updater.morahelper_mock
+        morahelper.read_user.return_value = {"uuid": "user_uuid"}
+
+        # Act
+        sd_updater.update_all_employments(run_id=42)
+
+        # Assert
+        sd_updater._update_user_employments.assert_called_once_with(
+            "0101709999", [employments[0]["Employment"]], "user_uuid"
+        )
+
+    @patch("sdlon.sd_changed_at.persist_checkpoint")
+    @patch("sdlon.sd_changed_at.get_checkpoints")
+    def test_update_all_employments_skips_checkpointed_persons(
+        self, mock_get_checkpoints: MagicMock, mock_persist_checkpoint: MagicMock
+    ):
+        # Arrange
+        employments = [
+            read_employment_fixture(
+                cpr=cpr,
+                employment_id=employment_id,
+                job_id="1234",
+                job_title="EDB-Mand",
+                status="1",
+            )[1][0]
+            for cpr, employment_id in [("0101709999", "01337"), ("0202709999", "04242")]
+        ]
+
+        sd_updater = setup_sd_changed_at()
+        sd_updater.read_employment_changed = MagicMock(return_value=employments)
+        sd_updater._update_user_employments = MagicMock()
+        mock_get_checkpoints.return_value = {
+            ("0101709999", "01337"): sd_updater.to_date
+        }
+
+        morahelper = sd_updater.morahelper_mock
+        morahelper.read_user.return_value = {"uuid": "user_uuid"}
+
+        # Act
+        sd_updater.update_all_employments(run_id=42)
+
+        # Assert
+        mock_get_checkpoints.assert_called_once_with(sd_updater.from_date, "XY")
+        sd_updater._update_user_employments.assert_called_once_with(
+            "0202709999", [employments[1]["Employment"]], "user_uuid"
+        )
+        mock_persist_checkpoint.assert_called_once_with(
+            42,
+            sd_updater.from_date,
+            sd_updater.to_date,
+            "XY",
+            "0202709999",
+            ["04242"],
+        )
+
+    def test_update_all_employments_concurrently(self):
+        # Arrange
+        employments = [
+            read_employment_fixture(
+                cpr=cpr,
+                employment_id=employment_id,
+                job_id="1234",
+                job_title="EDB-Mand",
+                status="1",
+            )[1][0]
+            for cpr, employment_id in [("0101709999", "01337"), ("0202709999", "04242")]
+        ]
+
+        sd_updater = setup_sd_changed_at({"sd_employment_workers": 2})
+        sd_updater.read_employment_changed = MagicMock(return_value=employments)
+
+        # Both persons must be updated at the same time to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
+        sd_updater._update_user_employments = MagicMock(
+            side_effect=lambda *args: barrier.wait()
+        )
+
+        morahelper = sd_updater.morahelper_mock
+        morahelper.read_user.return_value = {"uuid": "user_uuid"}
+
+        # Act
+        sd_updater.update_all_employments()
+
+        # Assert
+        assert sorted(
+            c.args[0] for c in sd_updater._update_user_employments.call_args_list
+        ) == ["0101709999", "0202709999"]
+
+    def test_update_employments_fetched_while_updating_persons(self):
+        # Arrange
+        cpr = "0101709999"
+        _, read_employment_result = read_employment_fixture(
+            cpr=cpr,
+            employment_id="01337",
+            job_id="1234",
+            job_title="EDB-Mand",
+            status="1",
+        )
+
+        sd_updater = setup_sd_changed_at({"sd_fetch_changes_concurrently": True})
+        employments_fetched = threading.Event()
+
+        def read_employment_changed():
+            employments_fetched.set()
+            return read_employment_result
+
+        def get_sd_persons_changed(*args):
+            # The employments are fetched while the persons are fetched
+            assert employments_fetched.wait(timeout=5)
+            return []
+
+        sd_updater.read_employment_changed = MagicMock(
+            side_effect=read_employment_changed
+        )
+        sd_updater.get_sd_persons_changed = MagicMock(
+            side_effect=get_sd_persons_changed
+        )
+        sd_updater._update_user_employments = MagicMock()
+
+        morahelper = sd_updater.morahelper_mock
+        morahelper.read_user.return_value = {"uuid": "user_uuid"}
+
+        # Act
+        _update_institutions([sd_updater], workers=1)
+
+        # Assert
+        sd_updater.read_employment_changed.assert_called_once_with()
+        sd_updater._update_user_employments.assert_called_once_with(
+            cpr, [read_employment_result[0]["Employment"]], "user_uuid"
+        )
+
     @patch("sdlon.sd_common.log_payload")
-    @patch("sdlon.sd_common.requests.get")
+    @patch("sdlon.sd_common.get_sd_session")
     def test_read_employment_changed_dry_run(
         self,
-        requests_get: MagicMock,
+        mock_get_sd_session: MagicMock,
         mock_log_payload: MagicMock,
     ):
         # Arrange
@@ -566,7 +858,7 @@ class Test_sd_changed_at(unittest.TestCase):
             status="1",
         )
 
-        requests_get.return_value = sd_reply
+        mock_get_sd_session.return_value.get.return_value = sd_reply
         sd_updater = setup_sd_changed_at(dry_run=True)
 
         # Act
@@ -1793,6 +2085,7 @@ def test_apply_ny_logic_for_non_existing_future_unit(
 @patch("sdlon.sd_changed_at.setup_logging")
 @patch("sdlon.sd_changed_at.get_settings")
 @patch("sdlon.sd_changed_at.sentry_sdk")
+@patch("sdlon.sd_changed_at.get_resume_to_date", MagicMock(return_value=None))
 @patch("sdlon.sd_changed_at.get_run_db_from_date")
 @patch("sdlon.sd_changed_at.gen_date_intervals", return_value=[])
 def test_dipex_last_success_timestamp_called(
@@ -1814,9 +2107,304 @@ def test_dipex_last_success_timestamp_called(
     mock_dipex_last_success_timestamp.set_to_current_time.assert_called_once()
 
 
+@patch("sdlon.sd_changed_at.get_status", return_value=RunDBState.COMPLETED)
+@patch("sdlon.sd_changed_at.setup_logging")
+@patch("sdlon.sd_changed_at.get_settings")
+@patch("sdlon.sd_changed_at.sentry_sdk")
+@patch("sdlon.sd_changed_at.get_resume_to_date")
+@patch("sdlon.sd_changed_at.get_run_db_from_date")
+@patch("sdlon.sd_changed_at.gen_date_intervals")
+@patch("sdlon.sd_changed_at.ChangeAtSD")
+@patch("sdlon.sd_changed_at.persist_status")
+@patch("sdlon.sd_changed_at.get_payload_writer")
+def test_changed_at_resumes_interrupted_interval(
+    mock_get_payload_writer: MagicMock,
+    mock_persist_status: MagicMock,
+    mock_change_at_sd: MagicMock,
+    mock_gen_date_intervals: MagicMock,
+    mock_get_run_db_from_date: MagicMock,
+    mock_get_resume_to_date: MagicMock,
+    mock_sentry_sdk: MagicMock,
+    mock_get_settings: MagicMock,
+    mock_setup_logging: MagicMock,
+    mock_get_status: MagicMock,
+):
+    # Arrange
+    mock_get_settings.return_value.sd_institution_identifier = "XY"
+    mock_get_settings.return_value.sd_prefetch_intervals = 0
+    mock_get_settings.return_value.sd_institution_workers = 1
+    from_date = datetime.datetime(2024, 1, 1, 12, tzinfo=ZoneInfo("Europe/Copenhagen"))
+    # The interrupted run ended the interval at the time it was started
+    resume_to_date = datetime.datetime(
+        2024, 1, 1, 15, tzinfo=ZoneInfo("Europe/Copenhagen")
+    )
+    to_date = datetime.datetime(2024, 1, 1, 18, tzinfo=ZoneInfo("Europe/Copenhagen"))
+    mock_get_run_db_from_date.return_value = from_date
+    mock_get_resume_to_date.return_value = resume_to_date
+    mock_gen_date_intervals.return_value = [(resume_to_date, to_date)]
+
+    # Act
+    changed_at(MagicMock(), MagicMock())
+
+    # Assert
+    mock_get_resume_to_date.assert_called_once_with(from_date)
+    mock_gen_date_intervals.assert_called_once_with(resume_to_date, ANY)
+    assert mock_persist_status.call_args_list == [
+        call(from_date, resume_to_date, RunDBState.RUNNING),
+        call(from_date, resume_to_date, RunDBState.COMPLETED),
+        call(resume_to_date, to_date, RunDBState.RUNNING),
+        call(resume_to_date, to_date, RunDBState.COMPLETED),
+    ]
+
+
+@patch("sdlon.sd_changed_at.get_status", return_value=RunDBState.COMPLETED)
+@patch("sdlon.sd_changed_at.setup_logging")
+@patch("sdlon.sd_changed_at.get_settings")
+@patch("sdlon.sd_changed_at.sentry_sdk")
+@patch("sdlon.sd_changed_at.get_resume_to_date", MagicMock(return_value=None))
+@patch("sdlon.sd_changed_at.get_run_db_from_date")
+@patch("sdlon.sd_changed_at.gen_date_intervals")
+@patch("sdlon.sd_changed_at.ChangeAtSD")
+@patch("sdlon.sd_changed_at.persist_status")
+@patch("sdlon.sd_changed_at.get_payload_writer")
+def test_changed_at_flushes_payloads_before_completing_interval(
+    mock_get_payload_writer: MagicMock,
+    mock_persist_status: MagicMock,
+    mock_change_at_sd: MagicMock,
+    mock_gen_date_intervals: MagicMock,
+    mock_get_run_db_from_date: MagicMock,
+    mock_sentry_sdk: MagicMock,
+    mock_get_settings: MagicMock,
+    mock_setup_logging: MagicMock,
+    mock_get_status: MagicMock,
+):
+    # Arrange
+    mock_get_settings.return_value.sd_institution_identifier = "XY"
+    mock_get_settings.return_value.sd_prefetch_intervals = 0
+    mock_get_settings.return_value.sd_institution_workers = 1
+    from_date = datetime.datetime(2024, 1, 1)
+    to_date = datetime.datetime(2024, 1, 2)
+    mock_gen_date_intervals.return_value = [(from_date, to_date)]
+
+    manager = MagicMock()
+    manager.attach_mock(mock_persist_status, "persist_status")
+    manager.attach_mock(mock_get_payload_writer.return_value.flush, "flush")
+
+    # Act
+    changed_at(MagicMock(), MagicMock())
+
+    # Assert
+    assert manager.mock_calls == [
+        call.persist_status(from_date, to_date, RunDBState.RUNNING),
+        call.flush(),
+        call.persist_status(from_date, to_date, RunDBState.COMPLETED),
+    ]
+
+
+@patch("sdlon.sd_changed_at.get_status", return_value=RunDBState.COMPLETED)
+@patch("sdlon.sd_changed_at.setup_logging")
+@patch("sdlon.sd_changed_at.get_settings")
+@patch("sdlon.sd_changed_at.sentry_sdk")
+@patch("sdlon.sd_changed_at.get_resume_to_date", MagicMock(return_value=None))
+@patch("sdlon.sd_changed_at.get_run_db_from_date")
+@patch("sdlon.sd_changed_at.gen_date_intervals")
+@patch("sdlon.sd_changed_at.ChangeAtSD")
+@patch("sdlon.sd_changed_at.persist_status")
+@patch("sdlon.sd_changed_at.get_payload_writer")
+def test_changed_at_updates_institutions_concurrently(
+    mock_get_payload_writer: MagicMock,
+    mock_persist_status: MagicMock,
+    mock_change_at_sd: MagicMock,
+    mock_gen_date_intervals: MagicMock,
+    mock_get_run_db_from_date: MagicMock,
+    mock_sentry_sdk: MagicMock,
+    mock_get_settings: MagicMock,
+    mock_setup_logging: MagicMock,
+    mock_get_status: MagicMock,
+):
+    # Arrange
+    mock_get_settings.return_value.sd_institution_identifier = ["XY", "ZZ"]
+    mock_get_settings.return_value.sd_prefetch_intervals = 0
+    mock_get_settings.return_value.sd_institution_workers = 2
+    from_date = datetime.datetime(2024, 1, 1)
+    to_date = datetime.datetime(2024, 1, 2)
+    mock_gen_date_intervals.return_value = [(from_date, to_date)]
+
+    # Both institutions must be updated at the same time to pass the barrier
+    barrier = threading.Barrier(2, timeout=5)
+    mock_change_at_sd.return_value.update_changed_persons.side_effect = (
+        lambda: barrier.wait()
+    )
+
+    # Act
+    changed_at(MagicMock(), MagicMock())
+
+    # Assert
+    assert mock_change_at_sd.return_value.update_all_employments.call_count == 2
+    assert mock_persist_status.call_args_list == [
+        call(from_date, to_date, RunDBState.RUNNING),
+        call(from_date, to_date, RunDBState.COMPLETED),
+    ]
+
+
+@patch("sdlon.sd_changed_at.get_status", return_value=RunDBState.COMPLETED)
 @patch("sdlon.sd_changed_at.setup_logging")
 @patch("sdlon.sd_changed_at.get_settings")
 @patch("sdlon.sd_changed_at.sentry_sdk")
+@patch("sdlon.sd_changed_at.get_resume_to_date", MagicMock(return_value=None))
+@patch("sdlon.sd_changed_at.get_run_db_from_date")
+@patch("sdlon.sd_changed_at.gen_date_intervals")
+@patch("sdlon.sd_changed_at.ChangeAtSD")
+@patch("sdlon.sd_changed_at.persist_status")
+@patch("sdlon.sd_changed_at.get_payload_writer")
+def test_changed_at_does_not_complete_interval_if_an_institution_fails(
+    mock_get_payload_writer: MagicMock,
+    mock_persist_status: MagicMock,
+    mock_change_at_sd: MagicMock,
+    mock_gen_date_intervals: MagicMock,
+    mock_get_run_db_from_date: MagicMock,
+    mock_sentry_sdk: MagicMock,
+    mock_get_settings: MagicMock,
+    mock_setup_logging: MagicMock,
+    mock_get_status: MagicMock,
+):
+    # Arrange
+    mock_get_settings.return_value.sd_institution_identifier = ["XY", "ZZ"]
+    mock_get_settings.return_value.sd_prefetch_intervals = 0
+    mock_get_settings.return_value.sd_institution_workers = 2
+    from_date = datetime.datetime(2024, 1, 1)
+    to_date = datetime.datetime(2024, 1, 2)
+    mock_gen_date_intervals.return_value = [(from_date, to_date)]
+
+    failing_updater = MagicMock()
+    failing_updater.update_changed_persons.side_effect = ValueError("SD down")
+    other_updater = MagicMock()
+    mock_change_at_sd.side_effect = [failing_updater, other_updater]
+
+    # Act
+    with pytest.raises(ValueError):
+        changed_at(MagicMock(), MagicMock())
+
+    # Assert
+    other_updater.update_all_employments.assert_called_once()
+    mock_persist_status.assert_called_once_with(from_date, to_date, RunDBState.RUNNING)
+
+
+@patch("sdlon.sd_changed_at.get_status", return_value=RunDBState.COMPLETED)
+@patch("sdlon.sd_changed_at.setup_logging")
+@patch("sdlon.sd_changed_at.get_settings")
+@patch("sdlon.sd_changed_at.sentry_sdk")
+@patch("sdlon.sd_changed_at.get_resume_to_date", MagicMock(return_value=None))
+@patch("sdlon.sd_changed_at.get_run_db_from_date")
+@patch("sdlon.sd_changed_at.gen_date_intervals")
+@patch("sdlon.sd_changed_at.ChangeAtSD")
+@patch("sdlon.sd_changed_at.persist_status")
+@patch("sdlon.sd_changed_at.get_payload_writer")
+def test_changed_at_prefetches_next_interval(
+    mock_get_payload_writer: MagicMock,
+    mock_persist_status: MagicMock,
+    mock_change_at_sd: MagicMock,
+    mock_gen_date_intervals: MagicMock,
+    mock_get_run_db_from_date: MagicMock,
+    mock_sentry_sdk: MagicMock,
+    mock_get_settings: MagicMock,
+    mock_setup_logging: MagicMock,
+    mock_get_status: MagicMock,
+):
+    # Arrange
+    mock_get_settings.return_value.sd_institution_identifier = "XY"
+    mock_get_settings.return_value.sd_prefetch_intervals = 1
+    mock_get_settings.return_value.sd_institution_workers = 1
+    intervals = [
+        (datetime.datetime(2024, 1, 1), datetime.datetime(2024, 1, 2)),
+        (datetime.datetime(2024, 1, 2), datetime.datetime(2024, 1, 3)),
+        (datetime.datetime(2024, 1, 3), datetime.datetime(2024, 1, 4)),
+    ]
+    mock_gen_date_intervals.return_value = intervals
+
+    fetched = []
+    updated = []
+    second_fetched = threading.Event()
+
+    def create_updater(settings, inst_id, from_date, to_date, run_context):
+        sd_updater = MagicMock()
+
+        def prefetch_changes():
+            fetched.append(from_date)
+            if from_date == intervals[1][0]:
+                second_fetched.set()
+
+        def update_changed_persons():
+            if from_date == intervals[0][0]:
+                # The next interval is fetched while this one is updated
+                assert second_fetched.wait(timeout=5)
+            updated.append(from_date)
+
+        sd_updater.prefetch_changes.side_effect = prefetch_changes
+        sd_updater.update_changed_persons.side_effect = update_changed_persons
+        return sd_updater
+
+    mock_change_at_sd.side_effect = create_updater
+
+    # Act
+    changed_at(MagicMock(), MagicMock())
+
+    # Assert
+    from_dates = [from_date for from_date, _ in intervals]
+    assert fetched == from_dates
+    assert updated == from_dates
+    assert mock_persist_status.call_args_list == [
+        call(from_date, to_date, status)
+        for from_date, to_date in intervals
+        for status in (RunDBState.RUNNING, RunDBState.COMPLETED)
+    ]
+
+
+@patch("sdlon.sd_changed_at.get_status", return_value=RunDBState.COMPLETED)
+@patch("sdlon.sd_changed_at.setup_logging")
+@patch("sdlon.sd_changed_at.get_settings")
+@patch("sdlon.sd_changed_at.sentry_sdk")
+@patch("sdlon.sd_changed_at.get_resume_to_date", MagicMock(return_value=None))
+@patch("sdlon.sd_changed_at.get_run_db_from_date")
+@patch("sdlon.sd_changed_at.gen_date_intervals")
+@patch("sdlon.sd_changed_at.ChangeAtSD")
+@patch("sdlon.sd_changed_at.persist_status")
+@patch("sdlon.sd_changed_at.get_payload_writer")
+def test_changed_at_shares_run_context_between_updaters(
+    mock_get_payload_writer: MagicMock,
+    mock_persist_status: MagicMock,
+    mock_change_at_sd: MagicMock,
+    mock_gen_date_intervals: MagicMock,
+    mock_get_run_db_from_date: MagicMock,
+    mock_sentry_sdk: MagicMock,
+    mock_get_settings: MagicMock,
+    mock_setup_logging: MagicMock,
+    mock_get_status: MagicMock,
+):
+    # Arrange
+    mock_get_settings.return_value.sd_institution_identifier = ["XY", "ZZ"]
+    mock_get_settings.return_value.sd_prefetch_intervals = 0
+    mock_get_settings.return_value.sd_institution_workers = 1
+    mock_gen_date_intervals.return_value = [
+        (datetime.datetime(2024, 1, 1), datetime.datetime(2024, 1, 2)),
+        (datetime.datetime(2024, 1, 2), datetime.datetime(2024, 1, 3)),
+    ]
+
+    # Act
+    changed_at(MagicMock(), MagicMock())
+
+    # Assert
+    assert mock_change_at_sd.call_count == 4
+    run_contexts = {
+        id(c.kwargs["run_context"]) for c in mock_change_at_sd.call_args_list
+    }
+    assert len(run_contexts) == 1
+
+
+@patch("sdlon.sd_changed_at.setup_logging")
+@patch("sdlon.sd_changed_at.get_settings")
+@patch("sdlon.sd_changed_at.sentry_sdk")
+@patch("sdlon.sd_changed_at.get_resume_to_date", MagicMock(return_value=None))
 @patch("sdlon.sd_changed_at.get_run_db_from_date")
 @patch("sdlon.sd_changed_at.gen_date_intervals")
 def test_dipex_last_success_timestamp_not_called_on_error(
@@ -2962,6 +3550,35 @@ def test__fetch_ad_information_for_ldap_case(mock_get: MagicMock):
     assert object_guid == "c04d7ec7-1364-4d98-9ad4-4dddabe703b4"
 
 
+@patch("sdlon.sd_changed_at.get_mo_client")
+def test_updaters_share_run_context(mock_get_mo_client: MagicMock):
+    # Arrange
+    sd_updater = setup_sd_changed_at()
+    helper = sd_updater.morahelper_mock
+    helper.read_classes_in_facet.return_value = ([], "facet_uuid")
+
+    # Act
+    next_updater = ChangeAtSDTest(
+        True,
+        sd_updater.settings,
+        "ZZ",
+        sd_updater.to_date,
+        sd_updater.to_date + timedelta(days=1),
+        run_context=sd_updater.run_context,
+    )
+    sd_updater._create_engagement_type("engagement_type_ref", "job_position")
+
+    # Assert
+    mock_get_mo_client.assert_called_once()
+    helper.read_organisation.assert_called_once()
+    assert helper.read_classes_in_facet.call_count == 2
+    assert helper.ensure_class_in_facet.call_count == 2
+    # The MoraHelper (and its cache) is not shared
+    assert next_updater.helper is not sd_updater.helper
+    next_updater.helper.read_organisation.assert_not_called()
+    assert next_updater.engagement_types == {"engagement_type_ref": "new_class_uuid"}
+
+
 @patch("sdlon.sd_changed_at.get_mo_client")
 def test__create_class(mock_get_graphql_client: MagicMock):
     # Arrange
@@ -2999,3 +3616,75 @@ def test__create_class(mock_get_graphql_client: MagicMock):
     )
 
     assert result == class_uuid
+
+
+def test_update_persons_concurrently_keeps_the_updates_of_a_person_in_order():
+    # Arrange
+    first_started = threading.Event()
+    release_first = threading.Event()
+    updated = []
+
+    def update_person(employment):
+        if employment["n"] == 1:
+            first_started.set()
+            assert release_first.wait(timeout=5)
+        updated.append(employment["n"])
+
+    def feed():
+        yield {"PersonCivilRegistrationIdentifier": "0101709999", "n": 1}
+        assert first_started.wait(timeout=5)
+        # Updated while the first update of the other person is blocked
+        yield {"PersonCivilRegistrationIdentifier": "0202709999", "n": 2}
+        release_first.set()
+        yield {"PersonCivilRegistrationIdentifier": "0101709999", "n": 3}
+
+    # Act
+    _update_persons_concurrently(update_person, feed(), workers=2)
+
+    # Assert
+    assert updated.index(1) < updated.index(3)
+    assert sorted(updated) == [1, 2, 3]
+
+
+def test_update_persons_concurrently_raises_errors():
+    # Arrange
+    def update_person(employment):
+        if employment["PersonCivilRegistrationIdentifier"] == "0101709999":
+            raise ValueError("MO down")
+
+    feed = [
+        {"PersonCivilRegistrationIdentifier": "0101709999"},
+        {"PersonCivilRegistrationIdentifier": "0202709999"},
+    ]
+
+    # Act + Assert
+    with pytest.raises(ValueError):
+        _update_persons_concurrently(update_person, feed, workers=2)
+
+
+def test_update_institutions_persists_run_stats(
+    mock_persist_run_stats: MagicMock,
+):
+    # Arrange
+    from_date = datetime.datetime(2024, 1, 1)
+    to_date = datetime.datetime(2024, 1, 2)
+    sd_updater = MagicMock()
+    sd_updater.current_inst_id = "XY"
+    sd_updater.from_date = from_date
+    sd_updater.to_date = to_date
+    sd_updater.settings.sd_fetch_changes_concurrently = False
+    sd_updater.stats = RunStats()
+    sd_updater.update_changed_persons.side_effect = lambda: count(
+        "persons_processed", 2
+    )
+    sd_updater.update_all_employments.side_effect = RuntimeError("MO down")
+
+    # Act
+    with pytest.raises(RuntimeError):
+        _update_institutions([sd_updater], workers=1, run_id=42)
+
+    # Assert
+    mock_persist_run_stats.assert_called_once_with(
+        42, "XY", from_date, to_date, sd_updater.stats.as_dict()
+    )
+    assert sd_updater.stats.as_dict()["persons_processed"] == 2
@@ -7,12 +7,18 @@ from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pytest
+import xmltodict
+from lxml import etree
+from prometheus_client import REGISTRY
 from pytest import MonkeyPatch
 
 from sdlon.config import Settings
 from sdlon.engagement import get_eng_user_key
+from sdlon.exceptions import SDEmploymentNotFound
 from sdlon.models import JobFunction
+from sdlon.sd_common import ensure_list
 from sdlon.sd_common import read_employment_at
+from sdlon.sd_common import sd_iter_persons
 from sdlon.sd_common import sd_lookup
 
 
@@ -28,6 +34,7 @@ def settings() -> Settings:
         sd_job_function=JobFunction.employment_name,
         sd_monthly_hourly_divide=1,
         app_dbpassword="secret",
+        sd_persist_payloads_in_background=False,
     )
 
 
@@ -72,32 +79,66 @@ def test_sd_lookup_logs_payload_to_db(
         params: str,
         response: str,
         status_code: int,
+        compress: bool,
     ):
         # Assert
+        assert compress is False
         assert request_uuid == test_request_uuid
         assert full_url.endswith(test_url)
         assert params == str(test_params)
         assert response == test_response
         assert status_code == test_status_code
 
-    monkeypatch.setattr("sdlon.sd_common.requests.get", mock_requests_get)
+    mock_session = MagicMock()
+    mock_session.get = mock_requests_get
+    monkeypatch.setattr("sdlon.sd_common.get_sd_session", lambda settings: mock_session)
     monkeypatch.setattr("sdlon.sd_common.log_payload", mock_log_payload)
 
     # Act
     sd_lookup(test_url, settings, test_params, request_uuid=test_request_uuid)
 
 
-@patch("sdlon.sd_common.requests")
+@patch("sdlon.sd_common.get_sd_session")
+@patch("sdlon.sd_common.log_payload")
+@patch("sdlon.sd_common.get_payload_writer")
+def test_sd_lookup_persists_payload_in_background(
+    mock_get_payload_writer: MagicMock,
+    mock_log_payload: MagicMock,
+    mock_get_sd_session: MagicMock,
+    settings: Settings,
+):
+    # Arrange
+    settings.sd_persist_payloads_in_background = True
+    request_uuid = uuid.uuid4()
+    response_text = "<SomeSDEndpoint><foo></foo></SomeSDEndpoint>"
+    mock_get_sd_session.return_value.get.return_value = _MockResponse(
+        text=response_text, status_code=200
+    )
+
+    # Act
+    sd_lookup("SomeSDEndpoint", settings, request_uuid=request_uuid)
+
+    # Assert
+    mock_get_payload_writer.assert_called_once_with(settings)
+    mock_put = mock_get_payload_writer.return_value.put
+    mock_put.assert_called_once()
+    assert mock_put.call_args.kwargs["request_uuid"] == request_uuid
+    assert mock_put.call_args.kwargs["response"] == response_text
+    assert mock_put.call_args.kwargs["compress"] is False
+    mock_log_payload.assert_not_called()
+
+
+@patch("sdlon.sd_common.get_sd_session")
 @patch("sdlon.sd_common.log_payload")
 def test_sd_lookup_does_not_persist_payload_when_disabled_in_settings(
     mock_log_payload: MagicMock,
-    mock_requests: MagicMock,
+    mock_get_sd_session: MagicMock,
     settings: Settings,
 ):
     # Arrange
     settings.sd_persist_payloads = False
 
-    mock_requests.get.return_value = _MockResponse(
+    mock_get_sd_session.return_value.get.return_value = _MockResponse(
         text="<SomeSDEndpoint><foo></foo></SomeSDEndpoint>", status_code=200
     )
 
@@ -108,15 +149,15 @@ def test_sd_lookup_does_not_persist_payload_when_disabled_in_settings(
     mock_log_payload.assert_not_called()
 
 
-@patch("sdlon.sd_common.requests")
+@patch("sdlon.sd_common.get_sd_session")
 @patch("sdlon.sd_common.log_payload")
 def test_sd_lookup_does_not_persist_payload_when_dry_run(
     mock_log_payload: MagicMock,
-    mock_requests: MagicMock,
+    mock_get_sd_session: MagicMock,
     settings: Settings,
 ):
     # Arrange
-    mock_requests.get.return_value = _MockResponse(
+    mock_get_sd_session.return_value.get.return_value = _MockResponse(
         text="<SomeSDEndpoint><foo></foo></SomeSDEndpoint>", status_code=200
     )
 
@@ -127,6 +168,255 @@ def test_sd_lookup_does_not_persist_payload_when_dry_run(
     mock_log_payload.assert_not_called()
 
 
+@patch("sdlon.sd_common.get_sd_session")
+@patch("sdlon.sd_common.log_payload")
+def test_sd_lookup_uses_timeouts_from_settings(
+    mock_log_payload: MagicMock,
+    mock_get_sd_session: MagicMock,
+    settings: Settings,
+):
+    # Arrange
+    settings.sd_http_connect_timeout = 5
+    settings.sd_http_read_timeout = 60
+
+    mock_get = mock_get_sd_session.return_value.get
+    mock_get.return_value = _MockResponse(
+        text="<SomeSDEndpoint><foo></foo></SomeSDEndpoint>", status_code=200
+    )
+
+    # Act
+    sd_lookup("SomeSDEndpoint", settings)
+
+    # Assert
+    mock_get_sd_session.assert_called_once_with(settings)
+    assert mock_get.call_args.kwargs["timeout"] == (5, 60)
+
+
+def _get_sample_value(name: str, endpoint: str) -> float:
+    value = REGISTRY.get_sample_value(
+        name, {"endpoint": endpoint, "institution": "dummy"}
+    )
+    return value or 0.0
+
+
+@patch("sdlon.sd_common.get_sd_session")
+def test_sd_lookup_records_metrics(mock_get_sd_session: MagicMock, settings: Settings):
+    # Arrange
+    settings.sd_persist_payloads = False
+    url = "MetricsSDEndpoint"
+    response_text = f"<{url}><foo>bar</foo></{url}>"
+    mock_get_sd_session.return_value.get.return_value = _MockResponse(
+        text=response_text, status_code=200
+    )
+
+    # Act
+    sd_lookup(url, settings)
+
+    # Assert
+    assert _get_sample_value("sd_request_duration_seconds_count", url) == 1
+    assert _get_sample_value("sd_parse_duration_seconds_count", url) == 1
+    assert _get_sample_value("sd_response_size_bytes_count", url) == 1
+    assert _get_sample_value("sd_response_size_bytes_sum", url) == len(response_text)
+    assert _get_sample_value("sd_error_envelopes_total", url) == 0
+
+
+@patch("sdlon.sd_common._in_flight_sd_lookups")
+def test_sd_lookup_single_flight_key_includes_sd_base_url_and_user(
+    mock_in_flight: MagicMock, settings: Settings
+):
+    # Arrange
+    other_base_url = settings.copy(update={"sd_base_url": "https://other.example.com/"})
+    other_user = settings.copy(update={"sd_user": "other"})
+
+    # Act
+    for s in (settings, other_base_url, other_user):
+        sd_lookup("GetDepartment20111201", s, {"DepartmentIdentifier": "ABC"})
+
+    # Assert
+    keys = [call.args[0] for call in mock_in_flight.do.call_args_list]
+    assert len(set(keys)) == 3
+
+
+@pytest.mark.parametrize(
+    "fault, expected_exception, not_found",
+    [
+        ("Some other error", Exception, 0),
+        (
+            "The stated EmploymentIdentifier 12345 does not exist",
+            SDEmploymentNotFound,
+            1,
+        ),
+    ],
+)
+@patch("sdlon.sd_common.get_sd_session")
+def test_sd_lookup_counts_error_envelopes(
+    mock_get_sd_session: MagicMock,
+    settings: Settings,
+    fault: str,
+    expected_exception: type[Exception],
+    not_found: int,
+):
+    # Arrange
+    settings.sd_persist_payloads = False
+    url = "ErrorEnvelopeSDEndpoint"
+    mock_get_sd_session.return_value.get.return_value = _MockResponse(
+        text=f"<Envelope><Body><Fault><faultstring>{fault}</faultstring></Fault>"
+        "</Body></Envelope>",
+        status_code=500,
+    )
+    envelopes = _get_sample_value("sd_error_envelopes_total", url)
+    not_founds = _get_sample_value("sd_employment_not_found_total", url)
+
+    # Act
+    with pytest.raises(expected_exception):
+        sd_lookup(url, settings)
+
+    # Assert
+    assert _get_sample_value("sd_error_envelopes_total", url) == envelopes + 1
+    assert (
+        _get_sample_value("sd_employment_not_found_total", url)
+        == not_founds + not_found
+    )
+
+
+SD_PERSONS_RESPONSE = """<?xml version="1.0" encoding="UTF-8" ?>
+<GetEmploymentChangedAtDate20111201 creationDateTime="2023-11-23T17:01:42">
+  <RequestStructure>
+    <InstitutionIdentifier>XY</InstitutionIdentifier>
+  </RequestStructure>
+  <Person>
+    <PersonCivilRegistrationIdentifier>1212121000</PersonCivilRegistrationIdentifier>
+    <Employment>
+      <EmploymentIdentifier>12345</EmploymentIdentifier>
+      <EmploymentStatus changedAtDate="2023-11-23">
+        <ActivationDate>2024-04-01</ActivationDate>
+        <EmploymentStatusCode>8</EmploymentStatusCode>
+      </EmploymentStatus>
+    </Employment>
+  </Person>
+  <Person>
+    <PersonCivilRegistrationIdentifier>2212221000</PersonCivilRegistrationIdentifier>
+    <PersonGivenName>Åse</PersonGivenName>
+    <Employment>
+      <EmploymentIdentifier>54321</EmploymentIdentifier>
+    </Employment>
+    <Employment>
+      <EmploymentIdentifier>54322</EmploymentIdentifier>
+    </Employment>
+  </Person>
+</GetEmploymentChangedAtDate20111201>
+"""
+
+
+def _mock_streamed_response(text: str, chunk_size: int = 7) -> MagicMock:
+    data = text.encode("utf-8")
+    response = MagicMock()
+    response.status_code = 200
+    response.iter_content.return_value = iter(
+        data[i : i + chunk_size] for i in range(0, len(data), chunk_size)
+    )
+    return response
+
+
+@patch("sdlon.sd_common.get_sd_session")
+@patch("sdlon.sd_common.log_payload")
+def test_sd_iter_persons_yields_same_persons_as_sd_lookup(
+    mock_log_payload: MagicMock,
+    mock_get_sd_session: MagicMock,
+    settings: Settings,
+):
+    # Arrange
+    url = "GetEmploymentChangedAtDate20111201"
+    mock_get_sd_session.return_value.get.return_value = _mock_streamed_response(
+        SD_PERSONS_RESPONSE
+    )
+    expected = ensure_list(xmltodict.parse(SD_PERSONS_RESPONSE)[url]["Person"])
+
+    # Act
+    persons = list(sd_iter_persons(url, settings, dry_run=True))
+
+    # Assert
+    assert persons == expected
+    assert mock_get_sd_session.return_value.get.call_args.kwargs["stream"] is True
+
+
+@patch("sdlon.sd_common.get_sd_session")
+@patch("sdlon.sd_common.log_payload")
+def test_sd_iter_persons_downloads_and_persists_payload_before_parsing(
+    mock_log_payload: MagicMock,
+    mock_get_sd_session: MagicMock,
+    settings: Settings,
+):
+    # Arrange
+    request_uuid = uuid.uuid4()
+    response = _mock_streamed_response(SD_PERSONS_RESPONSE)
+    mock_get_sd_session.return_value.get.return_value = response
+    persisted = []
+
+    def log_payload(response, **kwargs):
+        response.seek(0)
+        persisted.append(response.read())
+
+    mock_log_payload.side_effect = log_payload
+
+    # Act
+    persons = sd_iter_persons(
+        "GetEmploymentChangedAtDate20111201", settings, request_uuid=request_uuid
+    )
+    next(persons)
+
+    # Assert
+    # The response is closed and persisted before the persons are processed
+    response.__exit__.assert_called_once()
+    mock_log_payload.assert_called_once()
+    assert mock_log_payload.call_args.kwargs["request_uuid"] == request_uuid
+    assert mock_log_payload.call_args.kwargs["status_code"] == 200
+    assert persisted == [SD_PERSONS_RESPONSE.encode("utf-8")]
+    assert len(list(persons)) == 1
+    mock_log_payload.assert_called_once()
+
+
+@patch("sdlon.sd_common.get_sd_session")
+@patch("sdlon.sd_common.log_payload")
+def test_sd_iter_persons_raises_on_error_envelope(
+    mock_log_payload: MagicMock,
+    mock_get_sd_session: MagicMock,
+    settings: Settings,
+):
+    # Arrange
+    mock_get_sd_session.return_value.get.return_value = _mock_streamed_response(
+        """<Envelope><Body><Fault><faultstring>
+        The stated EmploymentIdentifier 12345 does not exist
+        </faultstring></Fault></Body></Envelope>"""
+    )
+
+    # Act + Assert
+    with pytest.raises(SDEmploymentNotFound):
+        list(sd_iter_persons("GetEmploymentChangedAtDate20111201", settings))
+    mock_log_payload.assert_called_once()
+
+
+@patch("sdlon.sd_common.get_sd_session")
+def test_sd_iter_persons_records_response_size(
+    mock_get_sd_session: MagicMock, settings: Settings
+):
+    # Arrange
+    settings.sd_persist_payloads = False
+    url = "GetEmploymentChangedAtDate20111201"
+    mock_get_sd_session.return_value.get.return_value = _mock_streamed_response(
+        SD_PERSONS_RESPONSE
+    )
+    size = _get_sample_value("sd_response_size_bytes_sum", url)
+
+    # Act
+    list(sd_iter_persons(url, settings))
+
+    # Assert
+    assert _get_sample_value("sd_response_size_bytes_sum", url) == size + len(
+        SD_PERSONS_RESPONSE.encode("utf-8")
+    )
+
+
 @pytest.mark.parametrize(
     "prefix_enabled, sd_emp_id, sd_inst_id, expected",
     [
@@ -147,3 +437,28 @@ def test_get_eng_user_key(
 
     # Assert
     assert user_key == expected
+
+
+@patch("sdlon.sd_common.get_sd_session")
+def test_sd_iter_persons_reports_unparsable_response(
+    mock_get_sd_session: MagicMock, settings: Settings
+):
+    # Arrange
+    settings.sd_persist_payloads = False
+    settings.sd_rate_limit_enabled = True
+    url = "GetEmploymentChangedAtDate20111201"
+    mock_get_sd_session.return_value.get.return_value = _mock_streamed_response(
+        "<html><body>Service Unavailable"
+    )
+    parse_count = _get_sample_value("sd_parse_duration_seconds_count", url)
+
+    # Act
+    with patch("sdlon.sd_common.get_sd_rate_limiter") as mock_get_rate_limiter:
+        with pytest.raises(etree.XMLSyntaxError):
+            list(sd_iter_persons(url, settings))
+
+    # Assert
+    mock_get_rate_limiter.return_value.throttled.assert_called_once_with()
+    assert _get_sample_value("sd_parse_duration_seconds_count", url) == (
+        parse_count + 1
+    )
@@ -0,0 +1,161 @@
+from typing import Callable
+from unittest.mock import MagicMock
+from unittest.mock import call
+from unittest.mock import patch
+
+import pytest
+
+from sdlon.config import Settings
+from sdlon.sd_common import sd_lookup
+from sdlon.sd_rate_limit import AdaptiveRateLimiter
+from sdlon.sd_rate_limit import get_sd_rate_limiter
+
+URL = "GetDepartment20111201"
+
+
+def test_aimd_adaptation():
+    # Arrange
+    limiter = AdaptiveRateLimiter(
+        max_rate=10, min_rate=1, burst=1, increase=1, decrease_factor=0.5
+    )
+
+    # Act + Assert
+    limiter.throttled()
+    assert limiter.rate == 5
+    limiter.throttled()
+    limiter.throttled()
+    limiter.throttled()
+    assert limiter.rate == 1
+    limiter.succeeded()
+    assert limiter.rate == 2
+    for _ in range(20):
+        limiter.succeeded()
+    assert limiter.rate == 10
+
+
+@patch("sdlon.sd_rate_limit.time")
+def test_acquire_waits_for_tokens(mock_time: MagicMock):
+    # Arrange
+    now = 100.0
+    sleeps = []
+
+    def sleep(seconds: float) -> None:
+        nonlocal now
+        sleeps.append(seconds)
+        now += seconds
+
+    mock_time.monotonic.side_effect = lambda: now
+    mock_time.sleep.side_effect = sleep
+    limiter = AdaptiveRateLimiter(
+        max_rate=2, min_rate=1, burst=2, increase=1, decrease_factor=0.5
+    )
+
+    # Act
+    for _ in range(4):
+        limiter.acquire()
+
+    # Assert
+    # The burst is used immediately, then one token is available every 0.5s
+    assert sleeps == [pytest.approx(0.5), pytest.approx(0.5)]
+
+
+def test_get_sd_rate_limiter(make_settings: Callable[..., Settings]):
+    # Arrange
+    settings = make_settings(
+        sd_rate_limit_enabled=True,
+        sd_rate_limit=10,
+        sd_rate_limit_per_institution={"AB": 2},
+    )
+
+    # Act
+    limiter_ii = get_sd_rate_limiter(settings, "II")
+    limiter_ab = get_sd_rate_limiter(settings, "AB")
+
+    # Assert
+    assert get_sd_rate_limiter(make_settings(), "II") is None
+    assert limiter_ii is get_sd_rate_limiter(settings, "II")
+    assert limiter_ii is not None and limiter_ii.max_rate == 10
+    assert limiter_ab is not None and limiter_ab.max_rate == 2
+
+
+@pytest.mark.parametrize(
+    "status_code,text,expected_rate",
+    [
+        (200, f"<{URL}><Department/></{URL}>", 6),
+        (200, "<Envelope><Fault>Try again later</Fault></Envelope>", 2.5),
+        (503, "<html><body>Service Unavailable</body></html>", 2.5),
+        (500, "<Envelope><Fault>Try again later</Fault></Envelope>", 2.5),
+        (
+            500,
+            "<Envelope>The stated EmploymentIdentifier does not exist</Envelope>",
+            6,
+        ),
+    ],
+)
+@patch("sdlon.sd_common.get_sd_session")
+def test_sd_lookup_adapts_rate(
+    mock_get_sd_session: MagicMock,
+    status_code: int,
+    text: str,
+    expected_rate: float,
+    make_settings: Callable[..., Settings],
+):
+    # Arrange
+    settings = make_settings(
+        sd_rate_limit_enabled=True,
+        sd_rate_limit=50,
+        sd_rate_limit_per_institution={"rate-test": 50},
+        sd_rate_limit_increase=1,
+        sd_http_retries=0,
+    )
+    mock_get_sd_session.return_value.get.return_value = MagicMock(
+        text=text, status_code=status_code
+    )
+    limiter = get_sd_rate_limiter(settings, "rate-test")
+    assert limiter is not None
+    limiter._set_rate(5)
+
+    # Act
+    try:
+        sd_lookup(URL, settings, institution_identifier="rate-test")
+    except Exception:
+        pass
+
+    # Assert
+    assert limiter.rate == expected_rate
+
+
+@patch("sdlon.sd_common.get_sd_session")
+def test_sd_lookup_takes_a_token_per_attempt(
+    mock_get_sd_session: MagicMock, make_settings: Callable[..., Settings]
+):
+    # Arrange
+    settings = make_settings(
+        sd_rate_limit_enabled=True,
+        sd_rate_limit=50,
+        sd_rate_limit_per_institution={"retry-test": 50},
+        sd_http_retries=3,
+        sd_http_retry_backoff_factor=0.5,
+    )
+    mock_get_sd_session.return_value.get.side_effect = [
+        MagicMock(text="<html>Bad Gateway</html>", status_code=502),
+        MagicMock(text="<html>Service Unavailable</html>", status_code=503),
+        MagicMock(text=f"<{URL}><Department/></{URL}>", status_code=200),
+    ]
+    limiter = get_sd_rate_limiter(settings, "retry-test")
+    assert limiter is not None
+
+    # Act
+    with (
+        patch.object(limiter, "acquire") as mock_acquire,
+        patch("sdlon.sd_common.time.sleep") as mock_sleep,
+    ):
+        sd_lookup(URL, settings, institution_identifier="retry-test")
+
+    # Assert
+    assert mock_get_sd_session.return_value.get.call_count == 3
+    assert mock_acquire.call_count == 3
+    # Exponential backoff between the attempts
+    assert mock_sleep.call_args_list == [call(0.5), call(1.0)]
+    # Halved twice by the retried responses, then increased by the success
+    assert limiter.rate == pytest.approx(12.6)
@@ -0,0 +1,269 @@
+import ast
+from datetime import date
+from datetime import datetime
+from unittest.mock import ANY
+from unittest.mock import MagicMock
+from unittest.mock import call
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+import requests
+from click.testing import CliRunner
+
+from db.compression import compress_response
+from db.queries import CompletedRun
+from sdlon.config import Settings
+from sdlon.models import JobFunction
+from sdlon.sd_changed_at import replay
+from sdlon.sd_common import sd_iter_persons
+from sdlon.sd_common import sd_lookup
+from sdlon.sd_replay import RecordedPayload
+from sdlon.sd_replay import ReplayAdapter
+from sdlon.sd_replay import ReplayMissError
+from sdlon.sd_replay import ReplaySD
+from sdlon.sd_replay import _split_period
+from sdlon.sd_replay import request_key
+
+URL = "https://service.sd.dk/sdws/GetPerson20111201"
+PARAMS = {
+    "InstitutionIdentifier": "XY",
+    "EffectiveDate": "01.01.2024",
+    "StatusActiveIndicator": True,
+}
+RESPONSE = (
+    "<GetPerson20111201>"
+    "<Person><PersonCivilRegistrationIdentifier>1</PersonCivilRegistrationIdentifier></Person>"
+    "<Person><PersonCivilRegistrationIdentifier>2</PersonCivilRegistrationIdentifier></Person>"
+    "</GetPerson20111201>"
+)
+
+
+@pytest.fixture()
+def settings() -> Settings:
+    return Settings(
+        municipality_name="name",
+        municipality_code=100,
+        sd_global_from_date=date(2000, 1, 1),
+        sd_institution_identifier="XY",
+        sd_user="user",
+        sd_password="password",
+        sd_job_function=JobFunction.employment_name,
+        sd_monthly_hourly_divide=1,
+        app_dbpassword="secret",
+        sd_replay_from=datetime(2024, 1, 1),
+    )
+
+
+def _replay_sd(responses: dict) -> ReplaySD:
+    replay_sd = ReplaySD.__new__(ReplaySD)
+    replay_sd.payloads = {
+        key: RecordedPayload(uuid4(), datetime(2024, 1, 1), 200) for key in responses
+    }
+    ids = {payload.id: key for key, payload in replay_sd.payloads.items()}
+    replay_sd._load_response = lambda payload: responses[ids[payload.id]]  # type: ignore
+    return replay_sd
+
+
+def _replay_session(replay_sd: ReplaySD) -> requests.Session:
+    session = requests.Session()
+    session.mount("https://", ReplayAdapter(replay_sd))
+    return session
+
+
+def test_request_key_matches_persisted_params_and_query_params():
+    # The persisted params are the str() of the dict sent by sd_lookup
+    query_params = {key: str(value) for key, value in PARAMS.items()}
+    assert request_key(
+        "GetPerson20111201", ast.literal_eval(str(PARAMS))
+    ) == request_key("GetPerson20111201", query_params)
+
+
+def test_split_period():
+    from_date = datetime(2024, 1, 1)
+    to_date = datetime(2024, 1, 3)
+    assert _split_period(from_date, to_date, 2) == [
+        (from_date, datetime(2024, 1, 2)),
+        (datetime(2024, 1, 2), to_date),
+    ]
+
+
+@patch("sdlon.sd_replay.Session")
+def test_replay_sd_preloads_latest_payloads(mock_session: MagicMock):
+    # Arrange
+    old_id, new_id = uuid4(), uuid4()
+    session = mock_session.return_value.__enter__.return_value
+    session.execute.side_effect = [
+        [
+            (old_id, datetime(2024, 1, 1), URL, str(PARAMS), 200),
+            (new_id, datetime(2024, 1, 2), URL, str(PARAMS), 200),
+            (uuid4(), datetime(2024, 1, 2), URL, "not params", 200),
+        ],
+        MagicMock(one=MagicMock(return_value=(None, compress_response("new")))),
+    ]
+
+    # Act
+    replay_sd = ReplaySD(
+        MagicMock(), datetime(2024, 1, 1), datetime(2024, 2, 1), workers=1
+    )
+
+    # Assert
+    assert replay_sd.payloads == {
+        request_key("GetPerson20111201", PARAMS): RecordedPayload(
+            new_id, datetime(2024, 1, 2), 200
+        )
+    }
+    # The response is only loaded when requested
+    assert session.execute.call_count == 1
+    assert replay_sd.respond("GetPerson20111201", PARAMS) == (200, "new")
+    assert session.execute.call_count == 2
+    with pytest.raises(ReplayMissError):
+        replay_sd.respond("GetEmployment20111201", PARAMS)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_replay_adapter(stream: bool):
+    # Arrange
+    replay_sd = _replay_sd({request_key("GetPerson20111201", PARAMS): RESPONSE})
+
+    # Act
+    response = _replay_session(replay_sd).get(URL, params=PARAMS, stream=stream)
+
+    # Assert
+    assert response.status_code == 200
+    assert b"".join(response.iter_content(chunk_size=16)) == RESPONSE.encode()
+
+
+@patch("sdlon.sd_common.log_payload")
+@patch("sdlon.sd_replay.get_replay_session")
+def test_sd_lookup_replays_persisted_payloads(
+    mock_get_replay_session: MagicMock,
+    mock_log_payload: MagicMock,
+    settings: Settings,
+):
+    # Arrange
+    replay_sd = _replay_sd({request_key("GetPerson20111201", PARAMS): RESPONSE})
+    mock_get_replay_session.return_value = _replay_session(replay_sd)
+    params = {k: v for k, v in PARAMS.items() if k != "InstitutionIdentifier"}
+
+    # Act
+    response = sd_lookup("GetPerson20111201", settings, params)
+    persons = list(sd_iter_persons("GetPerson20111201", settings, params))
+
+    # Assert
+    assert len(response["Person"]) == 2
+    assert len(persons) == 2
+    mock_get_replay_session.assert_called_with(settings)
+    mock_log_payload.assert_not_called()
+
+
+@patch("sdlon.sd_changed_at.setup_logging")
+@patch("sdlon.sd_changed_at.get_settings")
+@patch("sdlon.sd_changed_at.get_completed_runs")
+@patch("sdlon.sd_changed_at.ChangeAtSD")
+def test_replay_reruns_completed_runs(
+    mock_change_at_sd: MagicMock,
+    mock_get_completed_runs: MagicMock,
+    mock_get_settings: MagicMock,
+    mock_setup_logging: MagicMock,
+):
+    # Arrange
+    mock_get_settings.return_value.sd_institution_identifier = "XY"
+    runs = [
+        CompletedRun(
+            datetime(2024, 1, 1),
+            datetime(2024, 1, 2),
+            datetime(2024, 1, 2, 0, 1),
+            datetime(2024, 1, 2, 0, 5),
+        ),
+        # Persisted before the runs were timestamped
+        CompletedRun(datetime(2024, 1, 2), datetime(2024, 1, 3), None, None),
+    ]
+    mock_get_completed_runs.return_value = runs
+
+    # Act
+    result = CliRunner().invoke(
+        replay, ["--from-date", "2024-01-01", "--to-date", "2024-01-04"]
+    )
+
+    # Assert
+    assert result.exit_code == 0, result.output
+    mock_get_completed_runs.assert_called_once_with(
+        datetime(2024, 1, 1), datetime(2024, 1, 4)
+    )
+    # Each run is replayed with the payloads persisted while it was running
+    assert mock_get_settings.call_args_list == [
+        call(),
+        call(
+            sd_replay_from=datetime(2024, 1, 2, 0, 1),
+            sd_replay_to=datetime(2024, 1, 2, 0, 5),
+        ),
+        call(sd_replay_from=datetime(2024, 1, 1), sd_replay_to=datetime(2024, 1, 4)),
+    ]
+    assert mock_change_at_sd.call_args_list == [
+        call(
+            mock_get_settings.return_value,
+            "XY",
+            run.from_date,
+            run.to_date,
+            False,
+            run_context=ANY,
+        )
+        for run in runs
+    ]
+    assert mock_change_at_sd.return_value.update_all_employments.call_count == 2
+
+
+@patch("sdlon.sd_changed_at.setup_logging")
+@patch("sdlon.sd_changed_at.get_settings")
+@patch("sdlon.sd_changed_at.get_completed_runs")
+@patch("sdlon.sd_changed_at.ChangeAtSD")
+def test_replay_runs_with_different_windows_do_not_share_run_context(
+    mock_change_at_sd: MagicMock,
+    mock_get_completed_runs: MagicMock,
+    mock_get_settings: MagicMock,
+    mock_setup_logging: MagicMock,
+):
+    # Arrange
+    run_settings = {}
+
+    def get_settings(**kwargs):
+        key = tuple(sorted(kwargs.items()))
+        if key not in run_settings:
+            run_settings[key] = MagicMock(sd_institution_identifier=["XY", "ZZ"])
+        return run_settings[key]
+
+    mock_get_settings.side_effect = get_settings
+    mock_get_completed_runs.return_value = [
+        CompletedRun(
+            datetime(2024, 1, 1),
+            datetime(2024, 1, 2),
+            datetime(2024, 1, 2, 0, 1),
+            datetime(2024, 1, 2, 0, 5),
+        ),
+        CompletedRun(
+            datetime(2024, 1, 2),
+            datetime(2024, 1, 3),
+            datetime(2024, 1, 3, 0, 1),
+            datetime(2024, 1, 3, 0, 5),
+        ),
+    ]
+
+    # Act
+    result = CliRunner().invoke(
+        replay, ["--from-date", "2024-01-01", "--to-date", "2024-01-04"]
+    )
+
+    # Assert
+    assert result.exit_code == 0, result.output
+    calls = mock_change_at_sd.call_args_list
+    assert len(calls) == 4
+    # The institutions of a run share the run context and settings of the run
+    first_run, second_run = calls[:2], calls[2:]
+    for run_calls in (first_run, second_run):
+        assert run_calls[0].kwargs["run_context"] is run_calls[1].kwargs["run_context"]
+        assert run_calls[0].args[0] is run_calls[1].args[0]
+    assert (
+        first_run[0].kwargs["run_context"] is not (second_run[0].kwargs["run_context"])
+    )
+    assert first_run[0].args[0] is not second_run[0].args[0]
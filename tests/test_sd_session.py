@@ -0,0 +1,105 @@
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Callable
+
+from sdlon.config import Settings
+from sdlon.sd_common import read_employment_at
+from sdlon.sd_session import RETRY_STATUS_CODES
+from sdlon.sd_session import get_sd_session
+from sdlon.sd_session import get_sd_timeout
+from sdstandin.responses import error_envelope
+
+
+def test_get_sd_session_is_shared(make_settings: Callable[..., Settings]):
+    # Arrange
+    settings = make_settings()
+
+    # Act
+    session1 = get_sd_session(settings)
+    session2 = get_sd_session(make_settings())
+
+    # Assert
+    assert session1 is session2
+
+
+def test_get_sd_session_configures_adapter(make_settings: Callable[..., Settings]):
+    # Arrange
+    settings = make_settings(
+        sd_http_pool_maxsize=25, sd_http_retries=5, sd_http_retry_backoff_factor=1.0
+    )
+
+    # Act
+    session = get_sd_session(settings)
+
+    # Assert
+    adapter = session.get_adapter("https://service.sd.dk/sdws/")
+    assert adapter._pool_maxsize == 25
+    assert adapter.max_retries.total == 5
+    assert adapter.max_retries.backoff_factor == 1.0
+    assert set(adapter.max_retries.status_forcelist) == set(RETRY_STATUS_CODES)
+    assert "gzip" in session.headers["Accept-Encoding"]
+
+
+def test_get_sd_timeout(make_settings: Callable[..., Settings]):
+    # Arrange
+    settings = make_settings(sd_http_connect_timeout=3, sd_http_read_timeout=30)
+
+    # Act + Assert
+    assert get_sd_timeout(settings) == (3, 30)
+
+
+def test_missing_employment_is_requested_once(make_settings: Callable[..., Settings]):
+    # Arrange
+    requests_received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_received.append(self.path)
+            body = error_envelope(
+                "The stated EmploymentIdentifier (12345) does not exist"
+            ).encode()
+            self.send_response(500)
+            self.send_header("Content-Type", "application/xml")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings = make_settings(
+        sd_base_url=f"http://127.0.0.1:{server.server_port}/sdws/",
+        sd_persist_payloads=False,
+    )
+
+    # Act
+    try:
+        employment = read_employment_at(
+            date(2024, 1, 1), settings, "dummy", employment_id="12345"
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # Assert
+    assert employment is None
+    assert len(requests_received) == 1
+
+
+def test_get_sd_session_does_not_retry_with_rate_limiting(
+    make_settings: Callable[..., Settings],
+):
+    # Arrange
+    settings = make_settings(sd_http_retries=5, sd_rate_limit_enabled=True)
+
+    # Act
+    session = get_sd_session(settings)
+
+    # Assert
+    adapter = session.get_adapter("https://service.sd.dk/sdws/")
+    assert adapter.max_retries.total == 0
@@ -0,0 +1,108 @@
+import threading
+import time
+from typing import Callable
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from sdlon.config import Settings
+from sdlon.sd_threaded import ThreadedSDClient
+
+
+def test_run_is_bounded_by_max_concurrent_requests(
+    make_settings: Callable[..., Settings],
+):
+    # Arrange
+    settings = make_settings(sd_max_concurrent_requests=2)
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def blocking_call(i: int) -> int:
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return i
+
+    sd = ThreadedSDClient(settings)
+
+    # Act
+    futures = [sd.run(blocking_call, i) for i in range(6)]
+    result = [future.result() for future in futures]
+
+    # Assert
+    assert result == list(range(6))
+    assert max_in_flight == 2
+
+
+def test_max_concurrent_requests_is_shared_by_clients_and_threads(
+    make_settings: Callable[..., Settings],
+):
+    # Arrange
+    settings = make_settings(sd_max_concurrent_requests=3)
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def blocking_call() -> None:
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+
+    def run_all() -> None:
+        sd = ThreadedSDClient(settings)
+        for future in [sd.run(blocking_call) for _ in range(4)]:
+            future.result()
+
+    # Act
+    threads = [threading.Thread(target=run_all) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Assert
+    assert max_in_flight == 3
+
+
+@patch("sdlon.sd_threaded.sd_lookup")
+def test_lookup_calls_sd_lookup(
+    mock_sd_lookup: MagicMock, make_settings: Callable[..., Settings]
+):
+    # Arrange
+    settings = make_settings()
+    mock_sd_lookup.return_value = {"foo": "bar"}
+    sd = ThreadedSDClient(settings, "II", dry_run=True)
+
+    # Act
+    result = sd.lookup("GetDepartment20111201", params={"a": "b"}).result()
+
+    # Assert
+    assert result == {"foo": "bar"}
+    mock_sd_lookup.assert_called_once()
+    assert mock_sd_lookup.call_args.args == ("GetDepartment20111201",)
+    assert mock_sd_lookup.call_args.kwargs["params"] == {"a": "b"}
+    assert mock_sd_lookup.call_args.kwargs["institution_identifier"] == "II"
+    assert mock_sd_lookup.call_args.kwargs["dry_run"] is True
+
+
+@patch("sdlon.sd_threaded.sd_lookup")
+def test_lookup_raises_the_error_of_sd_lookup(
+    mock_sd_lookup: MagicMock, make_settings: Callable[..., Settings]
+):
+    # Arrange
+    mock_sd_lookup.side_effect = ValueError("SD error")
+    sd = ThreadedSDClient(make_settings())
+
+    # Act
+    future = sd.lookup("GetDepartment20111201")
+
+    # Assert
+    assert isinstance(future.exception(), ValueError)
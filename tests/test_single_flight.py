@@ -0,0 +1,96 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+
+from sdlon.single_flight import SingleFlight
+from sdlon.single_flight import SingleFlightMoraHelper
+
+
+def _run_concurrently(func, n: int) -> list:
+    """Call func from n threads, while the first call is still in flight."""
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def blocking_call():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return func()
+
+    single_flight = SingleFlight()
+    with ThreadPoolExecutor(max_workers=n) as executor:
+        leader = executor.submit(single_flight.do, "key", blocking_call)
+        started.wait()
+        followers = [
+            executor.submit(single_flight.do, "key", blocking_call)
+            for _ in range(n - 1)
+        ]
+        # Give the followers time to join the call in flight
+        time.sleep(0.1)
+        release.set()
+        futures = [leader] + followers
+
+    assert len(calls) == 1
+    return futures
+
+
+def test_identical_concurrent_calls_are_coalesced():
+    # Arrange
+    result = {"some": "result"}
+
+    # Act
+    futures = _run_concurrently(lambda: result, 5)
+
+    # Assert
+    assert all(future.result() is result for future in futures)
+
+
+def test_exception_is_shared():
+    # Arrange
+    def fail():
+        raise ValueError("SD is down")
+
+    # Act
+    futures = _run_concurrently(fail, 3)
+
+    # Assert
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result()
+
+
+def test_sequential_calls_are_not_coalesced():
+    # Arrange
+    single_flight = SingleFlight()
+    func = MagicMock(side_effect=[1, 2])
+
+    # Act + Assert
+    assert single_flight.do("key", func) == 1
+    assert single_flight.do("key", func) == 2
+
+
+@patch("os2mo_helpers.mora_helpers.MoraHelper._mo_lookup")
+def test_single_flight_mora_helper(mock_mo_lookup: MagicMock):
+    # Arrange
+    mock_mo_lookup.return_value = {"uuid": "ou-uuid"}
+    helper = SingleFlightMoraHelper(hostname="http://mo", use_cache=False)
+
+    # Act
+    ou = helper.read_ou("ou-uuid", at="2024-01-01")
+
+    # Assert
+    assert ou == {"uuid": "ou-uuid"}
+    mock_mo_lookup.assert_called_once_with(
+        "ou-uuid",
+        "ou/{}/",
+        at="2024-01-01",
+        validity=None,
+        only_primary=False,
+        use_cache=None,
+        calculate_primary=False,
+    )